@@ -3,9 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import Sidebar from '../components/Sidebar';
 import { Calendar, ChevronLeft, ChevronRight, Plus, ChefHat } from 'lucide-react';
 import AddMealModal from '../components/AddMealModal';
-
-// API URL
-const API_BASE_URL = 'http://localhost:8000/api/auth';
+import { getMeals } from '../services/api';
 
 const MealsPage = () => {
   const navigate = useNavigate();
@@ -18,10 +16,6 @@ const MealsPage = () => {
 
   // --- Yardımcı Fonksiyonlar ---
   const getAuthToken = () => localStorage.getItem('userToken');
-  const getHeaders = () => ({
-    'Authorization': `Bearer ${getAuthToken()}`,
-    'Content-Type': 'application/json',
-  });
 
   const formatDateForApi = (date) => date.toISOString().split('T')[0];
 
@@ -43,11 +37,8 @@ const MealsPage = () => {
 
     try {
       const dateStr = formatDateForApi(selectedDate);
-      const response = await fetch(`${API_BASE_URL}/meals/?date=${dateStr}`, { headers: getHeaders() });
-      if (response.ok) {
-        const data = await response.json();
-        setMeals(Array.isArray(data.results) ? data.results : (Array.isArray(data) ? data : []));
-      }
+      const data = await getMeals(dateStr);
+      setMeals(Array.isArray(data) ? data : []);
     } catch (error) {
       console.error("Hata:", error);
     } finally {
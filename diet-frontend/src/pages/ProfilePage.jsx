@@ -3,6 +3,7 @@ import { useNavigate, Link } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import Sidebar from '../components/Sidebar'; 
 import AddMealModal from '../components/AddMealModal';
+import { getMeals } from '../services/api';
 
 // --- RESİM IMPORTLARI ---
 import avatarImg from '../assets/avatar.png';
@@ -113,14 +114,11 @@ const ProfilePage = () => {
   const fetchTodayMeals = async () => {
     try {
       const today = new Date().toISOString().split('T')[0];
-      const res = await fetch(`${API_BASE_URL}/meals/?date=${today}`, { headers: getHeaders() });
-      if (res.ok) {
-        const data = await res.json();
-        const meals = data.results || data;
-        setTodayMeals(Array.isArray(meals) ? meals : []);
-        const total = (Array.isArray(meals) ? meals : []).reduce((s, m) => s + (parseFloat(m.calories)||0), 0);
-        setTodayIntake({ total_calories: total });
-      }
+      const data = await getMeals(today);
+      const meals = Array.isArray(data) ? data : [];
+      setTodayMeals(meals);
+      const total = meals.reduce((s, m) => s + (parseFloat(m.calories)||0), 0);
+      setTodayIntake({ total_calories: total });
     } catch(e){}
   };
 
@@ -45,6 +45,19 @@ api.interceptors.response.use(
     }
 );
 
+// Liste endpoint'leri cursor ile sayfalanır ({ next, previous, results }).
+// İlk sayfada kalmamak için `next` bitene kadar tüm sayfaları toplar; sayfasız yanıtı olduğu gibi döndürür.
+export const getAllPages = async (url) => {
+    const items = [];
+    while (url) {
+        const response = await api.get(url);
+        if (!Array.isArray(response.data?.results)) return response.data;
+        items.push(...response.data.results);
+        url = response.data.next;
+    }
+    return items;
+};
+
 // --- API FONKSİYONLARI (Artık çok daha sade) ---
 
 // Kayıt Fonksiyonu
@@ -83,8 +96,7 @@ export const getUserProfile = async () => {
 
 // Diyet planlarını getir
 export const getCustomPlans = async () => {
-    const response = await api.get('/auth/custom-plans/');
-    return response.data;
+    return getAllPages('/auth/custom-plans/');
 };
 
 // Sohbet mesajı gönder
@@ -113,8 +125,7 @@ export const getDashboard = async () => {
 
 // Öğünleri getir
 export const getMeals = async (date) => {
-    const response = await api.get(`/auth/meals/?date=${encodeURIComponent(date)}`);
-    return response.data;
+    return getAllPages(`/auth/meals/?date=${encodeURIComponent(date)}`);
 };
 
 // Öğün ekle
@@ -124,10 +135,10 @@ export const addMeal = async ({ food_id, quantity, meal_time = 'snack', notes =
     return response.data;
 };
 
-// Yiyecek arama
+// Yiyecek arama (öneri listesi: bilerek yalnızca ilk sayfa)
 export const searchFoods = async (search) => {
     const response = await api.get(`/auth/foods/?search=${encodeURIComponent(search)}&ordering=name`);
-    return response.data;
+    return response.data.results ?? response.data;
 };
 
 export default api;
\ No newline at end of file
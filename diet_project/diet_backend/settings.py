@@ -36,6 +36,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Liste endpoint'leri cursor ile sayfalanır (?cursor=..., ?page_size= en fazla API_MAX_PAGE_SIZE)
+    'DEFAULT_PAGINATION_CLASS': 'users.pagination.CreatedAtCursorPagination',
 }
 
 # JWT ayarları
@@ -169,6 +171,24 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Önbellek (dashboard yanıtları vb.) - varsayılan süreç içi bellek.
+# Birden fazla worker/süreç çalışıyorsa geçersiz kılma hepsine ulaşsın diye
+# DJANGO_CACHE_DIR ile dosya tabanlı önbelleğe geçin.
+if os.getenv('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'diet-ai',
+        }
+    }
+
 # CORS ayarları - Frontend ile çalışmak için
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite default port
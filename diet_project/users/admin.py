@@ -1,7 +1,8 @@
 from django.contrib import admin
+from . import intake_totals
 from .models import (
     UserProfile, Food, DailyIntake, Meal, CustomPlan, 
-    CustomPlanFood, AIInteraction, ScannedFood
+    CustomPlanFood, AIInteraction, ScannedFood, IntakeRollup
 )
 
 
@@ -27,6 +28,20 @@ class DailyIntakeAdmin(admin.ModelAdmin):
     list_filter = ('date', 'created_at')
     search_fields = ('user__user__username',)
     readonly_fields = ('total_calories', 'total_protein', 'total_carbs', 'total_fat', 'created_at', 'updated_at')
+    actions = ['recompute_totals']
+
+    @admin.action(description="Toplamları öğünlerden yeniden hesapla")
+    def recompute_totals(self, request, queryset):
+        updated = intake_totals.rebuild(queryset)
+        self.message_user(request, f"{updated} günlük kaydın toplamları yeniden hesaplandı.")
+
+
+@admin.register(IntakeRollup)
+class IntakeRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'period', 'period_start', 'days_logged', 'total_calories', 'total_protein', 'total_carbs', 'total_fat')
+    list_filter = ('period', 'period_start')
+    search_fields = ('user__user__username',)
+    readonly_fields = ('days_logged', 'total_calories', 'total_protein', 'total_carbs', 'total_fat', 'updated_at')
 
 
 @admin.register(Meal)
@@ -34,7 +49,7 @@ class MealAdmin(admin.ModelAdmin):
     list_display = ('daily_intake', 'food', 'quantity', 'calories', 'meal_time', 'created_at')
     list_filter = ('meal_time', 'created_at')
     search_fields = ('food__name', 'daily_intake__user__user__username')
-    readonly_fields = ('calories', 'created_at')
+    readonly_fields = ('calories', 'protein', 'carbs', 'fat', 'created_at')
 
 
 @admin.register(CustomPlan)
@@ -54,15 +69,15 @@ class CustomPlanFoodAdmin(admin.ModelAdmin):
 
 @admin.register(AIInteraction)
 class AIInteractionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'interaction_type', 'created_at')
-    list_filter = ('interaction_type', 'created_at')
+    list_display = ('user', 'interaction_type', 'is_indexed', 'created_at')
+    list_filter = ('interaction_type', 'is_indexed', 'created_at')
     search_fields = ('user__user__username', 'message')
     readonly_fields = ('created_at',)
 
 
 @admin.register(ScannedFood)
 class ScannedFoodAdmin(admin.ModelAdmin):
-    list_display = ('user', 'food_name', 'calories', 'confidence_score', 'is_processed', 'created_at')
+    list_display = ('user', 'food_name', 'calories', 'confidence_score', 'is_processed', 'hit_count', 'created_at')
     list_filter = ('is_processed', 'created_at')
-    search_fields = ('food_name', 'user__user__username')
-    readonly_fields = ('created_at',)
+    search_fields = ('food_name', 'user__user__username', 'content_hash')
+    readonly_fields = ('created_at', 'content_hash', 'perceptual_hash', 'hit_count')
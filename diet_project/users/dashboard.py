@@ -0,0 +1,73 @@
+"""Per-user cache of the dashboard payload (Django cache framework, see ``CACHES``).
+
+Entries live under ``dashboard:<auth user id>:<today>`` and hold the payload plus its ETag,
+so a poll with a matching ``If-None-Match`` is answered from the cache alone. Writes
+that change what the dashboard shows call ``invalidate`` (DailyIntake totals via
+``intake_totals``, DailyIntake and UserProfile saves/deletes via signals); the delete
+runs after the transaction commits so a concurrent request cannot re-cache old data.
+"""
+import hashlib
+import json
+import os
+from datetime import date
+from functools import partial
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import DailyIntake, UserProfile
+
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+
+
+def _key(user_id: int) -> str:
+    return f"dashboard:{user_id}:{date.today().isoformat()}"
+
+
+def build(user_profile: UserProfile) -> Dict[str, object]:
+    today_intake = DailyIntake.objects.filter(user=user_profile, date=date.today()).only('total_calories').first()
+    return {
+        "today_calories": today_intake.total_calories if today_intake else 0,
+        "daily_need": user_profile.daily_calorie_need,
+        "bmi": user_profile.bmi,
+        "goal": user_profile.get_goal_display(),
+    }
+
+
+def etag(payload: Dict[str, object]) -> str:
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def get_or_build(user_id: int) -> Tuple[Dict[str, object], str]:
+    """``(payload, etag)`` from the cache, or built and cached; raises UserProfile.DoesNotExist."""
+    key = _key(user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    payload = build(UserProfile.objects.get(user_id=user_id))
+    entry = (payload, etag(payload))
+    cache.set(key, entry, DASHBOARD_CACHE_TTL)
+    return entry
+
+
+def invalidate(user_ids: Iterable[int]) -> None:
+    """Drop the cached dashboards of these auth users once the current transaction commits."""
+    keys = [_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(partial(cache.delete_many, keys))
+
+
+def invalidate_profiles(profile_ids: Iterable[int]) -> None:
+    invalidate(UserProfile.objects.filter(pk__in=list(profile_ids)).values_list('user_id', flat=True))
+
+
+def invalidate_intake(daily_intake: DailyIntake, previous_date: Optional[date] = None) -> None:
+    """Only today's DailyIntake is shown on the dashboard; other days are ignored."""
+    if date.today() not in (daily_intake.date, previous_date):
+        return
+    if DailyIntake.user.is_cached(daily_intake):
+        invalidate([daily_intake.user.user_id])
+    else:
+        invalidate_profiles([daily_intake.user_id])
@@ -0,0 +1,116 @@
+"""
+OpenRouter uyumlu sahte LLM sunucusu (yerel geliştirme ve testler için).
+
+`/chat/completions` isteğine deterministik bir yanıt döner; "stream": true ile yanıtı
+kelime kelime SSE olarak gönderir. Mesajlarda görsel varsa (analyze_food_image)
+etiket analizi biçiminde JSON döner. Hata ve zaman aşımı davranışını denemek için
+`status` ile her isteğe o HTTP koduyla, `latency` ile gecikmeli yanıt verilebilir;
+`server.calls` gelen istek sayısını tutar. Kullanım:
+
+    python manage.py fake_llm_server --port 8765
+    OPENROUTER_URL=http://127.0.0.1:8765/chat/completions OPENROUTER_API_KEY=x OPENROUTER_MODEL=fake
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_LABEL = {
+    "food_name": "Sahte Ürün",
+    "calories": 250,
+    "protein": 5,
+    "carbs": 30,
+    "fat": 12,
+    "serving_size": "100g",
+}
+
+
+def fake_reply(messages):
+    """Son kullanıcı mesajına göre deterministik yanıt üretir."""
+    last = messages[-1] if messages else {}
+    content = last.get('content', '')
+    if isinstance(content, list):
+        if any(part.get('type') == 'image_url' for part in content):
+            return json.dumps(FAKE_LABEL, ensure_ascii=False)
+        content = " ".join(part.get('text', '') for part in content)
+    return f"Not aldım: {content[:200]} 🍎"
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    delay = 0.0  # Akışta parçalar arası bekleme (saniye)
+    latency = 0.0  # Yanıta başlamadan önce bekleme (saniye)
+    status = 200  # 200 dışındaysa her istek bu kodla hata döner
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # İstemci zaman aşımıyla ya da akışı keserek bağlantıyı kapattı
+
+    def do_POST(self):
+        self.server.calls += 1
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if self.status != 200:
+            self._send_json(self.status, {"error": {"code": self.status, "message": "fake upstream error"}})
+            return
+
+        reply = fake_reply(body.get('messages', []))
+        if body.get('stream'):
+            self._stream(reply)
+        else:
+            self._send_json(200, {
+                "id": "fake",
+                "model": body.get('model'),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            })
+
+    def _send_json(self, code, data):
+        raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _stream(self, reply):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        # OpenRouter gibi önce bir yorum satırı gönder
+        self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        words = reply.split(' ')
+        for i, word in enumerate(words):
+            token = word if i == len(words) - 1 else word + ' '
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            if self.delay:
+                time.sleep(self.delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_fake_llm_server(host='127.0.0.1', port=0, delay=0.0, latency=0.0, status=200):
+    """Sunucuyu oluşturur (başlatmaz); (server, chat_completions_url) döner."""
+    handler = type('ConfiguredFakeLLMHandler', (FakeLLMHandler,), {'delay': delay, 'latency': latency, 'status': status})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.calls = 0
+    return server, f"http://{host}:{server.server_address[1]}/chat/completions"
+
+
+def start_fake_llm_server(host='127.0.0.1', port=0, delay=0.0, latency=0.0, status=200):
+    """Sunucuyu arka plan thread'inde başlatır; (server, chat_completions_url) döner."""
+    server, url = make_fake_llm_server(host, port, delay, latency, status)
+    thread = threading.Thread(target=server.serve_forever, name='fake-llm', daemon=True)
+    thread.start()
+    return server, url
@@ -0,0 +1,75 @@
+"""Shrinks label photos before they are sent to the vision model.
+
+Phone photos are typically 3-12 MB; base64 inflates them by a third and the model
+downsamples them anyway. ``prepare_image`` decodes the upload straight from Django's
+upload file (a temp file for large uploads, so the raw bytes never have to sit in
+memory as one string), applies the EXIF orientation, scales the long side down to
+``VISION_MAX_SIDE`` and re-encodes as JPEG at ``VISION_JPEG_QUALITY``.
+"""
+import io
+import os
+from typing import Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from PIL import Image, ImageOps
+except Exception:  # pragma: no cover
+    Image = None  # Without Pillow uploads are forwarded unchanged
+
+load_dotenv()
+
+# Long side in pixels; label text stays legible well below a phone camera's 4000 px
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1536"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+
+_MIME_BY_FORMAT = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+
+def _read_all(upload) -> bytes:
+    if hasattr(upload, "seek"):
+        upload.seek(0)
+    if hasattr(upload, "chunks"):
+        return b"".join(upload.chunks())
+    return upload.read()
+
+
+def prepare_image(upload, max_side: Optional[int] = None, quality: Optional[int] = None) -> Tuple[bytes, str, Any]:
+    """Returns ``(data, mime_type, image)`` ready for a data URL.
+
+    ``image`` is the downscaled PIL image (reused for the perceptual hash) or None when
+    the upload could not be decoded, in which case the original bytes are returned as-is.
+    """
+    max_side = max_side or VISION_MAX_SIDE
+    quality = quality or VISION_JPEG_QUALITY
+    if Image is None:
+        return _read_all(upload), getattr(upload, "content_type", None) or "image/jpeg", None
+
+    try:
+        upload.seek(0)
+        with Image.open(upload) as source:
+            original_format = source.format
+            rotated = source.getexif().get(0x0112, 1) != 1  # EXIF Orientation
+            # JPEG: decode at a reduced scale (1/2, 1/4, 1/8) directly, much faster than a full decode
+            source.draft("RGB", (max_side, max_side))
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ("RGB", "L"):
+                # Flatten transparency onto white, labels are read on a light background
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                rgba = image.convert("RGBA")
+                background.paste(rgba, mask=rgba.getchannel("A"))
+                image = background
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+    except Exception:
+        data = _read_all(upload)
+        return data, getattr(upload, "content_type", None) or "image/jpeg", None
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+
+    # Already small and compact: keep the original instead of paying a generation loss
+    size = getattr(upload, "size", None)
+    if original_format in _MIME_BY_FORMAT and not rotated and size is not None and size <= len(data):
+        return _read_all(upload), _MIME_BY_FORMAT[original_format], image
+    return data, "image/jpeg", image
@@ -0,0 +1,164 @@
+"""DailyIntake total_calories/protein/carbs/fat maintenance.
+
+Each Meal stores its own calories/protein/carbs/fat, snapshotted from its Food at write
+time, so totals are plain sums over Meal. A meal save or delete applies only that meal's
+contribution as an ``F()`` delta (one UPDATE, no reads of the other meals of the day);
+``add_meals`` does the same for a whole batch of new meals. ``meal_totals``/``recompute``
+sum a day's meals in one aggregate query, ``rebuild`` recomputes many days with a single
+UPDATE of correlated subqueries, and ``drifted`` finds rows whose stored totals disagree
+with their meals (see ``manage.py check_intake_totals``). Every change is forwarded to
+the weekly/monthly rollups (``rollups``) and invalidates today's dashboard (``dashboard``).
+"""
+from datetime import date
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Abs, Coalesce, Greatest
+from django.utils import timezone
+
+from . import dashboard, rollups
+from .models import DailyIntake, Meal
+
+TOTAL_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+
+
+def contribution(meal: Meal) -> Dict[str, float]:
+    """What one meal adds to its day: its own snapshot columns, no Food lookup."""
+    return {field: getattr(meal, field) or 0.0 for field in TOTAL_FIELDS}
+
+
+def apply_delta(daily_intake: DailyIntake, delta: Dict[str, float]) -> None:
+    """Add ``delta`` to the day and to its week/month rollups."""
+    if not any(delta.values()):
+        return
+    # Clamped at 0: float add/subtract round trips may leave -1e-15 behind
+    DailyIntake.objects.filter(pk=daily_intake.pk).update(
+        updated_at=timezone.now(),
+        **{f'total_{f}': Greatest(F(f'total_{f}') + delta[f], Value(0.0)) for f in TOTAL_FIELDS},
+    )
+    rollups.apply_delta(daily_intake.user_id, daily_intake.date, delta)
+    dashboard.invalidate_intake(daily_intake)
+
+
+def _intake(meal: Meal, daily_intake_id: int) -> DailyIntake:
+    if meal.daily_intake_id == daily_intake_id:
+        return meal.daily_intake
+    return DailyIntake.objects.only('user', 'date').get(pk=daily_intake_id)
+
+
+def _negate(values: Dict[str, float]) -> Dict[str, float]:
+    return {f: -v for f, v in values.items()}
+
+
+def meal_saved(meal: Meal, created: bool) -> None:
+    new = contribution(meal)
+    if created:
+        apply_delta(meal.daily_intake, new)
+        return
+
+    persisted = getattr(meal, '_persisted', None)
+    if persisted is None:
+        # Previous state unknown (instance not loaded from the DB): recompute its day
+        recompute(meal.daily_intake)
+        return
+
+    old_intake_id = persisted[0]
+    old = dict(zip(TOTAL_FIELDS, (value or 0.0 for value in persisted[1:])))
+    if old_intake_id == meal.daily_intake_id:
+        apply_delta(meal.daily_intake, {f: new[f] - old[f] for f in TOTAL_FIELDS})
+    else:
+        apply_delta(_intake(meal, old_intake_id), _negate(old))
+        apply_delta(meal.daily_intake, new)
+
+
+def meal_deleted(meal: Meal) -> None:
+    persisted: Optional[tuple] = getattr(meal, '_persisted', None)
+    daily_intake_id = persisted[0] if persisted else meal.daily_intake_id
+    try:
+        daily_intake = _intake(meal, daily_intake_id)
+    except DailyIntake.DoesNotExist:
+        return
+    apply_delta(daily_intake, _negate(contribution(meal)))
+
+
+def add_meals(daily_intake: DailyIntake, meals: List[Meal]) -> List[Meal]:
+    """Insert ``meals`` with one ``bulk_create`` and add their combined contribution in one UPDATE.
+
+    ``bulk_create`` skips ``Meal.save`` and the post_save signal, so nutrition is computed here.
+    """
+    total = dict.fromkeys(TOTAL_FIELDS, 0.0)
+    for meal in meals:
+        meal.daily_intake = daily_intake
+        meal.compute_nutrition()
+        for field, value in contribution(meal).items():
+            total[field] += value
+    with transaction.atomic():
+        created = Meal.objects.bulk_create(meals)
+        apply_delta(daily_intake, total)
+    return created
+
+
+def meal_totals(meals) -> Dict[str, float]:
+    """All four sums of a Meal queryset in a single aggregate query (no join)."""
+    totals = meals.order_by().aggregate(
+        **{field: Coalesce(Sum(field), Value(0.0)) for field in TOTAL_FIELDS}
+    )
+    return {field: float(value) for field, value in totals.items()}
+
+
+def recompute(daily_intake: DailyIntake) -> DailyIntake:
+    """Recompute one day from its meals (one aggregate plus one UPDATE) and set it on the instance."""
+    totals = meal_totals(Meal.objects.filter(daily_intake=daily_intake))
+    daily_intake.updated_at = timezone.now()
+    fields = {f'total_{field}': value for field, value in totals.items()}
+    DailyIntake.objects.filter(pk=daily_intake.pk).update(updated_at=daily_intake.updated_at, **fields)
+    for name, value in fields.items():
+        setattr(daily_intake, name, value)
+    rollups.refresh(daily_intake.user_id, daily_intake.date)
+    dashboard.invalidate_intake(daily_intake)
+    return daily_intake
+
+
+def _meal_sum(expression):
+    meals = (
+        Meal.objects.filter(daily_intake=OuterRef('pk'))
+        .order_by()
+        .values('daily_intake')
+        .annotate(total=Sum(expression, output_field=FloatField()))
+        .values('total')
+    )
+    return Coalesce(Subquery(meals, output_field=FloatField()), Value(0.0))
+
+
+def actual_totals() -> Dict[str, object]:
+    """Annotations (actual_calories, ...) recomputing each DailyIntake's totals from its meals."""
+    return {f'actual_{field}': _meal_sum(F(field)) for field in TOTAL_FIELDS}
+
+
+def rebuild(daily_intakes) -> int:
+    """Recompute totals of the given DailyIntake queryset in one UPDATE; returns rows updated.
+
+    The rollups of the affected users are regenerated afterwards.
+    """
+    actual = actual_totals()
+    with transaction.atomic():
+        updated = daily_intakes.update(
+            updated_at=timezone.now(),
+            **{f'total_{f}': actual[f'actual_{f}'] for f in TOTAL_FIELDS},
+        )
+        rollups.rebuild(daily_intakes.order_by().values('user_id').distinct())
+        dashboard.invalidate_profiles(daily_intakes.filter(date=date.today()).values_list('user_id', flat=True))
+    return updated
+
+
+def drifted(daily_intakes, tolerance: float = 0.01):
+    """DailyIntake rows whose stored totals differ from their meals by more than ``tolerance``."""
+    condition = Q()
+    for field in TOTAL_FIELDS:
+        condition |= Q(**{f'drift_{field}__gt': tolerance})
+    return (
+        daily_intakes.annotate(**actual_totals())
+        .annotate(**{f'drift_{f}': Abs(F(f'total_{f}') - F(f'actual_{f}')) for f in TOTAL_FIELDS})
+        .filter(condition)
+    )
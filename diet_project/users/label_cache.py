@@ -0,0 +1,153 @@
+"""Result cache for analyze_food_image, stored on ScannedFood rows.
+
+A rescan of a label is answered from an earlier processed ScannedFood instead of the
+vision model:
+
+* content hash (SHA-256 of the upload) catches byte-identical rescans with one indexed lookup,
+* perceptual hash (64-bit dHash) catches re-encoded, resized or slightly cropped photos:
+  the closest of the user's ``LABEL_CACHE_SCAN_LIMIT`` most recent hashed rows is a hit
+  when at most ``LABEL_PHASH_MAX_DISTANCE`` bits differ.
+
+Nutrition values on a label are product facts, not personal data, so an exact content
+hash match may come from any user's row; a hit on another user's row is copied into the
+scanning user's history. Perceptual matches stay within the user's own rows, since
+same-layout labels of different products can be a few bits apart. Only the server writes
+``nutrition_data`` and ``is_processed`` (read-only in the API), so a user cannot plant a
+result for others.
+"""
+import hashlib
+import io
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db.models import F
+from dotenv import load_dotenv
+
+from .models import ScannedFood
+
+try:
+    from PIL import Image, ImageOps
+except Exception:  # pragma: no cover
+    Image = None  # Without Pillow only byte-identical rescans hit
+
+load_dotenv()
+
+LABEL_CACHE_ENABLED = os.getenv("LABEL_CACHE_ENABLED", "1") == "1"
+LABEL_PHASH_MAX_DISTANCE = int(os.getenv("LABEL_PHASH_MAX_DISTANCE", "5"))
+LABEL_CACHE_SCAN_LIMIT = int(os.getenv("LABEL_CACHE_SCAN_LIMIT", "5000"))
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def content_hash_file(upload) -> str:
+    """SHA-256 of an uploaded file, fed chunk by chunk."""
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(data: bytes) -> Optional[str]:
+    """64-bit difference hash as 16 hex chars, or None if the bytes are not a readable image."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG: let the decoder downscale while decoding instead of inflating full size
+            image.draft("L", (64, 64))
+            return perceptual_hash_image(ImageOps.exif_transpose(image))
+    except Exception:
+        return None
+
+
+def perceptual_hash_image(image) -> str:
+    """dHash of an already decoded (and oriented) PIL image."""
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:016x}"
+
+
+def hamming(a: str, b: str) -> int:
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def _cached_rows():
+    return ScannedFood.objects.filter(is_processed=True, nutrition_data__isnull=False)
+
+
+def find(digest: str, phash: Optional[str], user_profile=None) -> Optional[ScannedFood]:
+    """Earlier processed scan of the same label, or None.
+
+    Exact content-hash hits may be any user's row (own rows first); perceptual hits only
+    ``user_profile``'s own.
+    """
+    if not LABEL_CACHE_ENABLED:
+        return None
+    own_id = getattr(user_profile, "id", None)
+    exact = _cached_rows().filter(content_hash=digest)
+    row = exact.filter(user_id=own_id).order_by("-created_at").first() or exact.order_by("-created_at").first()
+    if row is not None or phash is None:
+        return row
+
+    if own_id is None:
+        return None
+    candidates = (
+        _cached_rows()
+        .filter(user_id=own_id, perceptual_hash__isnull=False)
+        .order_by("-created_at")
+        .values_list("id", "perceptual_hash")[:LABEL_CACHE_SCAN_LIMIT]
+    )
+    best_id, best_distance = None, LABEL_PHASH_MAX_DISTANCE + 1
+    for row_id, other in candidates:
+        distance = hamming(phash, other)
+        if distance < best_distance:
+            best_id, best_distance = row_id, distance
+            if distance == 0:
+                break
+    if best_id is None:
+        return None
+    return ScannedFood.objects.filter(id=best_id).first()
+
+
+def build_row(user_profile, digest: str, phash: Optional[str], result: Dict[str, Any]) -> ScannedFood:
+    """Unsaved processed ScannedFood for an extraction result (see store, or bulk_create it)."""
+    return ScannedFood(
+        user=user_profile,
+        food_name=result.get("food_name") or "Bilinmeyen Besin",
+        calories=result.get("calories"),
+        is_processed=True,
+        content_hash=digest,
+        perceptual_hash=phash,
+        nutrition_data=result,
+    )
+
+
+def count_hits(row_ids: Iterable[int]) -> None:
+    """Add one hit per occurrence in ``row_ids``, one UPDATE per distinct hit count."""
+    by_count: Dict[int, List[int]] = {}
+    for row_id, hits in Counter(row_ids).items():
+        by_count.setdefault(hits, []).append(row_id)
+    for hits, ids in by_count.items():
+        ScannedFood.objects.filter(id__in=ids).update(hit_count=F("hit_count") + hits)
+
+
+def record_hit(row: ScannedFood, user_profile, digest: str, phash: Optional[str]) -> ScannedFood:
+    """Count the hit on ``row``; returns the scanning user's own row (copied if needed)."""
+    count_hits([row.id])
+    if row.user_id == user_profile.id:
+        return row
+    return store(user_profile, digest, phash, row.nutrition_data)
+
+
+def store(user_profile, digest: str, phash: Optional[str], result: Dict[str, Any]) -> ScannedFood:
+    row = build_row(user_profile, digest, phash, result)
+    row.save()
+    return row
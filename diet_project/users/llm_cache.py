@@ -0,0 +1,221 @@
+"""Response cache for ai_chat replies.
+
+Two tiers, checked in order:
+
+* exact: a hash of the normalized message (case, punctuation, whitespace folded)
+  within its scope,
+* semantic (optional): the nearest cached message in the same scope by embedding
+  cosine similarity, using rag.py's embeddings and a FAISS inner-product index, when
+  it clears ``LLM_CACHE_SIMILARITY``.
+
+Scoping: a reply is keyed on the user and the caller's ``context``. ai_chat passes the
+profile fields of its system prompt, so a standalone question repeated in a later turn
+hits, and adds the ids of the last few turns only for follow-ups (views.is_follow_up), so
+"evet" is never answered from another conversation. A profile change misses. Replies are shared across users only when the caller declares the prompt
+generic (``personalized=False``) and its interaction type is listed in
+``LLM_CACHE_SHARED_TYPES`` (empty by default); ai_chat prompts are always personalized.
+Entries expire after ``LLM_CACHE_TTL`` seconds and the cache is LRU-bounded.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from . import rag
+
+try:
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover
+    faiss = None
+
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_SEMANTIC = os.getenv("LLM_CACHE_SEMANTIC", "0") == "1"
+# High on purpose: "2 yumurta yedim" and "3 yumurta yedim" are close but need different answers
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.97"))
+LLM_CACHE_SHARED_TYPES = {
+    t.strip() for t in os.getenv("LLM_CACHE_SHARED_TYPES", "").split(",") if t.strip()
+}
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(message: str) -> str:
+    text = unicodedata.normalize("NFKC", message).casefold()
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def _scope(user_id: int, interaction_type: str, context: str, personalized: bool) -> str:
+    digest = hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+    if not personalized and interaction_type in LLM_CACHE_SHARED_TYPES:
+        return f"shared:{interaction_type}:{digest}"
+    return f"user:{user_id}:{interaction_type}:{digest}"
+
+
+def _exact_key(scope: str, normalized: str) -> str:
+    return hashlib.sha256(f"{scope}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("reply", "expires_at", "scope", "vector_id")
+
+    def __init__(self, reply: str, expires_at: float, scope: str, vector_id: Optional[int]):
+        self.reply = reply
+        self.expires_at = expires_at
+        self.scope = scope
+        self.vector_id = vector_id
+
+
+class _ResponseCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # scope -> (faiss IndexIDMap, {vector id: exact key})
+        self._semantic: Dict[str, Tuple[Any, Dict[int, str]]] = {}
+        self._next_vector_id = 0
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        if entry.vector_id is None or entry.scope not in self._semantic:
+            return
+        index, ids = self._semantic[entry.scope]
+        index.remove_ids(np.array([entry.vector_id], dtype=np.int64))
+        ids.pop(entry.vector_id, None)
+        if not ids:
+            del self._semantic[entry.scope]
+
+    def _live(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, scope: str, normalized: str, vector: Optional[np.ndarray]) -> Optional[str]:
+        with self._lock:
+            entry = self._live(_exact_key(scope, normalized))
+            if entry is not None:
+                self.counters["exact_hits"] += 1
+                return entry.reply
+
+            if vector is not None and scope in self._semantic:
+                index, ids = self._semantic[scope]
+                scores, found = index.search(vector, 1)
+                if found[0][0] >= 0 and scores[0][0] >= LLM_CACHE_SIMILARITY:
+                    entry = self._live(ids[int(found[0][0])])
+                    if entry is not None:
+                        self.counters["semantic_hits"] += 1
+                        return entry.reply
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, scope: str, normalized: str, reply: str, vector: Optional[np.ndarray]) -> None:
+        key = _exact_key(scope, normalized)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+            vector_id = None
+            if vector is not None:
+                if scope not in self._semantic:
+                    self._semantic[scope] = (faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1])), {})
+                index, ids = self._semantic[scope]
+                vector_id = self._next_vector_id
+                self._next_vector_id += 1
+                index.add_with_ids(vector, np.array([vector_id], dtype=np.int64))
+                ids[vector_id] = key
+
+            self._entries[key] = _Entry(reply, time.monotonic() + self.ttl, scope, vector_id)
+            self.counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        prefix = f"user:{user_id}:"
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.scope.startswith(prefix)]:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._semantic.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            entries = len(self._entries)
+        lookups = counters["exact_hits"] + counters["semantic_hits"] + counters["misses"]
+        hits = counters["exact_hits"] + counters["semantic_hits"]
+        return dict(counters, entries=entries, lookups=lookups, hit_rate=round(hits / lookups, 4) if lookups else 0.0)
+
+
+_response_cache = _ResponseCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+
+
+def _semantic_vector(normalized: str) -> Optional[np.ndarray]:
+    if not LLM_CACHE_SEMANTIC or faiss is None or not normalized:
+        return None
+    try:
+        return rag.embed_texts([normalized]).astype(np.float32)
+    except Exception:
+        # Embeddings unavailable: fall back to the exact tier only
+        return None
+
+
+def lookup(
+    user_id: int, interaction_type: str, message: str, context: str = "", personalized: bool = True
+) -> Optional[str]:
+    """Cached reply for this message, or None.
+
+    ``context`` must identify the rest of the prompt (profile fields, history digest);
+    ``personalized=False`` is only for prompts without any user data.
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+    normalized = normalize_prompt(message)
+    scope = _scope(user_id, interaction_type, context, personalized)
+    return _response_cache.get(scope, normalized, _semantic_vector(normalized))
+
+
+def store(
+    user_id: int, interaction_type: str, message: str, reply: str, context: str = "", personalized: bool = True
+) -> None:
+    if not LLM_CACHE_ENABLED or not reply:
+        return
+    normalized = normalize_prompt(message)
+    scope = _scope(user_id, interaction_type, context, personalized)
+    _response_cache.put(scope, normalized, reply, _semantic_vector(normalized))
+
+
+def invalidate_user(user_id: int) -> None:
+    _response_cache.invalidate_user(user_id)
+
+
+def clear() -> None:
+    _response_cache.clear()
+
+
+def stats() -> Dict[str, Any]:
+    """Hit/miss counters of this process, with ``hit_rate`` = hits / lookups."""
+    return _response_cache.stats()
@@ -0,0 +1,424 @@
+"""Shared client for OpenRouter chat completions.
+
+Every LLM call in the app (ai_chat, its async and streaming variants, analyze_food_image)
+goes through this module, which provides:
+
+* keep-alive connection reuse (a pooled ``requests.Session`` per thread, one
+  ``httpx.AsyncClient`` per event loop),
+* a per-model concurrency limit, so a slow upstream cannot pin every worker thread,
+* retries with jittered exponential backoff for connection errors, 429 and 5xx, within
+  an overall ``LLM_RETRY_BUDGET`` per call (read timeouts are not retried),
+* optional hedging: a second identical request if the first is slower than
+  ``LLM_HEDGE_AFTER_MS`` and a concurrency slot is free, taking whichever answers first,
+* a per-model circuit breaker that fails fast while the upstream keeps failing.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+OPENROUTER_KEY = os.getenv("OPENROUTER_API_KEY")
+# Can point at a local fake server (see manage.py fake_llm_server)
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+LLM_MAX_CONCURRENCY_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BUDGET = float(os.getenv("LLM_RETRY_BUDGET", "30"))  # seconds per call, retries included
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "4"))
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))  # 0 disables hedging
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMGatewayError(Exception):
+    """The upstream call failed; ``body`` holds the upstream error text when there is one."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body or message
+
+
+class CircuitOpenError(LLMGatewayError):
+    pass
+
+
+class ConcurrencyLimitError(LLMGatewayError):
+    pass
+
+
+class _CircuitBreaker:
+    """Closed -> open after ``threshold`` consecutive failures; after ``cooldown`` one trial
+    call is let through (half-open) and its outcome closes or re-opens the circuit."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial: Optional[object] = None  # token of the half-open trial call, if one is running
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[object]:
+        """None if the call must fail fast; otherwise a token (the trial's own when half-open)."""
+        with self._lock:
+            if self.opened_at is None:
+                return self
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial is not None:
+                return None
+            self.trial = object()
+            return self.trial
+
+    def release(self, token: object) -> None:
+        """End a trial that recorded no outcome (no slot, cancelled, ...) so a later call can try."""
+        with self._lock:
+            if self.trial is token:
+                self.trial = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial = None
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, _CircuitBreaker] = {}
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_registry_lock = threading.Lock()
+
+
+def _breaker(model: str) -> _CircuitBreaker:
+    with _registry_lock:
+        if model not in _breakers:
+            _breakers[model] = _CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+        return _breakers[model]
+
+
+def _semaphore(model: str) -> threading.BoundedSemaphore:
+    with _registry_lock:
+        if model not in _semaphores:
+            _semaphores[model] = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY_PER_MODEL)
+        return _semaphores[model]
+
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    """Per-thread keep-alive session, so DNS/TCP/TLS setup is paid once per thread."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=LLM_MAX_CONCURRENCY_PER_MODEL)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return session
+
+
+def _headers(extra_headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    headers = {"Authorization": f"Bearer {OPENROUTER_KEY}", "Content-Type": "application/json"}
+    if extra_headers:
+        headers.update(extra_headers)
+    return headers
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After when given."""
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+class _Retry:
+    """Attempt counter and overall deadline shared by the retries of one call."""
+
+    def __init__(self):
+        self.attempt = 0
+        self.deadline = time.monotonic() + LLM_RETRY_BUDGET
+
+    def delay(self, retry_after: Optional[str] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None when retries or budget are spent."""
+        if self.attempt >= LLM_MAX_RETRIES:
+            return None
+        delay = _backoff(self.attempt, retry_after)
+        if time.monotonic() + delay >= self.deadline:
+            return None
+        self.attempt += 1
+        return delay
+
+    def timeout(self, timeout: float) -> float:
+        return max(0.1, min(timeout, self.deadline - time.monotonic()))
+
+
+def _retryable_error(error: Exception) -> bool:
+    """Only failures to connect are retried; a read timeout already cost the full timeout."""
+    return isinstance(error, (requests.ConnectionError, httpx.ConnectError, httpx.ConnectTimeout))
+
+
+@contextmanager
+def _circuit(model: str) -> Iterator[_CircuitBreaker]:
+    breaker = _breaker(model)
+    token = breaker.allow()
+    if token is None:
+        raise CircuitOpenError("AI servisi şu anda yanıt vermiyor, lütfen biraz sonra tekrar deneyin.", 503)
+    try:
+        yield breaker
+    finally:
+        breaker.release(token)
+
+
+@contextmanager
+def _model_slot(model: str):
+    semaphore = _semaphore(model)
+    if not semaphore.acquire(timeout=LLM_QUEUE_TIMEOUT):
+        raise ConcurrencyLimitError("AI servisi yoğun, lütfen tekrar deneyin.", 503)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _post_once(payload: Dict[str, Any], timeout: float, headers: Dict[str, str]) -> requests.Response:
+    return _session().post(OPENROUTER_URL, headers=headers, json=payload, timeout=timeout)
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY_PER_MODEL * 2, thread_name_prefix="llm-hedge")
+
+
+def _discard(future) -> None:
+    """Drop a losing hedge request: cancel it if not started, else close its response."""
+    if not future.cancel():
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() is not None or f.result().close())
+
+
+def _post_hedged(model: str, payload: Dict[str, Any], timeout: float, headers: Dict[str, str]) -> requests.Response:
+    """Send the request; if it has not answered after the hedge delay, race a duplicate.
+
+    The duplicate needs a free slot of the model's concurrency limit (the caller holds
+    one for the first request); when every slot is taken no duplicate is sent.
+    """
+    first = _hedge_pool.submit(_post_once, payload, timeout, headers)
+    try:
+        return first.result(timeout=LLM_HEDGE_AFTER_MS / 1000.0)
+    except TimeoutError:
+        pass
+    semaphore = _semaphore(model)
+    if not semaphore.acquire(blocking=False):
+        return first.result()
+    second = _hedge_pool.submit(_post_once, payload, timeout, headers)
+    second.add_done_callback(lambda f: semaphore.release())
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    _discard(other)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def chat_completion(
+    payload: Dict[str, Any], timeout: float = 20, extra_headers: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """POST a (non-streaming) chat completion and return the decoded JSON body.
+
+    Raises ``LLMGatewayError`` when the upstream keeps failing or answers with an error.
+    """
+    model = payload.get("model") or ""
+    headers = _headers(extra_headers)
+
+    with _circuit(model) as breaker, _model_slot(model):
+        retry = _Retry()
+        while True:
+            try:
+                if LLM_HEDGE_AFTER_MS > 0:
+                    response = _post_hedged(model, payload, retry.timeout(timeout), headers)
+                else:
+                    response = _post_once(payload, retry.timeout(timeout), headers)
+            except requests.RequestException as e:
+                delay = retry.delay() if _retryable_error(e) else None
+                if delay is None:
+                    breaker.record_failure()
+                    raise LLMGatewayError(str(e)) from e
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 200:
+                breaker.record_success()
+                return response.json()
+            delay = retry.delay(response.headers.get("Retry-After")) if response.status_code in _RETRYABLE_STATUS else None
+            if delay is not None:
+                time.sleep(delay)
+                continue
+            if response.status_code in _RETRYABLE_STATUS:
+                breaker.record_failure()
+            else:
+                # 4xx means a bad request, not an unhealthy upstream
+                breaker.record_success()
+            raise LLMGatewayError(f"AI Hatası: {response.status_code}", response.status_code, response.text)
+
+
+@contextmanager
+def stream_chat_completion(payload: Dict[str, Any], timeout: float = 20):
+    """Open a streaming chat completion; yields the ``requests.Response`` to iterate.
+
+    Only establishing the stream is retried: once bytes are flowing a retry would
+    duplicate tokens the client has already seen.
+    """
+    model = payload.get("model") or ""
+    payload = dict(payload, stream=True)
+
+    with _circuit(model) as breaker, _model_slot(model):
+        retry = _Retry()
+        while True:
+            try:
+                response = _session().post(
+                    OPENROUTER_URL, headers=_headers(), json=payload, stream=True, timeout=retry.timeout(timeout)
+                )
+            except requests.RequestException as e:
+                delay = retry.delay() if _retryable_error(e) else None
+                if delay is None:
+                    breaker.record_failure()
+                    raise LLMGatewayError(str(e)) from e
+                time.sleep(delay)
+                continue
+            delay = retry.delay(response.headers.get("Retry-After")) if response.status_code in _RETRYABLE_STATUS else None
+            if delay is not None:
+                response.close()
+                time.sleep(delay)
+                continue
+            break
+
+        with response:
+            if response.status_code != 200:
+                if response.status_code in _RETRYABLE_STATUS:
+                    breaker.record_failure()
+                raise LLMGatewayError(f"AI Hatası: {response.status_code}", response.status_code, response.text)
+            breaker.record_success()
+            response.encoding = "utf-8"
+            yield response
+
+
+# --- async (ASGI) ---
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _async_client() -> httpx.AsyncClient:
+    """One AsyncClient per event loop: keep-alive connections are shared by its requests."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=LLM_MAX_CONCURRENCY_PER_MODEL))
+        _async_clients[loop] = client
+    return client
+
+
+@asynccontextmanager
+async def _async_model_slot(model: str):
+    semaphores = _async_semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.setdefault(model, asyncio.Semaphore(LLM_MAX_CONCURRENCY_PER_MODEL))
+    try:
+        await asyncio.wait_for(semaphore.acquire(), LLM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ConcurrencyLimitError("AI servisi yoğun, lütfen tekrar deneyin.", 503)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+async def achat_completion(
+    payload: Dict[str, Any], timeout: float = 20, extra_headers: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """Async counterpart of ``chat_completion`` (same retries and circuit breaker, no hedging)."""
+    model = payload.get("model") or ""
+    headers = _headers(extra_headers)
+
+    with _circuit(model) as breaker:
+        async with _async_model_slot(model):
+            return await _apost(breaker, payload, timeout, headers)
+
+
+async def _apost(breaker: _CircuitBreaker, payload: Dict[str, Any], timeout: float, headers: Dict[str, str]):
+    retry = _Retry()
+    while True:
+        try:
+            response = await _async_client().post(OPENROUTER_URL, headers=headers, json=payload, timeout=retry.timeout(timeout))
+        except httpx.HTTPError as e:
+            delay = retry.delay() if _retryable_error(e) else None
+            if delay is None:
+                breaker.record_failure()
+                raise LLMGatewayError(str(e)) from e
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code == 200:
+            breaker.record_success()
+            return response.json()
+        delay = retry.delay(response.headers.get("Retry-After")) if response.status_code in _RETRYABLE_STATUS else None
+        if delay is not None:
+            await asyncio.sleep(delay)
+            continue
+        if response.status_code in _RETRYABLE_STATUS:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise LLMGatewayError(f"AI Hatası: {response.status_code}", response.status_code, response.text)
+
+
+@asynccontextmanager
+async def astream_chat_completion(payload: Dict[str, Any], timeout: float = 20):
+    """Async counterpart of ``stream_chat_completion``; yields the ``httpx.Response``."""
+    model = payload.get("model") or ""
+    payload = dict(payload, stream=True)
+
+    with _circuit(model) as breaker:
+        async with _async_model_slot(model):
+            try:
+                async with _async_client().stream(
+                    "POST", OPENROUTER_URL, headers=_headers(), json=payload, timeout=timeout
+                ) as response:
+                    if response.status_code != 200:
+                        body = (await response.aread()).decode("utf-8", "replace")
+                        if response.status_code in _RETRYABLE_STATUS:
+                            breaker.record_failure()
+                        raise LLMGatewayError(f"AI Hatası: {response.status_code}", response.status_code, body)
+                    breaker.record_success()
+                    yield response
+            except httpx.HTTPError as e:
+                breaker.record_failure()
+                raise LLMGatewayError(str(e)) from e
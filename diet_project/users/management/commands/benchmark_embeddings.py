@@ -0,0 +1,67 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import rag
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure embedding throughput with and without micro-batching. Uses the local "
+        "hashing backend by default, so it runs offline; --latency-ms simulates the "
+        "per-call network round trip of a remote backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default='hashing', help="Embedding backend (hashing, openai)")
+        parser.add_argument('--threads', type=int, default=32, help="Concurrent callers")
+        parser.add_argument('--requests', type=int, default=20, help="Requests per caller")
+        parser.add_argument('--texts', type=int, default=2, help="Texts per request")
+        parser.add_argument('--latency-ms', type=float, default=50.0, help="Simulated per-call backend latency")
+        parser.add_argument('--window-ms', type=float, default=rag.RAG_EMBED_BATCH_WINDOW_MS, help="Batching window")
+        parser.add_argument('--batch-size', type=int, default=rag.RAG_EMBED_BATCH_SIZE, help="Max texts per batch")
+
+    def handle(self, *args, **options):
+        embed = rag._get_embedding_backend(options['backend'])
+        latency = options['latency_ms'] / 1000.0
+
+        def backend(texts):
+            if latency:
+                time.sleep(latency)
+            return embed(texts)
+
+        for label, window in (('unbatched', 0), ('batched', options['window_ms'])):
+            batcher = rag._EmbeddingBatcher(backend, window, options['batch_size'])
+            self._run(label, batcher, options)
+
+    def _run(self, label, batcher, options):
+        latencies = []
+        lock = threading.Lock()
+
+        def caller(worker):
+            for i in range(options['requests']):
+                # Unique texts, so the measurement never depends on the embedding cache
+                texts = [f"benchmark {worker} {i} {j}" for j in range(options['texts'])]
+                started = time.perf_counter()
+                batcher.embed(texts)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+        threads = [threading.Thread(target=caller, args=(w,)) for w in range(options['threads'])]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+
+        total_texts = len(latencies) * options['texts']
+        latencies.sort()
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        self.stdout.write(
+            f"{label:>10}: {total_texts / wall:10.1f} texts/s | backend calls {batcher.calls:5d} | "
+            f"p50 {statistics.median(latencies) * 1000:7.1f} ms | p95 {p95 * 1000:7.1f} ms"
+        )
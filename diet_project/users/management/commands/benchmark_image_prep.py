@@ -0,0 +1,91 @@
+import base64
+import io
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+
+from users import image_prep
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what the vision upload preprocessing saves: payload bytes before/after "
+        "and the time spent preparing. Takes image files or directories; without any, "
+        "synthesizes phone-sized (4032x3024) JPEG photos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Image files or directories")
+        parser.add_argument('--samples', type=int, default=5, help="Synthetic images when no paths are given")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per image")
+        parser.add_argument('--max-side', type=int, default=image_prep.VISION_MAX_SIDE)
+        parser.add_argument('--quality', type=int, default=image_prep.VISION_JPEG_QUALITY)
+        parser.add_argument('--upload-mbps', type=float, default=10.0, help="Uplink used to estimate upload time")
+
+    def handle(self, *args, **options):
+        if image_prep.Image is None:
+            raise CommandError("Pillow is not installed.")
+        samples = self._load(options['paths']) if options['paths'] else self._synthesize(options['samples'])
+        if not samples:
+            raise CommandError("No images found.")
+
+        raw_total = prepared_total = 0
+        timings = []
+        for name, data in samples:
+            runs = []
+            for _ in range(options['repeat']):
+                upload = SimpleUploadedFile(name, data, content_type='image/jpeg')
+                started = time.perf_counter()
+                prepared, mime_type, image = image_prep.prepare_image(upload, options['max_side'], options['quality'])
+                runs.append(time.perf_counter() - started)
+            raw_b64 = len(base64.b64encode(data))
+            prepared_b64 = len(base64.b64encode(prepared))
+            raw_total += raw_b64
+            prepared_total += prepared_b64
+            timings.append(statistics.median(runs))
+            size = f"{image.size[0]}x{image.size[1]}" if image is not None else "-"
+            self.stdout.write(
+                f"{name:>24}: {raw_b64 / 1024:9.1f} KB -> {prepared_b64 / 1024:8.1f} KB base64 "
+                f"({mime_type}, {size}) | prep {statistics.median(runs) * 1000:7.1f} ms"
+            )
+
+        seconds_per_byte = 8 / (options['upload_mbps'] * 1_000_000)
+        self.stdout.write(
+            f"{'total':>24}: {raw_total / 1024:9.1f} KB -> {prepared_total / 1024:8.1f} KB base64 "
+            f"({100 * (1 - prepared_total / raw_total):.1f}% smaller) | "
+            f"median prep {statistics.median(timings) * 1000:.1f} ms | "
+            f"est. upload per image at {options['upload_mbps']:g} Mbit/s: "
+            f"{raw_total / len(samples) * seconds_per_byte * 1000:.0f} ms -> "
+            f"{prepared_total / len(samples) * seconds_per_byte * 1000:.0f} ms"
+        )
+
+    def _load(self, paths):
+        files = []
+        for path in map(Path, paths):
+            if path.is_dir():
+                files.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp')))
+            elif path.is_file():
+                files.append(path)
+        return [(p.name, p.read_bytes()) for p in files]
+
+    def _synthesize(self, count):
+        """Gradient, blocks and sensor-like noise: compresses about like a real photo."""
+        rng = np.random.default_rng(0)
+        height, width = 3024, 4032
+        samples = []
+        for i in range(count):
+            gradient = np.linspace(60, 200, width, dtype=np.float32)[None, :, None]
+            pixels = np.broadcast_to(gradient, (height, width, 3)).copy()
+            for _ in range(12):
+                y, x = rng.integers(0, height - 400), rng.integers(0, width - 600)
+                pixels[y:y + 400, x:x + 600] = rng.integers(0, 255, 3)
+            pixels += rng.normal(0, 10, pixels.shape).astype(np.float32)
+            image = image_prep.Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=92)
+            samples.append((f"synthetic_{i}.jpg", buffer.getvalue()))
+        return samples
@@ -0,0 +1,135 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import Cursor, LimitOffsetPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users.models import AIInteraction, DailyIntake, Food, Meal, ScannedFood
+from users.pagination import CreatedAtCursorPagination
+from users.views import AIInteractionListView, DailyIntakeListView, ScannedFoodListView
+
+# endpoint -> (view, model, cursor field)
+ENDPOINTS = {
+    'ai-interactions': (AIInteractionListView, AIInteraction, 'created_at'),
+    'scanned-foods': (ScannedFoodListView, ScannedFood, 'created_at'),
+    'daily-intakes': (DailyIntakeListView, DailyIntake, 'date'),
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare list endpoint responses without pagination, with the default cursor "
+        "pagination (first page and a page deep in the list) and with LIMIT/OFFSET at the "
+        "same depth: response size, median latency and query count. Uses --user's data, or "
+        "seeds a throwaway user with --rows rows per endpoint inside a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Benchmark this existing username instead of synthetic data")
+        parser.add_argument('--rows', type=int, default=5000, help="Synthetic rows per endpoint")
+        parser.add_argument('--page-size', type=int, default=CreatedAtCursorPagination.page_size)
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per request")
+        parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=list(ENDPOINTS))
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']}.")
+            self._run(user, options)
+            return
+        try:
+            with transaction.atomic():
+                self._run(self._seed(options['rows']), options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, user, options):
+        page_size = options['page_size']
+        self.stdout.write(f"{'endpoint':>16} {'mode':>13} {'rows':>6} {'KB':>9} {'p50 ms':>8} {'queries':>7}")
+        for name in options['endpoints']:
+            view_class, model, field = ENDPOINTS[name]
+            path = f'/api/{name}/'
+            ordering = getattr(view_class, 'cursor_ordering', None) or CreatedAtCursorPagination.ordering
+            positions = list(
+                model.objects.filter(user=user.profile).order_by(*ordering).values_list(field, flat=True)
+            )
+            # The last full page: cursor positioned after row depth-1 vs OFFSET depth
+            depth = max(len(positions) - page_size, 0)
+            paginator = CreatedAtCursorPagination()
+            paginator.base_url = path
+            deep_cursor = (
+                paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(positions[depth - 1])))
+                if depth else path
+            )
+
+            runs = [
+                ('full', view_class.as_view(pagination_class=None), path),
+                ('cursor first', view_class.as_view(), f'{path}?page_size={page_size}'),
+                ('cursor deep', view_class.as_view(), f'{deep_cursor}&page_size={page_size}' if depth else path),
+                ('offset deep', view_class.as_view(pagination_class=LimitOffsetPagination),
+                 f'{path}?limit={page_size}&offset={depth}'),
+            ]
+            for mode, view, url in runs:
+                rows, size, latency, queries = self._measure(view, url, user, options['repeat'])
+                self.stdout.write(
+                    f"{name:>16} {mode:>13} {rows:>6} {size / 1024:9.1f} {latency * 1000:8.1f} {queries:>7}"
+                )
+
+    def _measure(self, view, url, user, repeat):
+        factory = APIRequestFactory()
+        timings = []
+        for _ in range(repeat):
+            request = factory.get(url)
+            force_authenticate(request, user=user)
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = view(request).render()
+                timings.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+        data = response.data
+        rows = len(data['results'] if isinstance(data, dict) else data)
+        return rows, len(response.content), statistics.median(timings), len(queries)
+
+    def _seed(self, rows):
+        """A throwaway user with ``rows`` chats, scans and logged days (meals: 3 per day)."""
+        user = User.objects.create_user(f'benchmark_{int(time.time())}', password=None)
+        profile = user.profile
+        answer = "Dengeli beslenme için her öğünde protein, lif ve sebze bulundurun. " * 8
+        AIInteraction.objects.bulk_create(
+            (AIInteraction(user=profile, message=f"Soru {i}: bugün ne yemeliyim?", response=answer, is_indexed=True)
+             for i in range(rows)),
+            batch_size=1000,
+        )
+        ScannedFood.objects.bulk_create(
+            (ScannedFood(user=profile, food_name=f"Etiket {i}", calories=120 + i % 300, is_processed=True,
+                         nutrition_data={'calories': 120 + i % 300, 'protein': 5, 'carbs': 20, 'fat': 3})
+             for i in range(rows)),
+            batch_size=1000,
+        )
+        today = date.today()
+        intakes = DailyIntake.objects.bulk_create(
+            (DailyIntake(user=profile, date=today - timedelta(days=i), total_calories=1800) for i in range(rows)),
+            batch_size=1000,
+        )
+        food = Food.objects.filter(calories__gt=0).first() or Food.objects.create(
+            name=f"Benchmark yemeği {user.pk}", calories=200, protein=10, carbs=25, fat=6
+        )
+        Meal.objects.bulk_create(
+            (Meal(daily_intake=intake, food=food, quantity=1, meal_time=meal_time, calories=food.calories)
+             for intake in intakes for meal_time in ('breakfast', 'lunch', 'dinner')),
+            batch_size=1000,
+        )
+        return user
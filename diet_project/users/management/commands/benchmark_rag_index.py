@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from users import rag
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare flat, HNSW and IVF RAG indexes on synthetic clustered vectors: build time, "
+        "query latency and recall@k against exact search. Use it to pick RAG_ANN_THRESHOLD "
+        "and the HNSW/IVF search parameters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[5000, 20000, 100000], help="History sizes to test")
+        parser.add_argument('--dim', type=int, default=256, help="Vector dimension")
+        parser.add_argument('--queries', type=int, default=200, help="Queries per size")
+        parser.add_argument('--k', type=int, default=5, help="Neighbours per query")
+        parser.add_argument('--tiers', nargs='+', default=['flat', 'hnsw', 'ivf'], help="Index tiers to compare")
+        parser.add_argument('--ef-search', type=int, default=rag.RAG_HNSW_EF_SEARCH, help="HNSW efSearch")
+        parser.add_argument('--nprobe', type=int, default=rag.RAG_IVF_NPROBE, help="IVF nprobe")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if rag.faiss is None:
+            raise CommandError("faiss-cpu is not installed. Please install faiss-cpu.")
+        rag.RAG_HNSW_EF_SEARCH = options['ef_search']
+        rag.RAG_IVF_NPROBE = options['nprobe']
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+
+        self.stdout.write(f"{'rows':>8} {'tier':>5} {'build s':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(k):>9}")
+        for rows in options['rows']:
+            vectors, queries = self._dataset(rng, rows, options['dim'], options['queries'])
+            exact = rag._build_index(vectors, options['dim'], 'flat')
+            _, truth = exact.search(queries, k)
+
+            for tier in options['tiers']:
+                started = time.perf_counter()
+                index = rag._build_index(vectors, options['dim'], tier)
+                build = time.perf_counter() - started
+
+                latencies = []
+                hits = 0
+                for q, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    _, found = index.search(q[None, :], k)
+                    latencies.append(time.perf_counter() - started)
+                    hits += len(set(found[0].tolist()) & set(expected.tolist()))
+
+                latencies.sort()
+                p50 = latencies[len(latencies) // 2] * 1000
+                p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000
+                recall = hits / (len(queries) * k)
+                self.stdout.write(f"{rows:>8} {tier:>5} {build:>9.2f} {p50:>8.3f} {p95:>8.3f} {recall:>9.3f}")
+
+    @staticmethod
+    def _dataset(rng, rows, dim, n_queries):
+        """Clustered unit vectors (chat history is topical) and queries near random rows."""
+        centers = rng.standard_normal((max(1, rows // 200), dim)).astype(np.float32)
+        assignment = rng.integers(0, len(centers), rows)
+        vectors = centers[assignment] + 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+        vectors = rag._normalize(vectors).astype(np.float32)
+        picks = rng.integers(0, rows, n_queries)
+        queries = vectors[picks] + 0.1 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+        return vectors, rag._normalize(queries).astype(np.float32)
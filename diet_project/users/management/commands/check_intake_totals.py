@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from users import intake_totals, rollups
+from users.models import DailyIntake, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the stored DailyIntake totals with the sum of their meals and report rows that "
+        "drifted. With --fix the drifted rows are rebuilt, with --rebuild every selected row is. "
+        "--rollups regenerates the weekly/monthly rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only this username")
+        parser.add_argument('--tolerance', type=float, default=0.01)
+        parser.add_argument('--show', type=int, default=20, help="Drifted rows to print")
+        parser.add_argument('--fix', action='store_true', help="Rebuild the drifted rows")
+        parser.add_argument('--rebuild', action='store_true', help="Rebuild all selected rows without checking")
+        parser.add_argument('--rollups', action='store_true', help="Regenerate the weekly/monthly rollups")
+
+    def handle(self, *args, **options):
+        intakes = DailyIntake.objects.all()
+        if options['user']:
+            intakes = intakes.filter(user__user__username=options['user'])
+
+        if options['rollups']:
+            users = UserProfile.objects.filter(user__username=options['user']).values('id') if options['user'] else None
+            created = rollups.rebuild(users)
+            self.stdout.write(self.style.SUCCESS(f"Regenerated {created} rollups."))
+            return
+
+        if options['rebuild']:
+            updated = intake_totals.rebuild(intakes)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {updated} daily intakes."))
+            return
+
+        drifted = intake_totals.drifted(intakes, options['tolerance'])
+        rows = list(drifted.select_related('user__user').order_by('-date')[:options['show']])
+        count = drifted.count() if len(rows) == options['show'] else len(rows)
+        for row in rows:
+            self.stdout.write(
+                f"{row.user.user.username} {row.date}: "
+                + ", ".join(
+                    f"{field} {getattr(row, f'total_{field}'):.2f} != {getattr(row, f'actual_{field}'):.2f}"
+                    for field in intake_totals.TOTAL_FIELDS
+                    if getattr(row, f'drift_{field}') > options['tolerance']
+                )
+            )
+        if not count:
+            self.stdout.write(self.style.SUCCESS("All daily intake totals match their meals."))
+            return
+        self.stdout.write(self.style.WARNING(f"{count} daily intakes drifted."))
+        if options['fix']:
+            drifted_ids = list(drifted.values_list('pk', flat=True))
+            updated = intake_totals.rebuild(DailyIntake.objects.filter(pk__in=drifted_ids))
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {updated} daily intakes."))
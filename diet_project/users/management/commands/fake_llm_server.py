@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from users.fake_llm import make_fake_llm_server
+
+
+class Command(BaseCommand):
+    help = "OpenRouter uyumlu sahte LLM sunucusunu başlatır (OPENROUTER_URL ile kullanın)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay-ms', type=float, default=30.0, help="Akışta token'lar arası bekleme")
+        parser.add_argument('--latency-ms', type=float, default=0.0, help="Her yanıttan önce bekleme (zaman aşımı denemesi)")
+        parser.add_argument('--status', type=int, default=200, help="200 dışındaysa her istek bu HTTP koduyla hata döner")
+
+    def handle(self, *args, **options):
+        server, url = make_fake_llm_server(
+            options['host'], options['port'], options['delay_ms'] / 1000.0,
+            options['latency_ms'] / 1000.0, options['status'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Sahte LLM sunucusu çalışıyor: OPENROUTER_URL={url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,65 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import rag
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the per-user RAG files under dbtxt/faiss/ into RAG_SHARD_COUNT shared shards. "
+        "Run before switching RAG_INDEX_MODE to 'sharded'. Users already present in their "
+        "shard are skipped, so the command can be re-run after an interruption."
+    )
+
+    _USER_FILE = re.compile(r"^(\d+)\.(vectors\.f32|index)$")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', action='store_true', help="Keep the per-user files after copying")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be migrated")
+
+    def handle(self, *args, **options):
+        if rag.faiss is None:
+            raise CommandError("faiss-cpu is not installed. Please install faiss-cpu.")
+
+        base = rag._ensure_dirs()
+        user_ids = sorted({int(m.group(1)) for p in base.iterdir() if (m := self._USER_FILE.match(p.name))})
+        migrated_by_shard = {}
+        moved_users = moved_rows = skipped = 0
+
+        for user_id in user_ids:
+            shard = rag._shard_for(user_id)
+            if shard not in migrated_by_shard:
+                migrated_by_shard[shard] = rag.shard_user_ids(shard)
+            if user_id in migrated_by_shard[shard]:
+                self.stdout.write(f"user {user_id}: already in shard {shard}, skipped")
+                skipped += 1
+                continue
+
+            with rag._write_lock(user_id):
+                vectors = rag._open_vector_log(user_id)
+                payloads = rag._open_payload_log(user_id)
+                rows = min(len(vectors), len(payloads))
+                if options['dry_run']:
+                    self.stdout.write(f"user {user_id}: {rows} rows -> shard {shard}")
+                    continue
+
+                if rows:
+                    found = payloads.read(list(range(rows)))
+                    rag.add_rows_to_shard(user_id, vectors.read()[:rows], [found[i] for i in range(rows)])
+                migrated_by_shard[shard].add(user_id)
+
+                if not options['keep']:
+                    for path in (vectors.path, payloads.log_path, payloads.offsets_path, rag._ann_path(user_id)):
+                        path.unlink(missing_ok=True)
+                rag.invalidate_user_cache(user_id)
+
+            moved_users += 1
+            moved_rows += rows
+            self.stdout.write(f"user {user_id}: {rows} rows -> shard {shard}")
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Migrated {moved_users} users ({moved_rows} rows) into {rag.RAG_SHARD_COUNT} shards; "
+                f"{skipped} already migrated."
+            ))
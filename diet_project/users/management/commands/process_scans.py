@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import scan_queue
+from users.models import ScannedFood
+
+
+class Command(BaseCommand):
+    help = (
+        "Process label images waiting in the scan queue (ScannedFood with is_processed=False). "
+        "With --loop it keeps polling, for running as a dedicated worker (SCAN_PROCESSING_MODE=external)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=scan_queue.SCAN_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep running and poll for new uploads")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        queued = ScannedFood.objects.filter(is_processed=False, process_after__isnull=False).count()
+        self.stdout.write(f"{queued} scans queued.")
+        while True:
+            processed = scan_queue.process_due(options['batch_size'])
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} scans."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import rag, rag_indexer
+from users.models import AIInteraction
+
+
+class Command(BaseCommand):
+    help = (
+        "Index AI interactions still waiting in the RAG outbox (is_indexed=False). "
+        "With --rebuild, the RAG files are deleted and every interaction is indexed again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only this UserProfile id")
+        parser.add_argument('--rebuild', action='store_true', help="Drop the RAG index and replay all interactions")
+        parser.add_argument('--batch-size', type=int, default=rag_indexer.RAG_INDEX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        user_id = options['user']
+        interactions = AIInteraction.objects.all()
+        if user_id is not None:
+            interactions = interactions.filter(user_id=user_id)
+
+        if options['rebuild']:
+            if rag.RAG_INDEX_MODE == "sharded":
+                raise CommandError("--rebuild needs RAG_INDEX_MODE=per_user; shards cannot drop a user's rows.")
+            user_ids = list(interactions.order_by().values_list('user_id', flat=True).distinct())
+            for uid in user_ids:
+                rag.delete_user_index(uid)
+            interactions.update(is_indexed=False, index_claimed_at=None)
+            self.stdout.write(f"Cleared the RAG index of {len(user_ids)} users.")
+
+        pending = interactions.filter(is_indexed=False).count()
+        self.stdout.write(f"{pending} interactions pending.")
+        if user_id is not None:
+            indexed = rag_indexer.drain_user(user_id, options['batch_size'])
+        else:
+            indexed = rag_indexer.drain_all(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} interactions."))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:55
+
+from django.db import migrations, models
+
+
+def mark_existing_indexed(apps, schema_editor):
+    # Mevcut konuşmalar ai_chat içinde senkron olarak zaten indekslendi
+    AIInteraction = apps.get_model('users', 'AIInteraction')
+    AIInteraction.objects.update(is_indexed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiinteraction',
+            name='is_indexed',
+            field=models.BooleanField(db_index=True, default=False, help_text='RAG indeksine eklendi mi?'),
+        ),
+        migrations.RunPython(mark_existing_indexed, migrations.RunPython.noop),
+    ]
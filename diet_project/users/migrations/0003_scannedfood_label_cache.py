@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_aiinteraction_is_indexed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scannedfood',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='Görselin SHA-256 özeti', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='scannedfood',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=0, help_text='Önbellekten kaç kez yanıt verildi'),
+        ),
+        migrations.AddField(
+            model_name='scannedfood',
+            name='nutrition_data',
+            field=models.JSONField(blank=True, help_text='Etiketten çıkarılan besin değerleri', null=True),
+        ),
+        migrations.AddField(
+            model_name='scannedfood',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, help_text='Görselin 64 bit dHash değeri (hex)', max_length=16, null=True),
+        ),
+    ]
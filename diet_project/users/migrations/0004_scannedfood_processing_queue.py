@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_scannedfood_label_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scannedfood',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, help_text='İşleme deneme sayısı'),
+        ),
+        migrations.AddField(
+            model_name='scannedfood',
+            name='process_after',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Kuyruktaki görselin işlenebileceği zaman', null=True),
+        ),
+        migrations.AddField(
+            model_name='scannedfood',
+            name='processing_error',
+            field=models.TextField(blank=True, help_text='Son işleme hatası', null=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:30
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def backfill_macros(apps, schema_editor):
+    """
+    Mevcut öğünlerin makrolarını yemeklerinin şu anki değerlerinden doldur, sonra günlük
+    toplamları bu değerlerden yeniden hesapla (her biri tek UPDATE).
+    """
+    Food = apps.get_model('users', 'Food')
+    Meal = apps.get_model('users', 'Meal')
+    DailyIntake = apps.get_model('users', 'DailyIntake')
+
+    def snapshot(field):
+        value = Subquery(Food.objects.filter(pk=OuterRef('food_id')).values(field)[:1])
+        return Round(Coalesce(value, Value(0.0)) * F('quantity'), 2)
+
+    Meal.objects.update(protein=snapshot('protein'), carbs=snapshot('carbs'), fat=snapshot('fat'))
+
+    def total(field):
+        meals = (
+            Meal.objects.filter(daily_intake=OuterRef('pk')).order_by()
+            .values('daily_intake').annotate(total=Sum(field)).values('total')
+        )
+        return Coalesce(Subquery(meals, output_field=FloatField()), Value(0.0))
+
+    DailyIntake.objects.update(
+        total_calories=total('calories'),
+        total_protein=total('protein'),
+        total_carbs=total('carbs'),
+        total_fat=total('fat'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_scannedfood_processing_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='protein',
+            field=models.FloatField(default=0, help_text='Hesaplanan protein (gram)', validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='carbs',
+            field=models.FloatField(default=0, help_text='Hesaplanan karbonhidrat (gram)', validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='fat',
+            field=models.FloatField(default=0, help_text='Hesaplanan yağ (gram)', validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.RunPython(backfill_macros, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+
+def backfill_rollups(apps, schema_editor):
+    """Mevcut günlerden haftalık/aylık özetleri oluştur (dönem başına tek gruplu sorgu)."""
+    DailyIntake = apps.get_model('users', 'DailyIntake')
+    IntakeRollup = apps.get_model('users', 'IntakeRollup')
+    rows = []
+    for period, trunc in (('week', TruncWeek), ('month', TruncMonth)):
+        grouped = (
+            DailyIntake.objects.order_by()
+            .annotate(start=trunc('date'))
+            .values('user_id', 'start')
+            .annotate(
+                days_logged=Count('id'),
+                total_calories=Sum('total_calories'),
+                total_protein=Sum('total_protein'),
+                total_carbs=Sum('total_carbs'),
+                total_fat=Sum('total_fat'),
+            )
+        )
+        for row in grouped:
+            rows.append(IntakeRollup(period=period, period_start=row.pop('start'), **row))
+    IntakeRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_meal_macro_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntakeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Hafta'), ('month', 'Ay')], max_length=10)),
+                ('period_start', models.DateField(help_text='Haftanın pazartesi günü veya ayın ilk günü')),
+                ('days_logged', models.PositiveIntegerField(default=0, help_text='Dönemdeki DailyIntake sayısı')),
+                ('total_calories', models.FloatField(default=0)),
+                ('total_protein', models.FloatField(default=0)),
+                ('total_carbs', models.FloatField(default=0)),
+                ('total_fat', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intake_rollups', to='users.userprofile')),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'unique_together': {('user', 'period', 'period_start')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_intakerollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aiinteraction',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='users_aiint_user_id_94d1e5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scannedfood',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='users_scann_user_id_3af376_idx'),
+        ),
+    ]
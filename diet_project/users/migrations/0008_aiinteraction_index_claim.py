@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_list_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiinteraction',
+            name='index_claimed_at',
+            field=models.DateTimeField(blank=True, help_text='RAG indeksleyicisinin satırı aldığı zaman', null=True),
+        ),
+    ]
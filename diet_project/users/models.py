@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -100,6 +100,18 @@ class DailyIntake(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'date' in field_names:
+            instance._persisted_date = instance.date
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save alıcıları (özet/dashboard) eski tarihi görebilsin diye kayıttan sonra güncellenir
+        self._persisted_date = self.date
+    
     def __str__(self):
         return f"{self.user.user.username} - {self.date} ({self.total_calories} kcal)"
     
@@ -108,6 +120,31 @@ class DailyIntake(models.Model):
         ordering = ['-date']
 
 
+class IntakeRollup(models.Model):
+    """DailyIntake toplamlarının haftalık (ISO hafta) ve aylık özeti; uzun dönem raporları için"""
+    PERIOD_CHOICES = [
+        ('week', 'Hafta'),
+        ('month', 'Ay'),
+    ]
+    
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='intake_rollups')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField(help_text="Haftanın pazartesi günü veya ayın ilk günü")
+    days_logged = models.PositiveIntegerField(default=0, help_text="Dönemdeki DailyIntake sayısı")
+    total_calories = models.FloatField(default=0)
+    total_protein = models.FloatField(default=0)
+    total_carbs = models.FloatField(default=0)
+    total_fat = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.user.username} - {self.period} {self.period_start} ({self.total_calories} kcal)"
+    
+    class Meta:
+        unique_together = ['user', 'period', 'period_start']
+        ordering = ['-period_start']
+
+
 class Meal(models.Model):
     """Kullanıcının yediği öğünler/yiyecekler"""
     MEAL_TIME_CHOICES = [
@@ -121,14 +158,39 @@ class Meal(models.Model):
     food = models.ForeignKey(Food, on_delete=models.CASCADE)
     quantity = models.FloatField(validators=[MinValueValidator(0.1)], help_text="Miktar")
     calories = models.FloatField(validators=[MinValueValidator(0)], help_text="Hesaplanan kalori")
+    # Kayıt anındaki makrolar; Food sonradan değişse de geçmiş toplamlar değişmez
+    protein = models.FloatField(default=0, validators=[MinValueValidator(0)], help_text="Hesaplanan protein (gram)")
+    carbs = models.FloatField(default=0, validators=[MinValueValidator(0)], help_text="Hesaplanan karbonhidrat (gram)")
+    fat = models.FloatField(default=0, validators=[MinValueValidator(0)], help_text="Hesaplanan yağ (gram)")
     meal_time = models.CharField(max_length=20, choices=MEAL_TIME_CHOICES, default='snack')
     notes = models.TextField(blank=True, null=True, help_text="Ek notlar")
     created_at = models.DateTimeField(auto_now_add=True)
     
-    def save(self, *args, **kwargs):
-        """Kaloriyi otomatik hesapla"""
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields():
+            instance._persisted = instance._totals_state()
+        return instance
+    
+    def _totals_state(self):
+        """DailyIntake toplamlarını etkileyen alanların veritabanındaki hali (bkz. intake_totals)"""
+        return (self.daily_intake_id, self.calories, self.protein, self.carbs, self.fat)
+    
+    def compute_nutrition(self):
+        """Kalori ve makroları yemeğin güncel değerleri ve miktardan hesaplar"""
         self.calories = round(self.food.calories * self.quantity, 2)
-        super().save(*args, **kwargs)
+        self.protein = round((self.food.protein or 0) * self.quantity, 2)
+        self.carbs = round((self.food.carbs or 0) * self.quantity, 2)
+        self.fat = round((self.food.fat or 0) * self.quantity, 2)
+    
+    def save(self, *args, **kwargs):
+        """Kalori ve makroları otomatik hesapla"""
+        self.compute_nutrition()
+        # Toplamların güncellenmesi (post_save) öğünle aynı transaction'da
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._persisted = self._totals_state()
     
     def __str__(self):
         return f"{self.daily_intake.user.user.username} - {self.food.name} ({self.quantity}x) - {self.calories} kcal"
@@ -180,6 +242,8 @@ class AIInteraction(models.Model):
         ('motivation', 'Motivasyon'),
         ('question', 'Soru'),
     ], default='general')
+    is_indexed = models.BooleanField(default=False, db_index=True, help_text="RAG indeksine eklendi mi?")
+    index_claimed_at = models.DateTimeField(blank=True, null=True, help_text="RAG indeksleyicisinin satırı aldığı zaman")
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -187,6 +251,8 @@ class AIInteraction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Liste sayfalama (cursor) kullanıcı başına created_at/id aralık taraması yapar
+        indexes = [models.Index(fields=['user', '-created_at', '-id'])]
 
 
 class ScannedFood(models.Model):
@@ -198,13 +264,31 @@ class ScannedFood(models.Model):
     image_path = models.CharField(max_length=500, blank=True, null=True, help_text="Taranan görsel yolu")
     is_processed = models.BooleanField(default=False, help_text="AI tarafından işlendi mi?")
     ai_suggestion = models.TextField(blank=True, null=True, help_text="AI önerisi")
+    # Etiket önbelleği (bkz. label_cache): aynı etiket tekrar taranınca model çağrılmaz
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, help_text="Görselin SHA-256 özeti")
+    perceptual_hash = models.CharField(max_length=16, blank=True, null=True, help_text="Görselin 64 bit dHash değeri (hex)")
+    nutrition_data = models.JSONField(blank=True, null=True, help_text="Etiketten çıkarılan besin değerleri")
+    hit_count = models.PositiveIntegerField(default=0, help_text="Önbellekten kaç kez yanıt verildi")
+    # İşlem kuyruğu (bkz. scan_queue): dolu ve is_processed=False ise bu zamandan sonra işlenir
+    process_after = models.DateTimeField(blank=True, null=True, db_index=True, help_text="Kuyruktaki görselin işlenebileceği zaman")
+    attempts = models.PositiveSmallIntegerField(default=0, help_text="İşleme deneme sayısı")
+    processing_error = models.TextField(blank=True, null=True, help_text="Son işleme hatası")
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.user.user.username} - {self.food_name} ({self.created_at.strftime('%Y-%m-%d')})"
     
+    @property
+    def processing_status(self):
+        """queued, processed, failed veya (kuyruğa hiç girmemiş elle eklenen kayıtlar için) unprocessed"""
+        if self.is_processed:
+            return 'failed' if self.processing_error else 'processed'
+        return 'queued' if self.process_after else 'unprocessed'
+    
     class Meta:
         ordering = ['-created_at']
+        # Liste sayfalama (cursor) kullanıcı başına created_at/id aralık taraması yapar
+        indexes = [models.Index(fields=['user', '-created_at', '-id'])]
 
 
 # Signal'lar - DailyIntake'i otomatik güncellemek için
@@ -213,14 +297,46 @@ from django.dispatch import receiver
 
 @receiver(post_save, sender=Meal)
 @receiver(post_delete, sender=Meal)
-def update_daily_intake(sender, instance, **kwargs):
-    """Meal kaydedildiğinde/silindiğinde DailyIntake'i güncelle"""
-    daily_intake = instance.daily_intake
-    meals = daily_intake.meals.all()
-    
-    daily_intake.total_calories = sum(meal.calories for meal in meals)
-    daily_intake.total_protein = sum(meal.food.protein * meal.quantity for meal in meals if meal.food.protein)
-    daily_intake.total_carbs = sum(meal.food.carbs * meal.quantity for meal in meals if meal.food.carbs)
-    daily_intake.total_fat = sum(meal.food.fat * meal.quantity for meal in meals if meal.food.fat)
-    
-    daily_intake.save()
+def update_daily_intake(sender, instance, signal, created=False, raw=False, **kwargs):
+    """
+    Meal kaydedildiğinde/silindiğinde DailyIntake'i güncelle: günün tüm öğünleri
+    yeniden okunmaz, sadece bu öğünün katkısı F() ile eklenir/çıkarılır.
+    """
+    if raw:
+        return
+    from . import intake_totals
+    if signal is post_delete:
+        intake_totals.meal_deleted(instance)
+    else:
+        intake_totals.meal_saved(instance, created)
+
+
+@receiver(post_save, sender=DailyIntake)
+@receiver(post_delete, sender=DailyIntake)
+def update_intake_rollups(sender, instance, signal, created=False, raw=False, **kwargs):
+    """Gün eklendiğinde, tarihi değiştiğinde veya silindiğinde haftalık/aylık özetleri yeniden hesapla"""
+    if raw:
+        return
+    from . import rollups
+    old_date = getattr(instance, '_persisted_date', None)
+    if created:
+        rollups.add_day(instance)
+    elif signal is post_delete or old_date != instance.date:
+        rollups.refresh(instance.user_id, instance.date)
+        if old_date and old_date != instance.date:
+            rollups.refresh(instance.user_id, old_date)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=DailyIntake)
+@receiver(post_delete, sender=DailyIntake)
+def invalidate_dashboard(sender, instance, raw=False, **kwargs):
+    """Profil veya bugünün kaydı değişince kullanıcının dashboard önbelleğini sil"""
+    if raw:
+        return
+    from . import dashboard
+    if sender is UserProfile:
+        dashboard.invalidate([instance.user_id])
+    else:
+        dashboard.invalidate_intake(instance, getattr(instance, '_persisted_date', None))
@@ -0,0 +1,27 @@
+"""Default pagination for list endpoints: keyset (cursor) pages instead of whole tables.
+
+``CreatedAtCursorPagination`` pages on ``(-created_at, -id)``. The opaque ``cursor``
+query parameter encodes the last position, so the next page is a ``created_at < x``
+range scan instead of an OFFSET, and rows inserted meanwhile neither shift nor repeat
+entries. Views whose natural order is different set ``cursor_ordering``: a tuple, or a
+property when it depends on the request (e.g. ``FoodListView`` ``?ordering=``). The
+first field should be (nearly) unique and not change after insert; ties are resolved
+by DRF's offset within equal values, the later fields only make that order stable.
+"""
+import os
+
+from rest_framework.pagination import CursorPagination
+
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "50"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "200"))
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None) or self.ordering
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
@@ -1,7 +1,16 @@
 import os
+import re
 import json
+import queue
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Callable, Hashable, Iterator
 
 import numpy as np
 
@@ -10,6 +19,11 @@ try:
 except Exception:  # pragma: no cover
     faiss = None  # Allow module import even if faiss is missing at runtime
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no cross-process write lock
+    fcntl = None
+
 from dotenv import load_dotenv
 from django.conf import settings
 
@@ -19,6 +33,36 @@ load_dotenv()
 # Embedding settings
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# "openai" or "hashing" (deterministic local stand-in, no network; for tests and benchmarks)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "256"))
+
+# Micro-batching: concurrent embedding requests arriving within the window share one call
+RAG_EMBED_BATCH_WINDOW_MS = float(os.getenv("RAG_EMBED_BATCH_WINDOW_MS", "5"))
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+RAG_EMBED_BATCH_CONCURRENCY = int(os.getenv("RAG_EMBED_BATCH_CONCURRENCY", "4"))
+
+# Embedding cache settings; set RAG_EMBED_CACHE_DIR to spill evicted vectors to disk
+RAG_EMBED_CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", "4096"))
+RAG_EMBED_CACHE_DIR = os.getenv("RAG_EMBED_CACHE_DIR")
+
+# In-process index cache settings (per worker process, shared by its threads)
+RAG_CACHE_MAX_BYTES = int(os.getenv("RAG_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Index tiers: exact flat search below RAG_ANN_THRESHOLD rows, RAG_ANN_INDEX ("hnsw" or
+# "ivf") above it. ANN indexes are snapshotted to <user_id>.ann.index and only the rows
+# appended since the snapshot are re-added on load.
+RAG_ANN_THRESHOLD = int(os.getenv("RAG_ANN_THRESHOLD", "20000"))
+RAG_ANN_INDEX = os.getenv("RAG_ANN_INDEX", "hnsw")
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+RAG_ANN_SNAPSHOT_MIN_ROWS = int(os.getenv("RAG_ANN_SNAPSHOT_MIN_ROWS", "1000"))
+
+# Storage layout: "per_user" keeps one set of files per UserProfile.id; "sharded" hashes
+# users into RAG_SHARD_COUNT shared indexes (run `manage.py migrate_rag_shards` first).
+RAG_INDEX_MODE = os.getenv("RAG_INDEX_MODE", "per_user")
+RAG_SHARD_COUNT = int(os.getenv("RAG_SHARD_COUNT", "64"))
 
 
 def _ensure_dirs() -> Path:
@@ -27,60 +71,866 @@ def _ensure_dirs() -> Path:
     return base_dir
 
 
-def _index_paths(user_id: int) -> Tuple[Path, Path]:
+def _legacy_paths(user_id: int) -> Tuple[Path, Path]:
+    """Whole-file index and metadata used before the append-only logs; migrated on load."""
     base = _ensure_dirs()
     return base / f"{user_id}.index", base / f"{user_id}.meta.json"
 
 
+def _vector_path(user_id: int) -> Path:
+    return _ensure_dirs() / f"{user_id}.vectors.f32"
+
+
+def _ann_path(user_id: int) -> Path:
+    return _ensure_dirs() / f"{user_id}.ann.index"
+
+
+def _payload_paths(user_id: int) -> Tuple[Path, Path]:
+    base = _ensure_dirs()
+    return base / f"{user_id}.payloads.jsonl", base / f"{user_id}.offsets.u64"
+
+
+def _shard_for(user_id: int) -> int:
+    return user_id % RAG_SHARD_COUNT
+
+
+def _shard_paths(shard: int) -> Tuple[Path, Path, Path, Path]:
+    """Vector, id, payload and offset files of a shard."""
+    base = _ensure_dirs() / "shards"
+    base.mkdir(exist_ok=True)
+    stem = f"shard_{shard:03d}"
+    return (
+        base / f"{stem}.vectors.f32",
+        base / f"{stem}.ids.i64",
+        base / f"{stem}.payloads.jsonl",
+        base / f"{stem}.offsets.u64",
+    )
+
+
+def _lock_path(key: Hashable) -> Path:
+    if isinstance(key, tuple):
+        return _shard_paths(key[1])[0].with_suffix(".lock")
+    return _ensure_dirs() / f"{key}.lock"
+
+
+@contextmanager
+def _write_lock(key: Hashable) -> Iterator[None]:
+    """Serialize writers of a user's (or shard's) logs across threads and worker processes.
+
+    Every worker runs its own indexer thread, so the in-process striped lock alone lets two
+    processes append to the same files at once. The ``flock`` is held around the tail
+    repair and the whole append sequence, so a torn tail really is a crashed write and
+    offsets computed from file sizes are not raced by another process.
+    """
+    with _index_cache.lock(key):
+        if fcntl is None:
+            yield
+            return
+        with _lock_path(key).open("ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def _normalize(vectors: np.ndarray) -> np.ndarray:
     norms = np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
     return vectors / norms
 
 
+class _EmbeddingCache:
+    """Bounded LRU of embedding vectors keyed by a hash of (model, text).
+
+    When ``spill_dir`` is set, evicted vectors are written there as ``.npy`` files and
+    read back on a memory miss, so the cache survives restarts and outgrows RAM.
+    """
+
+    def __init__(self, max_entries: int, spill_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _spill_path(self, key: str) -> Path:
+        return self.spill_dir / key[:2] / f"{key}.npy"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                return vector
+        if self.spill_dir is None:
+            return None
+        try:
+            vector = np.load(self._spill_path(key))
+        except (OSError, ValueError):
+            return None
+        self.put(key, vector)
+        return vector
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        # Own copy: a row of a batched result is a view that would keep the whole batch alive
+        vector = np.array(vector, dtype=np.float32, copy=True)
+        vector.setflags(write=False)
+        evicted: List[Tuple[str, np.ndarray]] = []
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+        for old_key, old_vector in evicted:
+            self._spill(old_key, old_vector)
+
+    def _spill(self, key: str, vector: np.ndarray) -> None:
+        if self.spill_dir is None:
+            return
+        path = self._spill_path(key)
+        if path.exists():
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with tmp_path.open("wb") as f:
+                np.save(f, vector)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass  # The spill is best effort; the vector can always be recomputed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_embedding_cache = _EmbeddingCache(RAG_EMBED_CACHE_SIZE, RAG_EMBED_CACHE_DIR)
+
+
 def _embed_texts(texts: List[str]) -> np.ndarray:
-    """Create embeddings with OpenAI. Returns np.ndarray with shape (n, d)."""
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY is missing; cannot compute embeddings for RAG.")
+    """Embed texts, serving repeats from the embedding cache. Returns np.ndarray with shape (n, d)."""
+    model = _embedding_model_name()
+    keys = [_EmbeddingCache.key(model, text) for text in texts]
+    found: Dict[str, np.ndarray] = {}
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key in found or key in missing:
+            continue
+        vector = _embedding_cache.get(key)
+        if vector is None:
+            missing[key] = text
+        else:
+            found[key] = vector
+
+    if missing:
+        fresh = _embed_uncached(list(missing.values()))
+        for key, vector in zip(missing, fresh):
+            _embedding_cache.put(key, vector)
+            found[key] = vector
+
+    return np.stack([found[key] for key in keys])
+
+
+_openai_client = None
+_openai_client_lock = threading.Lock()
 
-    # Lazy import to avoid hard dependency at import time
-    from openai import OpenAI
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+def _get_openai_client() -> Any:
+    """Module-level OpenAI client, so its HTTP connection pool is reused across requests."""
+    global _openai_client
+    if _openai_client is None:
+        with _openai_client_lock:
+            if _openai_client is None:
+                if not OPENAI_API_KEY:
+                    raise RuntimeError("OPENAI_API_KEY is missing; cannot compute embeddings for RAG.")
+
+                # Lazy import to avoid hard dependency at import time
+                from openai import OpenAI
+
+                _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+
+def _embed_openai(texts: List[str]) -> np.ndarray:
+    """Create embeddings with OpenAI. Returns np.ndarray with shape (n, d)."""
+    response = _get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=texts)
     vectors = np.array([d.embedding for d in response.data], dtype=np.float32)
     return _normalize(vectors)
 
 
-def _load_or_create_index(user_id: int, dim: int) -> Any:
-    if faiss is None:
-        raise RuntimeError("faiss-cpu is not installed. Please install faiss-cpu.")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _embed_hashing(texts: List[str]) -> np.ndarray:
+    """Deterministic feature-hashing embedder (word unigrams and bigrams, signed buckets).
+
+    Stands in for the real model offline: same text gives the same vector in every
+    process, and texts sharing words land close together.
+    """
+    vectors = np.zeros((len(texts), HASHING_EMBEDDING_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features or [text]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % HASHING_EMBEDDING_DIM
+            vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+    return _normalize(vectors)
+
+
+_EMBEDDING_BACKENDS: Dict[str, Callable[[List[str]], np.ndarray]] = {
+    "openai": _embed_openai,
+    "hashing": _embed_hashing,
+}
+
+
+def _embedding_model_name() -> str:
+    """Model identity used in embedding cache keys; differs per backend."""
+    if EMBEDDING_BACKEND == "hashing":
+        return f"hashing-{HASHING_EMBEDDING_DIM}"
+    return EMBEDDING_MODEL
+
+
+def _get_embedding_backend(name: Optional[str] = None) -> Callable[[List[str]], np.ndarray]:
+    name = name or EMBEDDING_BACKEND
+    try:
+        return _EMBEDDING_BACKENDS[name]
+    except KeyError:
+        raise RuntimeError(f"Unknown EMBEDDING_BACKEND {name!r}; expected one of {sorted(_EMBEDDING_BACKENDS)}.")
+
+
+class _EmbeddingBatcher:
+    """Coalesces concurrent embedding requests into batched backend calls.
+
+    Callers ``submit`` their texts and block on the returned future. A daemon thread
+    takes the first pending request, keeps collecting for ``window_ms`` (or until
+    ``max_batch`` texts) and hands the batch to a small pool that embeds it in one call,
+    so many chat requests in flight cost one round trip instead of one each, and the next
+    batch fills while up to ``concurrency`` earlier ones are still in flight. With
+    ``window_ms <= 0`` the backend is called inline.
+    """
+
+    def __init__(
+        self,
+        backend: Callable[[List[str]], np.ndarray],
+        window_ms: float,
+        max_batch: int,
+        concurrency: int = RAG_EMBED_BATCH_CONCURRENCY,
+    ):
+        self.backend = backend
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.concurrency = max(1, concurrency)
+        self.calls = 0
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self.window <= 0:
+            self.calls += 1
+            return self.backend(texts)
+        return self.submit(texts).result()
+
+    def submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((list(texts), future))
+        return future
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix="rag-embedding")
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rag-embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch: List[Tuple[List[str], Future]]) -> None:
+        texts = [text for item_texts, _ in batch for text in item_texts]
+        with self._lock:
+            self.calls += 1
+        try:
+            vectors = self.backend(texts)
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        start = 0
+        for item_texts, future in batch:
+            future.set_result(vectors[start:start + len(item_texts)])
+            start += len(item_texts)
 
-    index_path, _ = _index_paths(user_id)
+
+_embedding_batcher = _EmbeddingBatcher(
+    lambda texts: _get_embedding_backend()(texts), RAG_EMBED_BATCH_WINDOW_MS, RAG_EMBED_BATCH_SIZE
+)
+
+
+def _embed_uncached(texts: List[str]) -> np.ndarray:
+    """Embed texts with the configured backend through the batching queue. Returns (n, d)."""
+    return _embedding_batcher.embed(texts)
+
+
+class _VectorLog:
+    """Append-only float32 vector file that is the durable copy of a user's index.
+
+    ``<user_id>.vectors.f32`` is a small header (magic, dimension) followed by the raw
+    rows, so a chat turn appends only its own vectors instead of rewriting the whole
+    index, and a cold load maps the file and hands it to FAISS in a single ``add``.
+    """
+
+    _HEADER = struct.Struct("<4sI")
+    _MAGIC = b"RAGV"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._dim: Optional[int] = None
+
+    @property
+    def dim(self) -> Optional[int]:
+        if self._dim is None and self.path.exists():
+            with self.path.open("rb") as f:
+                magic, dim = self._HEADER.unpack(f.read(self._HEADER.size))
+            if magic != self._MAGIC:
+                raise RuntimeError(f"{self.path} is not a RAG vector file.")
+            self._dim = dim
+        return self._dim
+
+    @property
+    def row_bytes(self) -> int:
+        return (self.dim or 0) * 4
+
+    def __len__(self) -> int:
+        if not self.dim:
+            return 0
+        return (self.path.stat().st_size - self._HEADER.size) // self.row_bytes
+
+    def append(self, vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        with self.path.open("ab") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                f.write(self._HEADER.pack(self._MAGIC, vectors.shape[1]))
+                self._dim = vectors.shape[1]
+            elif (end - self._HEADER.size) % self.row_bytes:
+                # Drop a row torn by an interrupted write so new rows stay aligned
+                f.truncate(self._HEADER.size + len(self) * self.row_bytes)
+            f.write(vectors.tobytes())
+
+    def read(self, start: int = 0) -> np.ndarray:
+        """Return rows ``start:`` as a float32 array of shape (n, dim)."""
+        rows = len(self)
+        if start >= rows:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        mapped = np.memmap(self.path, dtype="<f4", mode="r", offset=self._HEADER.size, shape=(rows, self.dim))
+        # Copy out so the mapping (and on Windows the file handle) is released right away
+        return np.array(mapped[start:], dtype=np.float32)
+
+    def truncate(self, rows: int) -> None:
+        if self.dim:
+            os.truncate(self.path, self._HEADER.size + rows * self.row_bytes)
+
+
+def _open_vector_log(user_id: int) -> _VectorLog:
+    """Open the user's vector log, converting a legacy ``.index`` file on first use."""
+    log = _VectorLog(_vector_path(user_id))
+    index_path, _ = _legacy_paths(user_id)
     if index_path.exists():
-        return faiss.read_index(str(index_path))
+        if not log.path.exists():
+            legacy = faiss.read_index(str(index_path))
+            if legacy.ntotal:
+                log.append(legacy.reconstruct_n(0, legacy.ntotal))
+        index_path.unlink()
+    return log
+
+
+class _IdLog:
+    """Append-only int64 file holding the FAISS id of each row of a shard."""
+
+    _ITEM = 8
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __len__(self) -> int:
+        try:
+            return self.path.stat().st_size // self._ITEM
+        except FileNotFoundError:
+            return 0
+
+    def append(self, ids: np.ndarray) -> None:
+        self.truncate(len(self))
+        with self.path.open("ab") as f:
+            f.write(np.ascontiguousarray(ids, dtype="<i8").tobytes())
 
+    def read(self, start: int = 0) -> np.ndarray:
+        if start >= len(self):
+            return np.empty(0, dtype=np.int64)
+        return np.fromfile(self.path, dtype="<i8", offset=start * self._ITEM).astype(np.int64)
+
+    def truncate(self, rows: int) -> None:
+        try:
+            if self.path.stat().st_size != rows * self._ITEM:
+                os.truncate(self.path, rows * self._ITEM)
+        except FileNotFoundError:
+            pass
+
+
+def _tier_for(rows: int) -> str:
+    return "flat" if rows < RAG_ANN_THRESHOLD else RAG_ANN_INDEX
+
+
+def _index_tier(index: Any) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def _ivf_nlist(rows: int) -> int:
+    # ~4*sqrt(n) lists, keeping the 39 training points per centroid faiss asks for
+    return max(1, min(int(4 * np.sqrt(rows)), rows // 39))
+
+
+def _configure_search(index: Any) -> None:
+    tier = _index_tier(index)
+    if tier == "hnsw":
+        index.hnsw.efSearch = RAG_HNSW_EF_SEARCH
+    elif tier == "ivf":
+        index.nprobe = RAG_IVF_NPROBE
+
+
+def _build_index(vectors: np.ndarray, dim: int, tier: str) -> Any:
+    """Build an index of the given tier over ``vectors`` (training it first for IVF)."""
     # Use inner product (cosine via normalized vectors)
-    index = faiss.IndexFlatIP(dim)
+    if tier == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, RAG_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    elif tier == "ivf":
+        nlist = _ivf_nlist(len(vectors))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        sample = vectors
+        if len(sample) > 256 * nlist:
+            sample = sample[np.random.default_rng(0).choice(len(sample), 256 * nlist, replace=False)]
+        index.train(sample)
+    elif tier == "flat":
+        index = faiss.IndexFlatIP(dim)
+    else:
+        raise RuntimeError(f"Unknown RAG index tier {tier!r}; expected flat, hnsw or ivf.")
+    _configure_search(index)
+    if len(vectors):
+        index.add(vectors)
     return index
 
 
-def _save_index(user_id: int, index: Any) -> None:
-    index_path, _ = _index_paths(user_id)
-    faiss.write_index(index, str(index_path))
+def _save_snapshot(user_id: int, index: Any) -> None:
+    path = _ann_path(user_id)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    faiss.write_index(index, str(tmp_path))
+    os.replace(tmp_path, path)
+
+
+def _load_or_create_index(user_id: int, vectors: _VectorLog, dim: int) -> Tuple[Any, int]:
+    """Load the user's index for its size tier; returns (index, rows covered by the snapshot)."""
+    rows = len(vectors)
+    dim = vectors.dim or dim
+    tier = _tier_for(rows)
+    ann_path = _ann_path(user_id)
+
+    if tier != "flat" and ann_path.exists():
+        index = faiss.read_index(str(ann_path))
+        if _index_tier(index) == tier and index.d == dim and index.ntotal <= rows:
+            snapshot_rows = index.ntotal
+            _configure_search(index)
+            if snapshot_rows < rows:
+                index.add(vectors.read(snapshot_rows))
+            return index, snapshot_rows
+
+    index = _build_index(vectors.read(), dim, tier)
+    if tier == "flat":
+        return index, 0
+    _save_snapshot(user_id, index)
+    return index, index.ntotal
+
+
+def _maybe_migrate(user_id: int, entry: "_CachedUserIndex") -> None:
+    """Move the user to another tier, retrain IVF, or refresh the snapshot as history grows.
+
+    Snapshots are rewritten only after ~10% growth, so their cost amortizes to a constant
+    per added row. Must be called with the user's lock held.
+    """
+    rows = entry.index.ntotal
+    tier = _tier_for(rows)
+    current = _index_tier(entry.index)
+    needs_retrain = tier == "ivf" and current == "ivf" and _ivf_nlist(rows) >= 2 * entry.index.nlist
+
+    if tier != current or needs_retrain:
+        entry.index = _build_index(entry.vectors.read(), entry.index.d, tier)
+        if tier == "flat":
+            _ann_path(user_id).unlink(missing_ok=True)
+            entry.snapshot_rows = 0
+        else:
+            _save_snapshot(user_id, entry.index)
+            entry.snapshot_rows = rows
+    elif tier != "flat" and rows - entry.snapshot_rows >= max(RAG_ANN_SNAPSHOT_MIN_ROWS, entry.snapshot_rows // 10):
+        _save_snapshot(user_id, entry.index)
+        entry.snapshot_rows = rows
+
+
+class _PayloadLog:
+    """Append-only payload store addressed by FAISS row id.
+
+    Records are appended as JSON lines to ``<user_id>.payloads.jsonl`` and the byte offset
+    of each record goes to ``<user_id>.offsets.u64`` (little-endian uint64, one per row).
+    Appending never rewrites existing bytes, and reading row ``i`` costs one seek in each
+    file, so neither depends on the size of the history.
+    """
+
+    _OFFSET = struct.Struct("<Q")
+
+    def __init__(self, log_path: Path, offsets_path: Path):
+        self.log_path = log_path
+        self.offsets_path = offsets_path
+
+    def __len__(self) -> int:
+        try:
+            return self.offsets_path.stat().st_size // self._OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    def append(self, payloads: List[Dict[str, Any]]) -> None:
+        records = [json.dumps(p, ensure_ascii=False).encode("utf-8") + b"\n" for p in payloads]
+        self.truncate(len(self))
+        with self.log_path.open("ab") as log:
+            offset = log.seek(0, os.SEEK_END)
+            offsets = []
+            for record in records:
+                offsets.append(offset)
+                offset += len(record)
+            log.write(b"".join(records))
+        # Offsets are written last: a crash in between leaves unreferenced bytes, never a
+        # row pointing at a missing record.
+        with self.offsets_path.open("ab") as f:
+            f.write(np.asarray(offsets, dtype="<u8").tobytes())
+
+    def read(self, rows: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Return ``{row: payload}`` for the requested rows that exist."""
+        found: Dict[int, Dict[str, Any]] = {}
+        if not rows or not self.offsets_path.exists():
+            return found
+        with self.offsets_path.open("rb") as offsets, self.log_path.open("rb") as log:
+            for row in sorted(set(rows)):
+                if row < 0:
+                    continue
+                offsets.seek(row * self._OFFSET.size)
+                raw = offsets.read(self._OFFSET.size)
+                if len(raw) < self._OFFSET.size:
+                    break
+                log.seek(self._OFFSET.unpack(raw)[0])
+                found[row] = json.loads(log.readline())
+        return found
 
+    def truncate(self, rows: int) -> None:
+        """Forget rows past ``rows`` (their record bytes are left unreferenced)."""
+        size = rows * self._OFFSET.size
+        try:
+            if self.offsets_path.stat().st_size != size:
+                os.truncate(self.offsets_path, size)
+        except FileNotFoundError:
+            pass
 
-def _load_meta(user_id: int) -> Dict[str, Any]:
-    _, meta_path = _index_paths(user_id)
+
+def _open_payload_log(user_id: int) -> _PayloadLog:
+    """Open the user's payload log, converting a legacy ``meta.json`` on first use."""
+    log = _PayloadLog(*_payload_paths(user_id))
+    _, meta_path = _legacy_paths(user_id)
     if meta_path.exists():
-        with meta_path.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"ids": [], "payloads": []}
+        if len(log) == 0:
+            with meta_path.open("r", encoding="utf-8") as f:
+                payloads = json.load(f).get("payloads", [])
+            if payloads:
+                log.append(payloads)
+        meta_path.unlink()
+    return log
+
+
+def _stat_signature(*paths: Path) -> Tuple[Any, ...]:
+    signature: List[Any] = []
+    for path in paths:
+        try:
+            st = path.stat()
+            signature.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _disk_signature(user_id: int) -> Tuple[Any, ...]:
+    """(mtime_ns, size) of the vector and offset files; changes on every write."""
+    _, offsets_path = _payload_paths(user_id)
+    return _stat_signature(_vector_path(user_id), offsets_path)
+
+
+class _CachedUserIndex:
+    """A user's FAISS index loaded in memory, plus handles on its on-disk logs."""
+
+    __slots__ = ("index", "vectors", "payloads", "signature", "snapshot_rows", "ids", "nbytes")
+
+    def __init__(
+        self,
+        index: Any,
+        vectors: _VectorLog,
+        payloads: _PayloadLog,
+        signature: Tuple[Any, ...],
+        snapshot_rows: int = 0,
+        ids: Optional[_IdLog] = None,
+    ):
+        self.index = index
+        self.vectors = vectors
+        self.payloads = payloads
+        self.signature = signature
+        self.snapshot_rows = snapshot_rows
+        self.ids = ids
+        self.nbytes = 0
+        self.refresh_size()
+
+    def refresh_size(self) -> None:
+        # Payloads stay on disk; only the vectors (and the HNSW graph) count against the budget.
+        rows = int(self.index.ntotal)
+        self.nbytes = rows * int(self.index.d) * 4
+        if _index_tier(self.index) == "hnsw":
+            self.nbytes += rows * RAG_HNSW_M * 2 * 4
+
+
+class _IndexCache:
+    """Process-level LRU cache of loaded indexes, bounded by an approximate memory budget.
+
+    Keys are user ids (per-user mode) or ``("shard", n)`` tuples (sharded mode). Readers
+    and writers of the same key serialize on a striped lock, so a search never sees an
+    index half way through ``add``. Entries are checked against the files' stat signature
+    on every access, so a write made by another worker process is picked up.
+    """
+
+    _LOCK_STRIPES = 64
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _CachedUserIndex]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._user_locks = [threading.RLock() for _ in range(self._LOCK_STRIPES)]
+
+    def lock(self, key: Hashable) -> threading.RLock:
+        return self._user_locks[hash(key) % self._LOCK_STRIPES]
 
+    def get(self, key: Hashable) -> Optional[_CachedUserIndex]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
 
-def _save_meta(user_id: int, meta: Dict[str, Any]) -> None:
-    _, meta_path = _index_paths(user_id)
-    with meta_path.open("w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    def put(self, key: Hashable, entry: _CachedUserIndex) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.nbytes
+            if entry.nbytes > self.max_bytes:
+                # Too large to keep around; the caller still uses it for this request.
+                return
+            self._entries[key] = entry
+            self._total_bytes += entry.nbytes
+            while self._total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= entry.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+
+_index_cache = _IndexCache(RAG_CACHE_MAX_BYTES)
+
+
+def _get_user_index(user_id: int, dim: int) -> _CachedUserIndex:
+    """Return the cached index for the user, (re)loading it from disk when stale.
+
+    Must be called with ``_index_cache.lock(user_id)`` held.
+    """
+    signature = _disk_signature(user_id)
+    entry = _index_cache.get(user_id)
+    if entry is not None:
+        if entry.signature == signature:
+            return entry
+        if len(entry.vectors) >= entry.index.ntotal:
+            # Another process appended rows: catch up from the tail instead of reloading
+            tail = entry.vectors.read(entry.index.ntotal)
+            if len(tail):
+                entry.index.add(tail)
+            entry.signature = signature
+            entry.refresh_size()
+            _index_cache.put(user_id, entry)
+            return entry
+
+    if faiss is None:
+        raise RuntimeError("faiss-cpu is not installed. Please install faiss-cpu.")
+
+    vectors = _open_vector_log(user_id)
+    payloads = _open_payload_log(user_id)
+    signature = _disk_signature(user_id)
+    index, snapshot_rows = _load_or_create_index(user_id, vectors, dim)
+    entry = _CachedUserIndex(index, vectors, payloads, signature, snapshot_rows)
+    _index_cache.put(user_id, entry)
+    return entry
+
+
+def _get_shard_index(shard: int, dim: int) -> _CachedUserIndex:
+    """Return the cached ``IndexIDMap`` of a shard, loading or catching it up from disk.
+
+    Shards stay exact (flat): an ANN index filtered down to a single user's ids would
+    lose most of its recall. Must be called with ``_index_cache.lock(("shard", shard))`` held.
+    """
+    key = ("shard", shard)
+    vector_path, id_path, log_path, offsets_path = _shard_paths(shard)
+    signature = _stat_signature(vector_path, offsets_path)
+    entry = _index_cache.get(key)
+    if entry is not None:
+        if entry.signature == signature:
+            return entry
+        start = entry.index.ntotal
+        if len(entry.vectors) >= start and len(entry.ids) >= start:
+            tail = entry.vectors.read(start)
+            if len(tail):
+                entry.index.add_with_ids(tail, entry.ids.read(start)[:len(tail)])
+            entry.signature = signature
+            entry.refresh_size()
+            _index_cache.put(key, entry)
+            return entry
+
+    if faiss is None:
+        raise RuntimeError("faiss-cpu is not installed. Please install faiss-cpu.")
+
+    vectors = _VectorLog(vector_path)
+    ids = _IdLog(id_path)
+    payloads = _PayloadLog(log_path, offsets_path)
+    # Use inner product (cosine via normalized vectors)
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(vectors.dim or dim))
+    rows = min(len(vectors), len(ids))
+    if rows:
+        index.add_with_ids(vectors.read()[:rows], ids.read()[:rows])
+    entry = _CachedUserIndex(index, vectors, payloads, signature, ids=ids)
+    _index_cache.put(key, entry)
+    return entry
+
+
+# FAISS ids in a shard are (user_id << 32) | shard row: one range covers a user's rows,
+# and the low bits point straight at the row in the shard's logs.
+_SHARD_ROW_BITS = 32
+_SHARD_ROW_MASK = (1 << _SHARD_ROW_BITS) - 1
+
+
+def _add_to_shard(user_id: int, vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+    shard = _shard_for(user_id)
+    key = ("shard", shard)
+    with _write_lock(key):
+        entry = _get_shard_index(shard, vectors.shape[1])
+        lengths = {len(entry.vectors), len(entry.ids), len(entry.payloads)}
+        if len(lengths) > 1:
+            # A previous write died between the appends; drop the unmatched tail
+            rows = min(lengths)
+            entry.vectors.truncate(rows)
+            entry.ids.truncate(rows)
+            entry.payloads.truncate(rows)
+            _index_cache.invalidate(key)
+            entry = _get_shard_index(shard, vectors.shape[1])
+        elif entry.index.ntotal != len(entry.vectors):
+            # The cached index missed a write it could not catch up with; reload it
+            _index_cache.invalidate(key)
+            entry = _get_shard_index(shard, vectors.shape[1])
+
+        start = len(entry.vectors)
+        ids = (np.int64(user_id) << _SHARD_ROW_BITS) | np.arange(start, start + len(vectors), dtype=np.int64)
+        try:
+            entry.vectors.append(vectors)
+            entry.ids.append(ids)
+            entry.payloads.append(payloads)
+            entry.index.add_with_ids(vectors, ids)
+        except Exception:
+            _index_cache.invalidate(key)
+            raise
+
+        entry.signature = _stat_signature(entry.vectors.path, entry.payloads.offsets_path)
+        entry.refresh_size()
+        _index_cache.put(key, entry)
+
+
+def _search_shard(user_id: int, query_vec: np.ndarray, k: int) -> Tuple[List[int], List[float], _PayloadLog]:
+    """Search only the user's rows of their shard; returns (shard rows, scores, payload log)."""
+    shard = _shard_for(user_id)
+    with _index_cache.lock(("shard", shard)):
+        entry = _get_shard_index(shard, query_vec.shape[1])
+        if entry.index.ntotal == 0:
+            return [], [], entry.payloads
+        low = user_id << _SHARD_ROW_BITS
+        selector = faiss.IDSelectorRange(low, low + (1 << _SHARD_ROW_BITS))
+        distances, ids = entry.index.search(query_vec, k, params=faiss.SearchParameters(sel=selector))
+
+    rows: List[int] = []
+    scores: List[float] = []
+    for i, score in zip(ids[0].tolist(), distances[0].tolist()):
+        if i >= 0:  # -1 pads results when the user has fewer than k rows
+            rows.append(i & _SHARD_ROW_MASK)
+            scores.append(score)
+    return rows, scores, entry.payloads
+
+
+def add_rows_to_shard(user_id: int, vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+    """Append already-embedded rows for a user to their shard (used by the shard migration)."""
+    if len(vectors):
+        _add_to_shard(user_id, np.asarray(vectors, dtype=np.float32), payloads)
+
+
+def shard_user_ids(shard: int) -> set:
+    """Ids of the users that already have rows in the shard."""
+    _, id_path, _, _ = _shard_paths(shard)
+    return set(np.unique(_IdLog(id_path).read() >> _SHARD_ROW_BITS).tolist())
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    """Drop the user's index from this process' cache (e.g. after deleting their files)."""
+    _index_cache.invalidate(user_id)
 
 
 def add_texts(user_id: int, texts: List[str], payloads: List[Dict[str, Any]]) -> None:
@@ -93,20 +943,43 @@ def add_texts(user_id: int, texts: List[str], payloads: List[Dict[str, Any]]) ->
 
     vectors = _embed_texts(texts)
     dim = vectors.shape[1]
-    index = _load_or_create_index(user_id, dim)
 
-    # Add to index
-    index.add(vectors)
-    _save_index(user_id, index)
+    if RAG_INDEX_MODE == "sharded":
+        _add_to_shard(user_id, vectors, payloads)
+        return
+
+    with _write_lock(user_id):
+        entry = _get_user_index(user_id, dim)
+        if len(entry.vectors) != len(entry.payloads):
+            # A previous write died between the two appends; drop the unmatched tail
+            rows = min(len(entry.vectors), len(entry.payloads))
+            entry.vectors.truncate(rows)
+            entry.payloads.truncate(rows)
+            _index_cache.invalidate(user_id)
+            entry = _get_user_index(user_id, dim)
+        elif entry.index.ntotal != len(entry.vectors):
+            # The cached index missed a write it could not catch up with; reload it
+            _index_cache.invalidate(user_id)
+            entry = _get_user_index(user_id, dim)
+        try:
+            # Only the new rows are written; both logs stay row-aligned with the index
+            entry.vectors.append(vectors)
+            entry.payloads.append(payloads)
+            entry.index.add(vectors)
+            _maybe_migrate(user_id, entry)
+        except Exception:
+            # The in-memory copy may now disagree with disk; reload on next access.
+            _index_cache.invalidate(user_id)
+            raise
 
-    # Update metadata
-    meta = _load_meta(user_id)
-    # Track added ids as a simple incremental range
-    start_id = len(meta.get("ids", []))
-    new_ids = list(range(start_id, start_id + len(texts)))
-    meta.setdefault("ids", []).extend(new_ids)
-    meta.setdefault("payloads", []).extend(payloads)
-    _save_meta(user_id, meta)
+        entry.signature = _disk_signature(user_id)
+        entry.refresh_size()
+        _index_cache.put(user_id, entry)
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Normalized embeddings for ``texts`` (shape (n, d)), via the shared cache and batcher."""
+    return _embed_texts(texts)
 
 
 def search(user_id: int, query: str, k: int = 5) -> List[Dict[str, Any]]:
@@ -115,21 +988,29 @@ def search(user_id: int, query: str, k: int = 5) -> List[Dict[str, Any]]:
 
     query_vec = _embed_texts([query])
     dim = query_vec.shape[1]
-    index = _load_or_create_index(user_id, dim)
 
-    if index.ntotal == 0:
-        return []
+    if RAG_INDEX_MODE == "sharded":
+        idxs, dists, payload_log = _search_shard(user_id, query_vec, k)
+    else:
+        with _index_cache.lock(user_id):
+            entry = _get_user_index(user_id, dim)
+            index = entry.index
 
-    distances, indices = index.search(query_vec, min(k, index.ntotal))
-    idxs = indices[0].tolist()
-    dists = distances[0].tolist()
+            if index.ntotal == 0:
+                return []
 
-    meta = _load_meta(user_id)
+            distances, indices = index.search(query_vec, min(k, index.ntotal))
+            payload_log = entry.payloads
+
+        idxs = indices[0].tolist()
+        dists = distances[0].tolist()
+
+    # Only the k returned rows are read from disk
+    payloads = payload_log.read(idxs)
     results: List[Dict[str, Any]] = []
     for rank, (i, score) in enumerate(zip(idxs, dists)):
-        if i < len(meta.get("payloads", [])):
-            payload = meta["payloads"][i]
-            results.append({"score": float(score), "payload": payload, "rank": rank})
+        if i in payloads:
+            results.append({"score": float(score), "payload": payloads[i], "rank": rank})
     return results
 
 
@@ -150,12 +1031,28 @@ def build_context_from_history(items: List[Dict[str, Any]], limit_chars: int = 1
 
 
 def add_interaction(user_id: int, user_message: str, ai_reply: str, message_id: int | None = None) -> None:
-    texts = [user_message, ai_reply]
-    payloads = [
-        {"type": "user", "text": user_message, "message_id": message_id},
-        {"type": "assistant", "text": ai_reply, "message_id": message_id},
-    ]
-    add_texts(user_id, texts, payloads)
+    add_interactions(user_id, [(user_message, ai_reply, message_id)])
 
 
+def add_interactions(user_id: int, interactions: List[Tuple[str, str, Optional[int]]]) -> None:
+    """Index several (user_message, ai_reply, message_id) turns with one embedding call and one append."""
+    texts: List[str] = []
+    payloads: List[Dict[str, Any]] = []
+    for user_message, ai_reply, message_id in interactions:
+        texts.extend([user_message, ai_reply])
+        payloads.extend([
+            {"type": "user", "text": user_message, "message_id": message_id},
+            {"type": "assistant", "text": ai_reply, "message_id": message_id},
+        ])
+    add_texts(user_id, texts, payloads)
+
 
+def delete_user_index(user_id: int) -> None:
+    """Remove the user's per-user RAG files (e.g. before re-indexing from the database)."""
+    if RAG_INDEX_MODE == "sharded":
+        raise RuntimeError("Rows cannot be removed from a shard; delete_user_index needs per_user mode.")
+    with _write_lock(user_id):
+        paths = (_vector_path(user_id), *_payload_paths(user_id), _ann_path(user_id), *_legacy_paths(user_id))
+        for path in paths:
+            path.unlink(missing_ok=True)
+        _index_cache.invalidate(user_id)
@@ -0,0 +1,120 @@
+"""Background RAG indexing for AI chat turns.
+
+``AIInteraction.is_indexed`` is the outbox: ai_chat saves the row and calls ``enqueue``,
+which returns immediately. A daemon thread per worker process then drains the user's
+unindexed rows in batches (one embedding call and one index append per batch) and flags
+them. Rows left behind by a crash or a failed embedding call are picked up by the next
+chat of that user or by ``manage.py rag_index_outbox``.
+
+A batch is claimed (``index_claimed_at``) in a short transaction; the embedding call and
+the index append run outside it, so no row lock is held across network or file I/O. A
+failed append releases the claim; a claim whose worker died is taken over after
+``RAG_INDEX_CLAIM_TIMEOUT`` seconds.
+"""
+import logging
+import os
+import queue
+import threading
+from datetime import timedelta
+from typing import List, Optional, Set
+
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import rag
+from .models import AIInteraction
+
+logger = logging.getLogger(__name__)
+
+# "background" (default) or "sync" (index inside the request, as before)
+RAG_INDEXING_MODE = os.getenv("RAG_INDEXING_MODE", "background")
+RAG_INDEX_BATCH_SIZE = int(os.getenv("RAG_INDEX_BATCH_SIZE", "100"))
+RAG_INDEX_CLAIM_TIMEOUT = int(os.getenv("RAG_INDEX_CLAIM_TIMEOUT", "600"))
+
+_queue: "queue.Queue[int]" = queue.Queue()
+_pending: Set[int] = set()
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def enqueue(user_id: int) -> None:
+    """Schedule indexing of the user's (UserProfile.id) unindexed interactions."""
+    if RAG_INDEXING_MODE == "sync":
+        drain_user(user_id)
+        return
+    with _lock:
+        if user_id in _pending:
+            return  # Already queued; that run will pick up the new row as well
+        _pending.add(user_id)
+    _ensure_worker()
+    _queue.put(user_id)
+
+
+def _ensure_worker() -> None:
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="rag-indexer", daemon=True)
+            _thread.start()
+
+
+def _run() -> None:
+    while True:
+        user_id = _queue.get()
+        with _lock:
+            # Cleared before draining so rows saved meanwhile queue another pass
+            _pending.discard(user_id)
+        try:
+            drain_user(user_id)
+        except Exception:
+            logger.exception("RAG indexing failed for user %s; rows stay in the outbox", user_id)
+        finally:
+            close_old_connections()
+
+
+def _claim(user_id: int, batch_size: int) -> List[AIInteraction]:
+    """Claim the next batch of the user's unindexed rows; the row locks end with this call."""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            AIInteraction.objects.select_for_update(skip_locked=True)
+            .filter(user_id=user_id, is_indexed=False)
+            .filter(Q(index_claimed_at__isnull=True) | Q(index_claimed_at__lt=now - timedelta(seconds=RAG_INDEX_CLAIM_TIMEOUT)))
+            .order_by('id')[:batch_size]
+        )
+        if batch:
+            AIInteraction.objects.filter(id__in=[i.id for i in batch]).update(index_claimed_at=now)
+    return batch
+
+
+def drain_user(user_id: int, batch_size: int = RAG_INDEX_BATCH_SIZE) -> int:
+    """Index all unindexed interactions of one user; returns how many were indexed.
+
+    Each batch is claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several worker
+    processes never index the same row twice.
+    """
+    indexed = 0
+    while True:
+        batch = _claim(user_id, batch_size)
+        if not batch:
+            return indexed
+        ids = [i.id for i in batch]
+        try:
+            rag.add_interactions(user_id, [(i.message, i.response, i.id) for i in batch])
+        except Exception:
+            AIInteraction.objects.filter(id__in=ids).update(index_claimed_at=None)
+            raise
+        AIInteraction.objects.filter(id__in=ids).update(is_indexed=True, index_claimed_at=None)
+        indexed += len(batch)
+
+
+def drain_all(batch_size: int = RAG_INDEX_BATCH_SIZE) -> int:
+    """Index every pending interaction, user by user."""
+    user_ids = (
+        AIInteraction.objects.filter(is_indexed=False)
+        .values_list('user_id', flat=True)
+        .distinct()
+        .order_by('user_id')
+    )
+    return sum(drain_user(user_id, batch_size) for user_id in list(user_ids))
@@ -0,0 +1,161 @@
+"""Per-user ISO-week and month aggregates of DailyIntake totals (IntakeRollup).
+
+Long-range reports read one row per week or month instead of every logged day. A meal
+change adds its delta to the week and month rows of its day with the same kind of
+``F()`` UPDATE that maintains DailyIntake (``intake_totals.apply_delta`` calls
+``apply_delta`` here); a new DailyIntake is counted in with ``add_day``. Moving or
+deleting a DailyIntake recomputes the affected periods from their days (at most 31
+rows), and ``rebuild`` regenerates rollups from scratch (migration backfill,
+``check_intake_totals --rollups``).
+"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import DailyIntake, IntakeRollup
+
+PERIODS = ('week', 'month')
+TOTAL_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+_TRUNC = {'week': TruncWeek, 'month': TruncMonth}
+
+
+def period_start(period: str, day: date) -> date:
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(period: str, start: date) -> date:
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def periods_back(granularity: str, day: date, count: int) -> date:
+    """First day of the ``count``-long run of days/weeks/months ending with the one containing ``day``."""
+    if granularity == 'day':
+        return day - timedelta(days=count - 1)
+    start = period_start(granularity, day)
+    for _ in range(count - 1):
+        start = period_start(granularity, start - timedelta(days=1))
+    return start
+
+
+def apply_delta(user_id: int, day: date, delta: Dict[str, float]) -> None:
+    """Add a DailyIntake delta to the week and month rollups of ``day``.
+
+    A missing rollup is left alone: DailyIntake creation (``refresh``) and the backfill
+    create them, and creating one here could race a cascading account delete.
+    """
+    if not any(delta.values()):
+        return
+    now = timezone.now()
+    for period in PERIODS:
+        IntakeRollup.objects.filter(
+            user_id=user_id, period=period, period_start=period_start(period, day)
+        ).update(
+            updated_at=now,
+            **{f'total_{f}': Greatest(F(f'total_{f}') + delta[f], Value(0.0)) for f in TOTAL_FIELDS},
+        )
+
+
+def _aggregates() -> Dict[str, object]:
+    totals = {f'total_{f}': Coalesce(Sum(f'total_{f}'), Value(0.0)) for f in TOTAL_FIELDS}
+    return {'days_logged': Count('id'), **totals}
+
+
+def add_day(daily_intake: DailyIntake) -> None:
+    """Count a newly created DailyIntake into its rollups (``refresh`` creates new periods)."""
+    for period in PERIODS:
+        updated = IntakeRollup.objects.filter(
+            user_id=daily_intake.user_id, period=period, period_start=period_start(period, daily_intake.date)
+        ).update(
+            days_logged=F('days_logged') + 1,
+            updated_at=timezone.now(),
+            **{f'total_{f}': F(f'total_{f}') + (getattr(daily_intake, f'total_{f}') or 0.0) for f in TOTAL_FIELDS},
+        )
+        if not updated:
+            refresh(daily_intake.user_id, daily_intake.date, periods=(period,))
+
+
+def refresh(user_id: int, day: date, periods=PERIODS) -> None:
+    """Recompute the week and month containing ``day`` from the user's DailyIntake rows."""
+    for period in periods:
+        start = period_start(period, day)
+        totals = DailyIntake.objects.filter(
+            user_id=user_id, date__gte=start, date__lt=next_period(period, start)
+        ).aggregate(**_aggregates())
+        rollups = IntakeRollup.objects.filter(user_id=user_id, period=period, period_start=start)
+        if not totals['days_logged']:
+            rollups.delete()
+        else:
+            IntakeRollup.objects.update_or_create(
+                user_id=user_id, period=period, period_start=start, defaults=totals
+            )
+
+
+def rebuild(user_ids: Optional[Iterable[int]] = None) -> int:
+    """Regenerate rollups of ``user_ids`` (ids or a values queryset; None means everyone).
+
+    One grouped query per period, then one delete and a bulk insert.
+    """
+    intakes = DailyIntake.objects.order_by()
+    existing = IntakeRollup.objects.all()
+    if user_ids is not None:
+        intakes = intakes.filter(user_id__in=user_ids)
+        existing = existing.filter(user_id__in=user_ids)
+
+    rows = []
+    for period in PERIODS:
+        grouped = (
+            intakes.annotate(start=_TRUNC[period]('date'))
+            .values('user_id', 'start')
+            .annotate(**_aggregates())
+        )
+        for row in grouped:
+            rows.append(IntakeRollup(period=period, period_start=row.pop('start'), **row))
+    with transaction.atomic():
+        existing.delete()
+        IntakeRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def report(user_profile, granularity: str, start: date, end: date) -> List[Dict[str, object]]:
+    """Totals per day/week/month between ``start`` and ``end`` (inclusive).
+
+    Week and month series read IntakeRollup only; whole periods touching the range are
+    returned, so ``start`` is effectively snapped to its period start.
+    """
+    if granularity == 'day':
+        rows = (
+            DailyIntake.objects.filter(user=user_profile, date__gte=start, date__lte=end)
+            .order_by('date')
+            .values('date', *(f'total_{f}' for f in TOTAL_FIELDS))
+        )
+        return [
+            {'period_start': row['date'], 'days_logged': 1, **{f: row[f'total_{f}'] for f in TOTAL_FIELDS}}
+            for row in rows
+        ]
+
+    rows = (
+        IntakeRollup.objects.filter(
+            user=user_profile,
+            period=granularity,
+            period_start__gte=period_start(granularity, start),
+            period_start__lte=end,
+        )
+        .order_by('period_start')
+        .values('period_start', 'days_logged', *(f'total_{f}' for f in TOTAL_FIELDS))
+    )
+    return [
+        {
+            'period_start': row['period_start'],
+            'days_logged': row['days_logged'],
+            **{f: row[f'total_{f}'] for f in TOTAL_FIELDS},
+        }
+        for row in rows
+    ]
@@ -0,0 +1,202 @@
+"""Background processing of uploaded label images (upload, then poll).
+
+``enqueue_upload`` stores the downscaled image under ``SCAN_UPLOAD_DIR`` plus a queued
+ScannedFood (``is_processed=False``, ``process_after=now``) and returns immediately; the
+request never waits for the vision model. Worker threads claim due rows in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED`` and push ``process_after`` forward by
+``SCAN_LEASE_SECONDS``, so a row whose worker died becomes due again. The lease is the
+``process_after`` value itself: right before each row's vision call it is renewed (and
+the attempt counted) only if it is still the value this worker set, and the result is
+written only under that same lease. A row another worker re-claimed while the batch was
+slow is skipped instead of being paid for twice or overwritten. Transient model
+failures are retried ``SCAN_MAX_ATTEMPTS`` times.
+
+With ``SCAN_PROCESSING_MODE=external`` web processes only enqueue and
+``manage.py process_scans --loop`` does the work.
+"""
+import logging
+import os
+import threading
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import List
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import label_cache, llm_gateway, vision
+from .models import ScannedFood
+
+logger = logging.getLogger(__name__)
+
+# "background" (worker threads in each web process), "sync" (inside the request) or "external"
+SCAN_PROCESSING_MODE = os.getenv("SCAN_PROCESSING_MODE", "background")
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "4"))
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "8"))
+SCAN_LEASE_SECONDS = int(os.getenv("SCAN_LEASE_SECONDS", "120"))
+SCAN_MAX_ATTEMPTS = int(os.getenv("SCAN_MAX_ATTEMPTS", "3"))
+SCAN_RETRY_DELAY = int(os.getenv("SCAN_RETRY_DELAY", "30"))
+SCAN_UPLOAD_DIR = os.getenv("SCAN_UPLOAD_DIR")
+
+_RESULT_FIELDS = ["food_name", "calories", "nutrition_data", "is_processed", "process_after", "processing_error"]
+_EXTENSIONS = {"image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+_MIME_TYPES = {"png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+
+_wakeup = threading.Event()
+_lock = threading.Lock()
+_threads: List[threading.Thread] = []
+
+
+def _storage() -> FileSystemStorage:
+    return FileSystemStorage(location=SCAN_UPLOAD_DIR or Path(settings.BASE_DIR) / "media" / "scans")
+
+
+def enqueue_upload(user_profile, upload) -> ScannedFood:
+    """Store the (downscaled) image and a queued ScannedFood; processing happens later."""
+    digest, image_bytes, mime_type, phash = vision.prepare_label_image(upload)
+    name = _storage().save(f"{uuid.uuid4().hex}.{_EXTENSIONS.get(mime_type, 'jpg')}", ContentFile(image_bytes))
+    return ScannedFood.objects.create(
+        user=user_profile,
+        food_name="",
+        image_path=name,
+        content_hash=digest,
+        perceptual_hash=phash,
+        process_after=timezone.now(),
+    )
+
+
+def wake() -> None:
+    """Signal that new rows are queued."""
+    if SCAN_PROCESSING_MODE == "sync":
+        process_due()
+        return
+    if SCAN_PROCESSING_MODE != "background":
+        return
+    _ensure_workers()
+    _wakeup.set()
+
+
+def _ensure_workers() -> None:
+    with _lock:
+        _threads[:] = [t for t in _threads if t.is_alive()]
+        while len(_threads) < SCAN_WORKERS:
+            thread = threading.Thread(target=_run, name=f"scan-worker-{len(_threads)}", daemon=True)
+            thread.start()
+            _threads.append(thread)
+
+
+def _run() -> None:
+    while True:
+        try:
+            process_due()
+        except Exception:
+            logger.exception("Scan processing failed; claimed rows become due again after the lease")
+        finally:
+            close_old_connections()
+        # Wake on new uploads, or after the retry delay to pick up rows scheduled for a retry
+        _wakeup.wait(timeout=max(SCAN_RETRY_DELAY, 1))
+        _wakeup.clear()
+
+
+def claim_batch(batch_size: int = SCAN_BATCH_SIZE) -> List[ScannedFood]:
+    """Lease up to ``batch_size`` due rows to the caller (``row.process_after`` is the lease)."""
+    now = timezone.now()
+    lease = now + timedelta(seconds=SCAN_LEASE_SECONDS)
+    with transaction.atomic():
+        batch = list(
+            ScannedFood.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("user")
+            .filter(is_processed=False, process_after__lte=now)
+            .order_by("process_after", "id")[:batch_size]
+        )
+        if batch:
+            ScannedFood.objects.filter(id__in=[row.id for row in batch]).update(process_after=lease)
+    for row in batch:
+        row.process_after = lease
+    return batch
+
+
+def _start(row: ScannedFood) -> bool:
+    """Renew the lease for this row's call and count the attempt; False if the lease was lost."""
+    lease = timezone.now() + timedelta(seconds=SCAN_LEASE_SECONDS)
+    renewed = ScannedFood.objects.filter(id=row.id, process_after=row.process_after).update(
+        process_after=lease, attempts=F("attempts") + 1
+    )
+    if renewed:
+        row.process_after = lease
+        row.attempts += 1
+    return bool(renewed)
+
+
+def _save(row: ScannedFood, lease) -> bool:
+    """Write the row's result only if this worker still holds ``lease``."""
+    fields = {field: getattr(row, field) for field in _RESULT_FIELDS}
+    return bool(ScannedFood.objects.filter(id=row.id, process_after=lease).update(**fields))
+
+
+def _fill(row: ScannedFood, result) -> None:
+    row.food_name = result.get("food_name") or "Bilinmeyen Besin"
+    row.calories = result.get("calories")
+    row.nutrition_data = result
+    row.is_processed = True
+    row.process_after = None
+    row.processing_error = None
+
+
+def _fail(row: ScannedFood, error: str, retry: bool) -> None:
+    row.processing_error = error
+    if retry and row.attempts < SCAN_MAX_ATTEMPTS:
+        row.process_after = timezone.now() + timedelta(seconds=SCAN_RETRY_DELAY * row.attempts)
+    else:
+        row.is_processed = True
+        row.process_after = None
+
+
+def _read_image(row: ScannedFood):
+    with _storage().open(row.image_path, "rb") as f:
+        data = f.read()
+    return data, _MIME_TYPES.get(row.image_path.rsplit(".", 1)[-1], "image/jpeg")
+
+
+def process_batch(batch: List[ScannedFood]) -> None:
+    """Process claimed rows one by one, each under a freshly renewed lease.
+
+    Rows are saved as they finish, so a slow batch never holds finished results back
+    until a later row's lease has run out.
+    """
+    hit_ids = []
+    for row in batch:
+        if not _start(row):
+            continue  # Lease ran out while earlier rows were processed; another worker has it
+        lease = row.process_after
+        cached = None
+        try:
+            cached = label_cache.find(row.content_hash, row.perceptual_hash, row.user)
+            if cached is not None:
+                _fill(row, cached.nutrition_data)
+            else:
+                _fill(row, vision.extract_label(*_read_image(row)))
+        except llm_gateway.LLMGatewayError as e:
+            _fail(row, f"AI Hatası: {e.body}", retry=True)
+        except Exception as e:
+            # Unreadable image or unusable model reply: retrying will not help
+            _fail(row, str(e), retry=False)
+        if _save(row, lease) and cached is not None:
+            hit_ids.append(cached.id)
+    label_cache.count_hits(hit_ids)
+
+
+def process_due(batch_size: int = SCAN_BATCH_SIZE) -> int:
+    """Process due rows batch by batch until none are left; returns how many were handled."""
+    processed = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return processed
+        process_batch(batch)
+        processed += len(batch)
@@ -134,7 +134,7 @@ class MealSerializer(serializers.ModelSerializer):
     class Meta:
         model = Meal
         fields = '__all__'
-        read_only_fields = ('calories', 'created_at')
+        read_only_fields = ('calories', 'protein', 'carbs', 'fat', 'created_at')
 
 
 class DailyIntakeSerializer(serializers.ModelSerializer):
@@ -172,16 +172,24 @@ class AIInteractionSerializer(serializers.ModelSerializer):
     class Meta:
         model = AIInteraction
         fields = '__all__'
-        read_only_fields = ('user', 'created_at')
+        read_only_fields = ('user', 'is_indexed', 'index_claimed_at', 'created_at')
 
 
 class ScannedFoodSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.user.username', read_only=True)
+    status = serializers.CharField(source='processing_status', read_only=True)
     
     class Meta:
         model = ScannedFood
         fields = '__all__'
-        read_only_fields = ('user', 'created_at')
+        # nutrition_data/is_processed sadece sunucu tarafından yazılır: etiket önbelleği
+        # (label_cache) bu satırları diğer kullanıcılara da sunar. image_path'i kuyruk
+        # worker'ı diskten okur; istemci başka bir dosyayı gösteremesin.
+        read_only_fields = (
+            'user', 'created_at', 'content_hash', 'perceptual_hash', 'hit_count',
+            'process_after', 'attempts', 'processing_error', 'nutrition_data', 'is_processed',
+            'image_path',
+        )
 
 
 # Özel Serializers
@@ -279,19 +287,34 @@ class CustomPlanWithFoodsSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('user', 'created_at', 'updated_at')
     
+    # Liste/detay sorgusu toplamları veritabanında hesaplayıp plan üzerine ekler
+    # (bkz. views.custom_plans_with_foods); yeni oluşturulan planlarda Python'da toplanır.
     def get_total_calories(self, obj):
+        if hasattr(obj, 'total_calories'):
+            return obj.total_calories
         return sum(food.food.calories * food.quantity for food in obj.plan_foods.all())
     
     def get_total_protein(self, obj):
+        if hasattr(obj, 'total_protein'):
+            return obj.total_protein
         return sum(food.food.protein * food.quantity for food in obj.plan_foods.all() if food.food.protein)
     
     def get_total_carbs(self, obj):
+        if hasattr(obj, 'total_carbs'):
+            return obj.total_carbs
         return sum(food.food.carbs * food.quantity for food in obj.plan_foods.all() if food.food.carbs)
     
     def get_total_fat(self, obj):
+        if hasattr(obj, 'total_fat'):
+            return obj.total_fat
         return sum(food.food.fat * food.quantity for food in obj.plan_foods.all() if food.food.fat)
 
 
+class CustomPlanSummarySerializer(CustomPlanWithFoodsSerializer):
+    """Plan listesi için kompakt görünüm: plan_foods olmadan, sadece plan ve toplamları"""
+    plan_foods = None
+
+
 # Plan Önerisi Serializers
 class PlanRecommendationSerializer(serializers.Serializer):
     """Plan önerisi için"""
@@ -1,3 +1,415 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import label_cache, llm_cache, llm_gateway, scan_queue, views, vision
+from .fake_llm import start_fake_llm_server
+from .models import AIInteraction, CustomPlan, CustomPlanFood, DailyIntake, Food, Meal, ScannedFood
+from .pagination import CreatedAtCursorPagination
+
+
+class ListEndpointQueryCountTests(APITestCase):
+    """
+    Liste/detay endpoint'lerinin sorgu sayısı gün, öğün ve plan sayısıyla artmamalı
+    (N+1 regresyon testi). Bütçe: profil + ana sorgu + tek prefetch.
+    """
+    QUERY_BUDGET = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sorgu', 'sorgu@example.com', 'test12345')
+        cls.foods = [
+            Food.objects.create(name=f'Yemek {i}', calories=100 + i, protein=5, carbs=10, fat=2)
+            for i in range(4)
+        ]
+
+    def get_within_budget(self, url):
+        # Her istekte taze kullanıcı: request.user.profile önbelleği istekler arasında taşınmasın
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def add_days(self, count, meals_per_day):
+        profile = self.user.profile
+        start = date(2025, 1, 1) + timedelta(days=DailyIntake.objects.filter(user=profile).count())
+        intakes = []
+        for offset in range(count):
+            intake = DailyIntake.objects.create(user=profile, date=start + timedelta(days=offset))
+            for i in range(meals_per_day):
+                Meal.objects.create(daily_intake=intake, food=self.foods[i % len(self.foods)], quantity=1, meal_time='lunch')
+            intakes.append(intake)
+        return intakes
+
+    def add_plans(self, count, foods_per_plan):
+        plans = []
+        for _ in range(count):
+            plan = CustomPlan.objects.create(user=self.user.profile, name='Plan')
+            for i in range(foods_per_plan):
+                CustomPlanFood.objects.create(custom_plan=plan, food=self.foods[i % len(self.foods)], quantity=2, order=i)
+            plans.append(plan)
+        return plans
+
+    def test_daily_intake_list(self):
+        self.add_days(1, 1)
+        self.get_within_budget('/api/daily-intakes/')
+
+        self.add_days(5, 4)
+        response = self.get_within_budget('/api/daily-intakes/')
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(len(response.data['results'][0]['meals']), 4)
+        self.assertEqual({meal['food_name'] for meal in response.data['results'][0]['meals']}, {food.name for food in self.foods})
+        self.assertEqual(response.data['results'][0]['user_username'], 'sorgu')
+
+    def test_daily_intake_detail(self):
+        intake = self.add_days(1, 6)[0]
+        response = self.get_within_budget(f'/api/daily-intakes/{intake.pk}/')
+        self.assertEqual(len(response.data['meals']), 6)
+
+    def test_meal_list(self):
+        self.add_days(1, 1)
+        self.get_within_budget('/api/meals/?date=2025-01-01')
+
+        intake = DailyIntake.objects.get(user=self.user.profile, date=date(2025, 1, 1))
+        for food in self.foods:
+            Meal.objects.create(daily_intake=intake, food=food, quantity=1, meal_time='dinner')
+        response = self.get_within_budget('/api/meals/?date=2025-01-01')
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_custom_plan_list(self):
+        self.add_plans(1, 1)
+        self.get_within_budget('/api/custom-plans/')
+
+        self.add_plans(4, 5)
+        response = self.get_within_budget('/api/custom-plans/')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['total_calories'], sum(2 * self.foods[i % 4].calories for i in range(5)))
+        self.assertEqual(response.data['results'][0]['total_protein'], 5 * 2 * 5)
+
+    def test_custom_plan_list_compact(self):
+        self.add_plans(2, 3)
+        CustomPlan.objects.create(user=self.user.profile, name='Boş plan')
+        # Kompakt listede plan_foods prefetch'i yok: profil + plan sorgusu
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/custom-plans/?compact=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertNotIn('plan_foods', response.data['results'][0])
+        totals = {plan['name']: plan['total_calories'] for plan in response.data['results']}
+        self.assertEqual(totals['Boş plan'], 0)
+        self.assertEqual(totals['Plan'], sum(2 * self.foods[i].calories for i in range(3)))
+
+    def test_custom_plan_detail(self):
+        plan = self.add_plans(1, 6)[0]
+        response = self.get_within_budget(f'/api/custom-plans/{plan.pk}/')
+        self.assertEqual(len(response.data['plan_foods']), 6)
+
+
+class CursorPaginationTests(APITestCase):
+    """Liste endpoint'leri cursor ile sayfalanır: araya yeni kayıt girse de sayfalar kaymaz."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sayfa', 'sayfa@example.com', 'test12345')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def add_interactions(self, count):
+        AIInteraction.objects.bulk_create(
+            AIInteraction(user=self.user.profile, message=f'Soru {i}', response='Cevap') for i in range(count)
+        )
+
+    def pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_pages_follow_created_at(self):
+        self.add_interactions(7)
+        response = self.client.get('/api/ai-interactions/?page_size=3')
+        self.assertEqual(set(response.data), {'next', 'previous', 'results'})
+        self.assertEqual(len(response.data['results']), 3)
+        expected = list(AIInteraction.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.pages('/api/ai-interactions/?page_size=3'), expected)
+
+    def test_insert_between_pages_does_not_shift(self):
+        self.add_interactions(4)
+        first = self.client.get('/api/ai-interactions/?page_size=2')
+        self.add_interactions(3)
+        rest = self.pages(first.data['next'])
+        seen = [item['id'] for item in first.data['results']] + rest
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), 4)
+
+    def test_page_size_is_capped(self):
+        self.add_interactions(3)
+        with mock.patch.object(CreatedAtCursorPagination, 'max_page_size', 2):
+            response = self.client.get('/api/ai-interactions/?page_size=100000')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_food_ordering_param(self):
+        for i, calories in enumerate([300, 100, 200, 100]):
+            Food.objects.create(name=f'Besin {i}', calories=calories)
+        names = [item['name'] for item in self.client.get('/api/foods/?ordering=calories&page_size=2').data['results']]
+        self.assertEqual(names, ['Besin 1', 'Besin 3'])
+        calories = []
+        url = '/api/foods/?ordering=-calories&page_size=1'
+        while url:
+            response = self.client.get(url)
+            calories.extend(item['calories'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(calories, [300, 200, 100, 100])
+
+    def test_food_ordering_pages_across_null_protein(self):
+        # Boş protein 0 sayılır; page_size=1 ile her NULL'dan sonraki sayfa da kurulabilmeli
+        foods = [Food.objects.create(name=f'Besin {i}', calories=100, protein=protein)
+                 for i, protein in enumerate([None, 12, None, 3, 12])]
+        for ordering, expected in [('protein', [0, 2, 3, 1, 4]), ('-protein', [4, 1, 3, 2, 0])]:
+            ids = self.pages(f'/api/foods/?ordering={ordering}&page_size=1')
+            self.assertEqual(ids, [foods[i].id for i in expected])
+
+
+class ResolveAIFoodsTests(APITestCase):
+    """AI kalemleri Türkçe İ/I/ı/i içerse de bulunan ya da oluşturulan yemekle eşleşir."""
+
+    def test_turkish_names_resolve(self):
+        incir = Food.objects.create(name='İncir', calories=74)
+        kalemler = [
+            {'name': name, 'calories': 100, 'protein': 1, 'carbs': 10, 'fat': 1}
+            for name in ('İncir', 'Irmik', 'Ispanak')
+        ]
+        foods = views.resolve_ai_foods(kalemler)
+        self.assertEqual(foods[views.food_name_key('İncir')], incir)
+        for kalem in kalemler:
+            self.assertIn(views.food_name_key(kalem['name']), foods)
+        self.assertEqual(Food.objects.count(), 3)
+
+    def test_duplicate_new_food_prefers_known_calories(self):
+        kalemler = [
+            {'name': 'Mercimek Çorbası', 'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0},
+            {'name': 'Mercimek Çorbası', 'calories': 180, 'protein': 9, 'carbs': 25, 'fat': 5},
+            {'name': 'Mercimek Çorbası', 'calories': 150, 'protein': 8, 'carbs': 20, 'fat': 4},
+        ]
+        food = views.resolve_ai_foods(kalemler)[views.food_name_key('Mercimek Çorbası')]
+        self.assertEqual((food.calories, food.protein), (180, 9))
+        self.assertEqual(Food.objects.get().calories, 180)
+
+    def test_key_ignores_turkish_case(self):
+        # Veritabanının iexact'i bu yazımları eşleştirebilir; anahtar da eşleştirmeli
+        self.assertEqual({views.food_name_key(name) for name in ('İNCİR', 'İncir', 'incir', 'Incir', 'ıncır')}, {'incir'})
+
+
+class DashboardStatsTests(APITestCase):
+    """Dashboard önbellekten sunulsa da pasif kullanıcıya kapalıdır."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('pano', 'pano@example.com', 'test12345')
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_not_modified_and_inactive_user(self):
+        first = self.client.get('/api/auth/dashboard/')
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(1):
+            cached = self.client.get('/api/auth/dashboard/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get('/api/auth/dashboard/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 401)
+
+
+class FakeLLMChatTests(APITestCase):
+    """ai-chat sahte LLM sunucusuna karşı: akış parçaları, yanıt önbelleği, zaman aşımı ve devre kesici."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sohbet', 'sohbet@example.com', 'test12345')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        llm_cache.clear()
+        self.patch(views, 'OPENROUTER_KEY', 'x')
+        self.patch(views, 'OPENROUTER_MODEL', 'fake')
+        self.patch(views, 'rag_search', lambda *args, **kwargs: [])
+        self.patch(views.rag_indexer, 'enqueue', lambda user_id: None)
+        self.patch(llm_gateway, 'LLM_MAX_RETRIES', 0)
+        self.patch(llm_gateway, 'LLM_BREAKER_FAILURES', 2)
+        patcher = mock.patch.dict(llm_gateway._breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def patch(self, target, name, value):
+        patcher = mock.patch.object(target, name, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_server(self, **options):
+        server, url = start_fake_llm_server(**options)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.patch(llm_gateway, 'OPENROUTER_URL', url)
+        return server
+
+    def chat(self, message, **extra):
+        return self.client.post('/api/auth/ai-chat/', {'message': message, **extra}, format='json')
+
+    def sse_events(self, response):
+        events = []
+        for block in b''.join(response.streaming_content).decode('utf-8').strip().split('\n\n'):
+            lines = block.split('\n')
+            event = lines[0].removeprefix('event: ') if len(lines) > 1 else 'message'
+            events.append((event, json.loads(lines[-1].removeprefix('data: '))))
+        return events
+
+    def test_stream_sends_chunks(self):
+        self.start_server()
+        response = self.chat('Bugün 1 elma yedim', stream=True)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.sse_events(response)
+        deltas = [data['delta'] for event, data in events if event == 'message']
+        self.assertGreater(len(deltas), 1)
+        reply = ''.join(deltas)
+        self.assertEqual(reply, 'Not aldım: Bugün 1 elma yedim 🍎')
+        self.assertEqual(events[-1], ('done', {'message': 'Bugün 1 elma yedim', 'response': reply}))
+        self.assertEqual(AIInteraction.objects.get(user=self.user.profile).response, reply)
+
+    def test_cache_hit_and_miss(self):
+        server = self.start_server()
+        first = self.chat('Bugün 1 elma yedim')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(self.chat('Akşam ne yiyebilirim?')['X-Cache'], 'MISS')
+        # Araya başka turlar girse de tek başına anlamlı soru tekrarında model çağrılmaz
+        again = self.chat('bugün 1 ELMA yedim!')
+        self.assertEqual(again['X-Cache'], 'HIT')
+        self.assertEqual(again.data['response'], first.data['response'])
+        self.assertEqual(server.calls, 2)
+        # Devam mesajı son turlara bağlı: aynı "evet" farklı sohbet durumunda modele gider
+        self.assertEqual(self.chat('Evet')['X-Cache'], 'MISS')
+        self.assertEqual(self.chat('Evet')['X-Cache'], 'MISS')
+        self.assertEqual(server.calls, 4)
+        self.assertEqual(AIInteraction.objects.filter(user=self.user.profile).count(), 5)
+
+    def test_async_history_and_rag_overlap(self):
+        self.start_server()
+        rag_started = threading.Event()
+        overlapped = []
+
+        def slow_rag(*args, **kwargs):
+            rag_started.set()
+            time.sleep(0.2)
+            return []
+
+        def lookup(*args, **kwargs):
+            # RAG, geçmiş yüklenip önbelleğe bakılırken çoktan başlamış olmalı
+            overlapped.append(rag_started.wait(timeout=1))
+            return None
+
+        self.patch(views, 'rag_search', slow_rag)
+        self.patch(llm_cache, 'lookup', lookup)
+        token = AccessToken.for_user(self.user)
+        response = self.client.post(
+            '/api/auth/ai-chat/async/', {'message': 'Bugün 1 elma yedim'},
+            content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(overlapped, [True])
+
+    def test_breaker_opens_after_failures(self):
+        server = self.start_server(status=503)
+        for _ in range(2):
+            self.assertEqual(self.chat('Merhaba').status_code, 502)
+        self.assertEqual(server.calls, 2)
+        response = self.chat('Merhaba')
+        self.assertEqual(response.status_code, 502)
+        self.assertIn('yanıt vermiyor', response.data['error'])
+        self.assertEqual(server.calls, 2)
+
+    def test_read_timeout_is_not_retried(self):
+        server = self.start_server(latency=1)
+        self.patch(llm_gateway, 'LLM_MAX_RETRIES', 2)
+        started = time.monotonic()
+        with self.assertRaises(llm_gateway.LLMGatewayError):
+            llm_gateway.chat_completion({'model': 'fake', 'messages': [{'role': 'user', 'content': 'Merhaba'}]}, timeout=0.2)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(server.calls, 1)
+        self.assertEqual(llm_gateway._breaker('fake').failures, 1)
+
+
+class ScanQueueLeaseTests(APITestCase):
+    """Yavaş bir toplu işte süresi dolup başka worker'a geçen satır ikinci kez işlenmez ve üzerine yazılmaz."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('tarama', 'tarama@example.com', 'test12345')
+        self.rows = [
+            ScannedFood.objects.create(
+                user=self.user.profile, food_name='', image_path=f'{i}.jpg', content_hash=f'h{i}',
+                process_after=timezone.now(),
+            )
+            for i in range(3)
+        ]
+        for target, name, value in [
+            (scan_queue, '_read_image', lambda row: (b'', 'image/jpeg')),
+            (label_cache, 'find', lambda *args: None),
+        ]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reclaimed_row_is_skipped(self):
+        calls = []
+
+        def extract_label(data, mime_type):
+            calls.append(mime_type)
+            if len(calls) == 1:
+                # İlk çağrı uzarken son satırın kilidi dolar, başka bir worker onu alıp işler
+                ScannedFood.objects.filter(id=self.rows[2].id).update(process_after=timezone.now() - timedelta(seconds=1))
+                other = scan_queue.claim_batch()
+                self.assertEqual([row.id for row in other], [self.rows[2].id])
+                scan_queue.process_batch(other)
+            return {'food_name': f'Ürün {len(calls)}', 'calories': 10}
+
+        with mock.patch.object(vision, 'extract_label', extract_label):
+            scan_queue.process_batch(scan_queue.claim_batch())
+        self.assertEqual(len(calls), 3)
+        rows = ScannedFood.objects.filter(id__in=[row.id for row in self.rows]).order_by('id')
+        self.assertEqual([(row.is_processed, row.attempts) for row in rows], [(True, 1)] * 3)
+        self.assertEqual(rows[2].food_name, 'Ürün 2')
+
+    def test_result_needs_the_lease(self):
+        def extract_label(data, mime_type):
+            ScannedFood.objects.filter(id=self.rows[0].id).update(
+                process_after=timezone.now() + timedelta(hours=1), food_name='Başka worker'
+            )
+            return {'food_name': 'Geç kalan', 'calories': 10}
+
+        with mock.patch.object(vision, 'extract_label', extract_label):
+            scan_queue.process_batch(scan_queue.claim_batch(batch_size=1))
+        self.rows[0].refresh_from_db()
+        self.assertEqual(self.rows[0].food_name, 'Başka worker')
+        self.assertFalse(self.rows[0].is_processed)
+
+    def test_image_path_is_read_only(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(
+            f'/api/auth/scanned-foods/{self.rows[0].id}/', {'image_path': '../../diet_backend/settings.py'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.rows[0].refresh_from_db()
+        self.assertEqual(self.rows[0].image_path, '0.jpg')
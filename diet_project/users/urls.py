@@ -8,6 +8,9 @@ from .views import (
     UserLogoutView,
     UserProfileView,
     analyze_food_image,
+    analyze_food_images,
+    upload_scanned_foods,
+    scanned_food_events,
     user_info,
     change_password,
     create_meal_from_ai,
@@ -24,12 +27,15 @@ from .views import (
     AIInteractionListView,
     AIInteractionDetailView,
     ai_chat,
+    ai_chat_async,
+    ai_chat_cache_stats,
     ai_chat_history,
     ai_chat_messages,
     ScannedFoodListView,
     ScannedFoodDetailView,
     dashboard_stats,
     weekly_report,
+    intake_report,
     add_meal_to_daily_intake
    
 )
@@ -53,6 +59,7 @@ urlpatterns = [
     # Dashboard ve raporlar
     path('dashboard/', dashboard_stats, name='dashboard_stats'),
     path('weekly-report/', weekly_report, name='weekly_report'),
+    path('reports/', intake_report, name='intake_report'),
     
     # Food endpoints
     path('foods/', FoodListView.as_view(), name='food_list'),
@@ -75,11 +82,16 @@ urlpatterns = [
     path('ai-interactions/', AIInteractionListView.as_view(), name='ai_interaction_list'),
     path('ai-interactions/<int:pk>/', AIInteractionDetailView.as_view(), name='ai_interaction_detail'),
     path('ai-chat/', ai_chat, name='ai_chat'),
+    path('ai-chat/async/', ai_chat_async, name='ai_chat_async'),
+    path('ai-chat/cache-stats/', ai_chat_cache_stats, name='ai_chat_cache_stats'),
     path('ai-chat/history/', ai_chat_history, name='ai_chat_history'),
     path('ai-chat/messages/<str:chat_id>/', ai_chat_messages, name='ai_chat_messages'),
     path('ai-meal-add/', create_meal_from_ai, name='create_meal_from_ai'),
     # ScannedFood endpoints
     path('scanned-foods/', ScannedFoodListView.as_view(), name='scanned_food_list'),
+    path('scanned-foods/upload/', upload_scanned_foods, name='scanned_food_upload'),
     path('scanned-foods/<int:pk>/', ScannedFoodDetailView.as_view(), name='scanned_food_detail'),
+    path('scanned-foods/<int:pk>/events/', scanned_food_events, name='scanned_food_events'),
     path('analyze-food-image/', analyze_food_image, name='analyze-food-image'),
+    path('analyze-food-images/', analyze_food_images, name='analyze-food-images'),
 ]
@@ -1,6 +1,8 @@
 import os
 import re
-import requests
+import json
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 
@@ -11,13 +13,20 @@ from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from django.db.models import Q, Sum, F
+from django.db import transaction
+from django.db.models import Prefetch, Q, Sum, F, Value
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from asgiref.sync import sync_to_async
 
-import base64
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.views.decorators.csrf import csrf_exempt
 
@@ -36,6 +45,7 @@ from .serializers import (
     MealSerializer,
     DailyIntakeSerializer,
     CustomPlanWithFoodsSerializer,
+    CustomPlanSummarySerializer,
     CustomPlanFoodSerializer,
     CustomPlanFoodCreateSerializer,
     AIInteractionSerializer,
@@ -45,12 +55,23 @@ from .serializers import (
 )
 
 # RAG Importları
-from .rag import search as rag_search, build_context_from_history as rag_build_ctx, add_interaction as rag_add
+from .rag import search as rag_search, build_context_from_history as rag_build_ctx
+from . import rag_indexer
+from . import llm_gateway
+from . import llm_cache
+from . import label_cache
+from . import vision
+from . import scan_queue
+from . import intake_totals
+from . import rollups
+from . import dashboard
 
 # Ortam Değişkenleri
 load_dotenv() 
 OPENROUTER_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL")
+# Devam mesajlarında önbellek anahtarına katılan son tur sayısı
+CHAT_CACHE_FOLLOW_UP_TURNS = int(os.getenv("CHAT_CACHE_FOLLOW_UP_TURNS", "2"))
 
 # --- YARDIMCI FONKSİYONLAR ---
 
@@ -74,6 +95,163 @@ def clean_number(value):
     except ValueError:
         return 0.0
 
+
+def build_chat_messages(user_profile, message, history, rag_items):
+    """
+    ai_chat için OpenRouter mesaj listesini kurar (sistem promptu, RAG geçmişi,
+    son 5 konuşma ve yeni mesaj). Sync ve async chat view'ları ortak kullanır.
+    """
+    rag_context = rag_build_ctx(rag_items, limit_chars=800)
+    system_prompt = (
+        "Sen samimi, bilgili ve motive edici bir diyetisyensin (Prona AI). "
+        "Kullanıcıyla konuşurken emojiler kullan ve kısa cevaplar ver.\n\n"
+        f"Kullanıcı Özeti: {user_profile.age} yaş, Hedef: {user_profile.get_goal_display()}, "
+        f"Günlük Limit: {user_profile.daily_calorie_need} kcal.\n\n"
+        "ÖNEMLİ GÖREV: Eğer kullanıcı bir şey yediğini söylerse:\n"
+        "1. Yenen yiyecekleri ayır ve her birini ayrı ayrı analiz et.\n"
+        "2. Tahmini kalorilerini ve makrolarını hesapla.\n"
+        "3. Veriyi MUTLAKA bir JSON LİSTESİ [...] formatında döndür.\n"
+        "---DATA_START---"
+        "["
+        "  {"
+        '    "food_name": "Yemeğin Adı", '
+        '    "calories": 120.5, '
+        '    "protein": 10, '
+        '    "carbs": 15, '
+        '    "fat": 5, '
+        '    "meal_time": "snack" '
+        "  }"
+        "]"
+        "---DATA_END---"
+        "\nNot: Tek bir yemek bile olsa köşeli parantez [...] içinde liste olarak gönder. "
+        "meal_time alanı için saati tahmin et: 'breakfast', 'lunch', 'dinner' veya 'snack' yaz."
+    )
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if rag_context:
+        messages.append({"role": "system", "content": f"Geçmiş:\n{rag_context}"})
+    for h in history[-5:]:
+        messages.append({"role": "user", "content": h.message[:200]})
+        messages.append({"role": "assistant", "content": h.response[:300]})
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def chat_payload(messages, stream=False):
+    payload = {"model": OPENROUTER_MODEL, "messages": messages, "max_tokens": 300, "temperature": 0.7}
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+# Önceki tura dayanan mesajların ilk kelimeleri ("evet", "peki ya akşam?", "bunu nasıl pişiririm")
+FOLLOW_UP_WORDS = {
+    'evet', 'hayır', 'tamam', 'olur', 'peki', 'ya', 'o', 'bu', 'şu', 'onu', 'bunu', 'şunu', 'onun',
+    'bunun', 'ona', 'buna', 'neden', 'niye', 'ayrıca', 'başka', 'mesela', 'yani', 'hani', 'ama',
+    'fakat', 've', 'sonra', 'daha',
+}
+
+
+def is_follow_up(message):
+    """Kısa yanıtlar (en fazla iki kelime) ve zamir/bağlaçla başlayan mesajlar önceki tura dayanır."""
+    words = llm_cache.normalize_prompt(message).split()
+    return len(words) <= 2 or words[0] in FOLLOW_UP_WORDS
+
+
+def chat_cache_context(user_profile, message, history):
+    """
+    Yanıt önbelleğinin kapsamı: sistem promptundaki profil alanları. Tek başına anlamlı
+    sorular turdan tura aynı kapsamda kalır, böylece tekrar sorulduğunda isabet eder;
+    devam mesajlarına son CHAT_CACHE_FOLLOW_UP_TURNS turun id'leri de eklenir, "evet"
+    gibi bir yanıt başka bir sohbetin yanıtıyla cevaplanmaz.
+    """
+    context = f"{OPENROUTER_MODEL}|{user_profile.age}|{user_profile.goal}|{user_profile.daily_calorie_need}"
+    if is_follow_up(message):
+        turns = ",".join(str(h.id) for h in history[-CHAT_CACHE_FOLLOW_UP_TURNS:])
+        context = f"{context}|{turns}"
+    return context
+
+
+def wants_stream(data):
+    return str(data.get('stream', '')).lower() in ('1', 'true', 'yes')
+
+
+# OpenRouter SSE akışının bittiğini bildiren işaret
+SSE_DONE = object()
+
+
+def parse_sse_line(line):
+    """
+    OpenRouter'ın SSE satırından içerik parçasını çıkarır.
+    Yorum/boş satırlarda None, 'data: [DONE]' satırında SSE_DONE döner.
+    """
+    if not line or not line.startswith('data:'):
+        return None
+    data = line[5:].strip()
+    if data == '[DONE]':
+        return SSE_DONE
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return None
+    choices = chunk.get('choices') or [{}]
+    return (choices[0].get('delta') or {}).get('content') or None
+
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx'in akışı tamponlamasını engelle
+    return response
+
+
+def stream_chat_events(user_profile, message, interaction_type, messages, cached_reply=None, cache_context=''):
+    """
+    Model yanıtını parça parça SSE olarak iletir; akış bitince tam yanıtı
+    AIInteraction olarak kaydeder, RAG indekslemesini kuyruğa alır ve 'done' olayı gönderir.
+    cached_reply verilirse (yanıt önbelleği) model çağrılmaz, yanıt tek parça gönderilir.
+    """
+    parts = []
+    if cached_reply is not None:
+        parts.append(cached_reply)
+        yield sse_event({'delta': cached_reply})
+    elif not OPENROUTER_KEY or not OPENROUTER_MODEL:
+        parts.append("AI yapılandırması eksik.")
+        yield sse_event({'delta': parts[0]})
+    else:
+        try:
+            with llm_gateway.stream_chat_completion(chat_payload(messages, stream=True)) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    delta = parse_sse_line(line)
+                    if delta is SSE_DONE:
+                        break
+                    if delta:
+                        parts.append(delta)
+                        yield sse_event({'delta': delta})
+        except llm_gateway.LLMGatewayError as e:
+            yield sse_event({'error': e.body}, event='error')
+            return
+        except Exception as e:
+            yield sse_event({'error': str(e)}, event='error')
+            return
+        llm_cache.store(user_profile.id, interaction_type, message, "".join(parts), cache_context)
+
+    ai_reply = "".join(parts)
+    AIInteraction.objects.create(
+        user=user_profile, message=message, response=ai_reply, interaction_type=interaction_type
+    )
+    try:
+        rag_indexer.enqueue(user_profile.id)
+    except Exception:
+        pass
+    yield sse_event({'message': message, 'response': ai_reply}, event='done')
+
+
 # --- VIEWS ---
 
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -167,7 +345,10 @@ def user_info(request):
 def delete_account(request):
     try:
         user = request.user
+        profile_id = getattr(getattr(user, 'profile', None), 'id', None)
         user.delete()
+        if profile_id is not None:
+            llm_cache.invalidate_user(profile_id)
         return Response({'message': 'Hesap başarıyla silindi.'}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': f'Hesap silinirken hata oluştu: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -241,12 +422,22 @@ class FoodListView(generics.ListAPIView):
         if category:
             queryset = queryset.filter(category=category)
         # (Diğer filtreler buraya eklenebilir, kısalttım)
-        
-        ordering = self.request.query_params.get('ordering', 'name')
-        if ordering in ['name', '-name', 'calories', '-calories', 'protein', '-protein']:
-            queryset = queryset.order_by(ordering)
+        if self.ordering_param.lstrip('-') == 'protein':
+            # protein boş olabilir; cursor NULL konumdan sonraki sayfayı kuramaz, boşlar 0 sayılır
+            queryset = queryset.annotate(protein_sort=Coalesce('protein', Value(0.0)))
         return queryset
 
+    @property
+    def ordering_param(self):
+        ordering = self.request.query_params.get('ordering', 'name')
+        return ordering if ordering.lstrip('-') in ('name', 'calories', 'protein') else 'name'
+
+    @property
+    def cursor_ordering(self):
+        # Sıralama sayfalayıcıda uygulanır; cursor ilk alandan, eşitlikte id'den ilerler
+        ordering = self.ordering_param.replace('protein', 'protein_sort')
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
+
 
 class FoodDetailView(generics.RetrieveAPIView):
     serializer_class = FoodSerializer
@@ -254,14 +445,51 @@ class FoodDetailView(generics.RetrieveAPIView):
     queryset = Food.objects.all()
 
 
+def daily_intakes_with_meals(user_profile):
+    """
+    DailyIntakeSerializer için: kullanıcı adı join ile, öğünler ve yemekleri tek
+    prefetch sorgusuyla gelir (gün/öğün sayısından bağımsız sabit sorgu sayısı).
+    """
+    return (
+        DailyIntake.objects.filter(user=user_profile)
+        .select_related('user__user')
+        .prefetch_related(Prefetch('meals', queryset=Meal.objects.select_related('food')))
+    )
+
+
+def custom_plans_with_foods(user_profile, with_foods=True):
+    """
+    CustomPlanWithFoodsSerializer için: toplam kalori/makrolar plan sorgusunda tek bir
+    SUM/GROUP BY ile hesaplanır (plan yemekleri Python'a yüklenmeden); with_foods ise
+    plan yemekleri ve Food kayıtları tek prefetch sorgusunda gelir.
+    """
+    plans = (
+        CustomPlan.objects.filter(user=user_profile)
+        .select_related('user__user')
+        .annotate(**{
+            f'total_{field}': Coalesce(Sum(F(f'plan_foods__food__{field}') * F('plan_foods__quantity')), Value(0.0))
+            for field in ('calories', 'protein', 'carbs', 'fat')
+        })
+        .order_by('-created_at')  # GROUP BY sorgularında Meta.ordering uygulanmaz
+    )
+    if with_foods:
+        plans = plans.prefetch_related(Prefetch('plan_foods', queryset=CustomPlanFood.objects.select_related('food')))
+    return plans
+
+
+def wants_compact(params):
+    return str(params.get('compact', '')).lower() in ('1', 'true', 'yes')
+
+
 class DailyIntakeListView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = ('-date',)  # kullanıcı başına tarih benzersiz
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return DailyIntakeCreateSerializer
         return DailyIntakeSerializer
     def get_queryset(self):
-        return DailyIntake.objects.filter(user=self.request.user.profile)
+        return daily_intakes_with_meals(self.request.user.profile)
     def perform_create(self, serializer):
         serializer.save(user=self.request.user.profile)
 
@@ -270,7 +498,7 @@ class DailyIntakeDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DailyIntakeSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return DailyIntake.objects.filter(user=self.request.user.profile)
+        return daily_intakes_with_meals(self.request.user.profile)
 
 
 class MealListView(generics.ListCreateAPIView):
@@ -291,7 +519,7 @@ class MealListView(generics.ListCreateAPIView):
         
         daily_intake = DailyIntake.objects.filter(user=user_profile, date=date_obj).first()
         if daily_intake:
-            return Meal.objects.filter(daily_intake=daily_intake)
+            return Meal.objects.filter(daily_intake=daily_intake).select_related('food')
         return Meal.objects.none()
     
     def perform_create(self, serializer):
@@ -309,14 +537,18 @@ class MealDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MealSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return Meal.objects.filter(daily_intake__user=self.request.user.profile)
+        return Meal.objects.filter(daily_intake__user=self.request.user.profile).select_related('food')
 
 
 class CustomPlanListView(generics.ListCreateAPIView):
-    serializer_class = CustomPlanWithFoodsSerializer
+    """?compact=1 ile plan_foods olmadan sadece planlar ve toplamları döner"""
     permission_classes = [permissions.IsAuthenticated]
+    def compact(self):
+        return self.request.method == 'GET' and wants_compact(self.request.query_params)
+    def get_serializer_class(self):
+        return CustomPlanSummarySerializer if self.compact() else CustomPlanWithFoodsSerializer
     def get_queryset(self):
-        return CustomPlan.objects.filter(user=self.request.user.profile)
+        return custom_plans_with_foods(self.request.user.profile, with_foods=not self.compact())
     def perform_create(self, serializer):
         serializer.save(user=self.request.user.profile)
 
@@ -325,14 +557,14 @@ class CustomPlanDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CustomPlanWithFoodsSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return CustomPlan.objects.filter(user=self.request.user.profile)
+        return custom_plans_with_foods(self.request.user.profile)
 
 
 class AIInteractionListView(generics.ListCreateAPIView):
     serializer_class = AIInteractionSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return AIInteraction.objects.filter(user=self.request.user.profile)
+        return AIInteraction.objects.filter(user=self.request.user.profile).select_related('user__user')
     def perform_create(self, serializer):
         serializer.save(user=self.request.user.profile)
 
@@ -414,78 +646,213 @@ def ai_chat(request):
     history = AIInteraction.objects.filter(user=user_profile).order_by('-created_at')[:10]
     history = list(reversed(history))
 
-    # RAG
-    rag_items = []
+    # Aynı sohbet durumunda aynı (veya çok benzer) mesaj yanıtlandıysa RAG ve OpenRouter atlanır
+    cache_context = chat_cache_context(user_profile, message, history)
+    cached_reply = llm_cache.lookup(user_profile.id, interaction_type, message, cache_context)
+    cache_status = 'HIT' if cached_reply is not None else 'MISS'
+
+    messages = None
+    if cached_reply is None:
+        # RAG
+        rag_items = []
+        try:
+            rag_items = rag_search(user_profile.id, message, k=5)
+        except Exception:
+            pass
+        messages = build_chat_messages(user_profile, message, history, rag_items)
+
+    # "stream": true ile yanıt SSE olarak token token gönderilir. Senkron generator'ı Django
+    # ASGI altında tamponlar; orada gerçek akış yalnızca ai-chat/async/ yolundadır.
+    if wants_stream(request.data):
+        response = sse_response(
+            stream_chat_events(user_profile, message, interaction_type, messages, cached_reply, cache_context)
+        )
+        response['X-Cache'] = cache_status
+        return response
+
+    ai_reply = cached_reply
+    if ai_reply is None:
+        try:
+            if not OPENROUTER_KEY or not OPENROUTER_MODEL:
+                ai_reply = "AI yapılandırması eksik."
+            else:
+                response_json = llm_gateway.chat_completion(chat_payload(messages), timeout=20)
+                ai_reply = response_json["choices"][0]["message"]["content"]
+                llm_cache.store(user_profile.id, interaction_type, message, ai_reply, cache_context)
+        except llm_gateway.LLMGatewayError as e:
+            return Response({'error': e.body}, status=status.HTTP_502_BAD_GATEWAY)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+
+    AIInteraction.objects.create(
+        user=user_profile, message=message, response=ai_reply or "", interaction_type=interaction_type
+    )
+    # RAG indekslemesi yanıttan sonra arka planda yapılır (bkz. rag_indexer)
     try:
-        rag_items = rag_search(user_profile.id, message, k=5)
+        rag_indexer.enqueue(user_profile.id)
     except Exception:
         pass
-    rag_context = rag_build_ctx(rag_items, limit_chars=800)
-    system_prompt = (
-        "Sen samimi, bilgili ve motive edici bir diyetisyensin (Prona AI). "
-        "Kullanıcıyla konuşurken emojiler kullan ve kısa cevaplar ver.\n\n"
-        f"Kullanıcı Özeti: {user_profile.age} yaş, Hedef: {user_profile.get_goal_display()}, "
-        f"Günlük Limit: {user_profile.daily_calorie_need} kcal.\n\n"
-        "ÖNEMLİ GÖREV: Eğer kullanıcı bir şey yediğini söylerse:\n"
-        "1. Yenen yiyecekleri ayır ve her birini ayrı ayrı analiz et.\n"
-        "2. Tahmini kalorilerini ve makrolarını hesapla.\n"
-        "3. Veriyi MUTLAKA bir JSON LİSTESİ [...] formatında döndür.\n"
-        "---DATA_START---"
-        "["
-        "  {"
-        '    "food_name": "Yemeğin Adı", '
-        '    "calories": 120.5, '
-        '    "protein": 10, '
-        '    "carbs": 15, '
-        '    "fat": 5, '
-        '    "meal_time": "snack" '
-        "  }"
-        "]"
-        "---DATA_END---"
-        "\nNot: Tek bir yemek bile olsa köşeli parantez [...] içinde liste olarak gönder. "
-        "meal_time alanı için saati tahmin et: 'breakfast', 'lunch', 'dinner' veya 'snack' yaz."
+
+    return Response({'message': message, 'response': ai_reply}, status=status.HTTP_200_OK, headers={'X-Cache': cache_status})
+
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def ai_chat_cache_stats(request):
+    """Yanıt önbelleğinin bu süreçteki sayaçları ve isabet oranı (sadece admin)."""
+    return Response(llm_cache.stats(), status=status.HTTP_200_OK)
+
+# --- ASYNC AI CHAT (ASGI) ---
+
+def _authenticate_jwt(request):
+    """DRF dışındaki (async) view'lar için JWT doğrulaması. Geçersizse None döner."""
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+def _json_response(data, status_code=200):
+    return JsonResponse(data, status=status_code, json_dumps_params={'ensure_ascii': False})
+
+
+async def astream_chat_events(user_profile, message, interaction_type, messages, cached_reply=None, cache_context=''):
+    """stream_chat_events'in async karşılığı (ai_chat_async için)."""
+    parts = []
+    if cached_reply is not None:
+        parts.append(cached_reply)
+        yield sse_event({'delta': cached_reply})
+    elif not OPENROUTER_KEY or not OPENROUTER_MODEL:
+        parts.append("AI yapılandırması eksik.")
+        yield sse_event({'delta': parts[0]})
+    else:
+        try:
+            async with llm_gateway.astream_chat_completion(chat_payload(messages, stream=True)) as response:
+                async for line in response.aiter_lines():
+                    delta = parse_sse_line(line)
+                    if delta is SSE_DONE:
+                        break
+                    if delta:
+                        parts.append(delta)
+                        yield sse_event({'delta': delta})
+        except llm_gateway.LLMGatewayError as e:
+            yield sse_event({'error': e.body}, event='error')
+            return
+        except Exception as e:
+            yield sse_event({'error': str(e)}, event='error')
+            return
+        await asyncio.to_thread(llm_cache.store, user_profile.id, interaction_type, message, "".join(parts), cache_context)
+
+    ai_reply = "".join(parts)
+    await AIInteraction.objects.acreate(
+        user=user_profile, message=message, response=ai_reply, interaction_type=interaction_type
     )
+    try:
+        await sync_to_async(rag_indexer.enqueue)(user_profile.id)
+    except Exception:
+        pass
+    yield sse_event({'message': message, 'response': ai_reply}, event='done')
 
-    messages = [{"role": "system", "content": system_prompt}]
-    if rag_context:
-        messages.append({"role": "system", "content": f"Geçmiş:\n{rag_context}"})
-    for h in history[-5:]:
-        messages.append({"role": "user", "content": h.message[:200]})
-        messages.append({"role": "assistant", "content": h.response[:300]})
-    messages.append({"role": "user", "content": message})
 
-    ai_reply = None
+@csrf_exempt
+async def ai_chat_async(request):
+    """
+    ai_chat'in ASGI sürümü. Geçmiş sorgusu ile RAG araması aynı anda çalışır ve
+    OpenRouter çağrısı async HTTP client ile yapılır; bekleme sırasında worker
+    başka sohbetlere hizmet verebilir.
+    """
+    if request.method != 'POST':
+        return _json_response({'error': 'Sadece POST desteklenir.'}, 405)
+
+    user = await sync_to_async(_authenticate_jwt)(request)
+    if user is None:
+        return _json_response({'detail': 'Kimlik doğrulama bilgileri geçersiz veya eksik.'}, 401)
     try:
-        if not OPENROUTER_KEY or not OPENROUTER_MODEL:
-            ai_reply = "AI yapılandırması eksik."
-        else:
-            url = "https://openrouter.ai/api/v1/chat/completions"
-            headers = {"Authorization": f"Bearer {OPENROUTER_KEY}", "Content-Type": "application/json"}
-            payload = {"model": OPENROUTER_MODEL, "messages": messages, "max_tokens": 300, "temperature": 0.7}
-            response = requests.post(url, headers=headers, json=payload, timeout=20)
-            if response.status_code == 200:
-                ai_reply = response.json()["choices"][0]["message"]["content"]
-            else:
-                return Response({'error': response.text}, status=status.HTTP_502_BAD_GATEWAY)
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        user_profile = await UserProfile.objects.aget(user=user)
+    except UserProfile.DoesNotExist:
+        return _json_response({'error': 'Kullanıcının profili yok.'}, 400)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return _json_response({'error': 'Geçersiz JSON.'}, 400)
+    message = data.get('message')
+    interaction_type = data.get('interaction_type', 'general')
+    if not message:
+        return _json_response({'error': 'message gereklidir.'}, 400)
+
+    async def load_history():
+        recent = AIInteraction.objects.filter(user=user_profile).order_by('-created_at')[:10]
+        return list(reversed([h async for h in recent]))
+
+    async def load_rag():
+        try:
+            return await asyncio.to_thread(rag_search, user_profile.id, message, 5)
+        except Exception:
+            return []
 
-    saved = AIInteraction.objects.create(
+    # Geçmiş sorgusu ile RAG araması eşzamanlı; RAG önbellek kontrolü sürerken de devam
+    # eder, isabet olursa sonucu beklenmez.
+    rag_task = asyncio.create_task(load_rag())
+    try:
+        history = await load_history()
+        # Anlamsal önbellek katmanı embedding hesaplayabilir: event loop'u bloklamasın
+        cache_context = chat_cache_context(user_profile, message, history)
+        cached_reply = await asyncio.to_thread(
+            llm_cache.lookup, user_profile.id, interaction_type, message, cache_context
+        )
+    except BaseException:
+        rag_task.cancel()
+        raise
+    cache_status = 'HIT' if cached_reply is not None else 'MISS'
+
+    messages = None
+    if cached_reply is None:
+        messages = build_chat_messages(user_profile, message, history, await rag_task)
+    else:
+        rag_task.cancel()
+
+    if wants_stream(data):
+        response = sse_response(
+            astream_chat_events(user_profile, message, interaction_type, messages, cached_reply, cache_context)
+        )
+        response['X-Cache'] = cache_status
+        return response
+
+    if cached_reply is not None:
+        ai_reply = cached_reply
+    elif not OPENROUTER_KEY or not OPENROUTER_MODEL:
+        ai_reply = "AI yapılandırması eksik."
+    else:
+        try:
+            response_json = await llm_gateway.achat_completion(chat_payload(messages))
+        except llm_gateway.LLMGatewayError as e:
+            return _json_response({'error': e.body}, 502)
+        except Exception as e:
+            return _json_response({'error': str(e)}, 502)
+        ai_reply = response_json["choices"][0]["message"]["content"]
+        await asyncio.to_thread(llm_cache.store, user_profile.id, interaction_type, message, ai_reply, cache_context)
+
+    await AIInteraction.objects.acreate(
         user=user_profile, message=message, response=ai_reply or "", interaction_type=interaction_type
     )
     try:
-        rag_add(user_profile.id, message, ai_reply or "", message_id=saved.id)
+        await sync_to_async(rag_indexer.enqueue)(user_profile.id)
     except Exception:
         pass
 
-    return Response({'message': message, 'response': ai_reply}, status=status.HTTP_200_OK)
+    response = _json_response({'message': message, 'response': ai_reply})
+    response['X-Cache'] = cache_status
+    return response
 
 
 # ScannedFood Views (Basitleştirildi)
 class ScannedFoodListView(generics.ListCreateAPIView):
     serializer_class = ScannedFoodSerializer
     permission_classes = [permissions.IsAuthenticated]
-    def get_queryset(self): return ScannedFood.objects.filter(user=self.request.user.profile)
+    def get_queryset(self): return ScannedFood.objects.filter(user=self.request.user.profile).select_related('user__user')
     def perform_create(self, serializer): serializer.save(user=self.request.user.profile)
 
 class ScannedFoodDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -494,22 +861,100 @@ class ScannedFoodDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self): return ScannedFood.objects.filter(user=self.request.user.profile)
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def upload_scanned_foods(request):
+    """
+    Etiket görsellerini (multipart: image veya images) kuyruğa alır ve hemen 202 döner.
+    Analiz arka planda yapılır (bkz. scan_queue); sonuç /scanned-foods/<id>/ ile
+    sorgulanabilir veya /scanned-foods/<id>/events/ ile SSE olarak beklenebilir.
+    """
+    files = request.FILES.getlist('images') or request.FILES.getlist('image')
+    if not files:
+        return Response({'error': 'Resim yüklenmedi.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(files) > LABEL_BATCH_MAX_IMAGES:
+        return Response({'error': f'En fazla {LABEL_BATCH_MAX_IMAGES} resim gönderilebilir.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        user_profile = request.user.profile
+    except UserProfile.DoesNotExist:
+        return Response({'error': 'Kullanıcının profili yok.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        rows = [scan_queue.enqueue_upload(user_profile, f) for f in files]
+    except Exception as e:
+        return Response({'error': f'Resim işlenemedi: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+    scan_queue.wake()
+
+    for row in rows:
+        row.refresh_from_db()  # sync modunda sonuç zaten yazılmış olabilir
+    return Response({'scans': ScannedFoodSerializer(rows, many=True).data}, status=status.HTTP_202_ACCEPTED)
+
+
+SCAN_EVENTS_TIMEOUT = int(os.getenv("SCAN_EVENTS_TIMEOUT", "120"))
+
+
+@csrf_exempt
+async def scanned_food_events(request, pk):
+    """
+    Kuyruktaki taramanın durumunu SSE ile bildirir: durum değiştikçe 'status',
+    işlem bitince 'done' olayı gönderip kapanır. ASGI altında bekleme worker tutmaz.
+    """
+    user = await sync_to_async(_authenticate_jwt)(request)
+    if user is None:
+        return _json_response({'detail': 'Kimlik doğrulama bilgileri geçersiz veya eksik.'}, 401)
+    scans = ScannedFood.objects.select_related('user__user').filter(pk=pk, user__user=user)
+    if not await scans.aexists():
+        return _json_response({'detail': 'Bulunamadı.'}, 404)
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SCAN_EVENTS_TIMEOUT
+        last_state = None
+        while True:
+            row = await scans.afirst()
+            if row is None:
+                yield sse_event({'detail': 'Bulunamadı.'}, event='error')
+                return
+            if row.is_processed:
+                yield sse_event(ScannedFoodSerializer(row).data, event='done')
+                return
+            state = (row.processing_status, row.attempts)
+            if state != last_state:
+                last_state = state
+                yield sse_event({'id': row.id, 'status': row.processing_status, 'attempts': row.attempts,
+                                 'processing_error': row.processing_error}, event='status')
+            if loop.time() >= deadline:
+                yield sse_event({'id': row.id, 'status': row.processing_status}, event='timeout')
+                return
+            await asyncio.sleep(1)
+
+    return sse_response(events())
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([permissions.IsAuthenticated])
 def dashboard_stats(request):
-    user_profile = request.user.profile
-    user_input = request.data.get("message") if request.method == 'POST' else request.query_params.get("message")
-    
-    today = date.today()
-    today_intake = DailyIntake.objects.filter(user=user_profile, date=today).first()
-    
+    """
+    Dashboard özeti kullanıcı başına önbellekten döner (bkz. users/dashboard.py).
+    Kimlik doğrulama kullanıcıyı okur (pasif hesaplar 401 alır, önbellekten de
+    sunulmaz); If-None-Match ETag ile eşleşirse başka sorgu yapılmadan 304 döner.
+    """
     # (AI Suggestion kısmı burada kısaltıldı, aynı mantık)
-    return Response({
-        "today_calories": today_intake.total_calories if today_intake else 0,
-        "daily_need": user_profile.daily_calorie_need,
-        "bmi": user_profile.bmi,
-        "goal": user_profile.get_goal_display(),
-    }, status=status.HTTP_200_OK)
+    try:
+        payload, etag = dashboard.get_or_build(request.user.id)
+    except UserProfile.DoesNotExist:
+        return Response({'error': 'Profil bulunamadı.'}, status=status.HTTP_404_NOT_FOUND)
+
+    # Zayıf karşılaştırma: gzip yapan proxy'ler ETag'i W/"..." olarak değiştirebilir
+    client_etags = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+    if request.method == 'GET' and etag in client_etags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(payload, status=status.HTTP_200_OK)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @api_view(['GET'])
@@ -533,6 +978,50 @@ def weekly_report(request):
     return Response({'weekly_data': data})
 
 
+# Rapor aralığı verilmezse gösterilen dönem sayısı / günlük raporda izin verilen en uzun aralık
+REPORT_DEFAULT_PERIODS = {'day': 7, 'week': 12, 'month': 12}
+REPORT_MAX_DAYS = 366
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def intake_report(request):
+    """
+    İstenen aralık ve ayrıntı düzeyinde (day/week/month) kalori ve makro toplamları.
+    Haftalık ve aylık seriler IntakeRollup özetlerinden okunur; günler tek tek taranmaz.
+    """
+    user_profile = request.user.profile
+    granularity = request.query_params.get('granularity', 'week')
+    if granularity not in REPORT_DEFAULT_PERIODS:
+        return Response({'error': "granularity 'day', 'week' veya 'month' olmalı."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        end = datetime.strptime(request.query_params['end'], '%Y-%m-%d').date() if request.query_params.get('end') else date.today()
+        if request.query_params.get('start'):
+            start = datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+        else:
+            start = rollups.periods_back(granularity, end, REPORT_DEFAULT_PERIODS[granularity])
+    except ValueError:
+        return Response({'error': 'Tarih formatı YYYY-MM-DD olmalı.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if start > end:
+        return Response({'error': 'start, end tarihinden sonra olamaz.'}, status=status.HTTP_400_BAD_REQUEST)
+    if granularity == 'day' and (end - start).days >= REPORT_MAX_DAYS:
+        return Response({'error': f'Günlük rapor en fazla {REPORT_MAX_DAYS} gün kapsayabilir.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = rollups.report(user_profile, granularity, start, end)
+    total_calories = sum(row['calories'] for row in data)
+    days_logged = sum(row['days_logged'] for row in data)
+    return Response({
+        'granularity': granularity,
+        'start': start if granularity == 'day' else rollups.period_start(granularity, start),
+        'end': end,
+        'data': data,
+        'total_calories': total_calories,
+        'avg_calories': round(total_calories / days_logged, 1) if days_logged else 0,
+    })
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def add_meal_to_daily_intake(request):
@@ -546,9 +1035,10 @@ def add_meal_to_daily_intake(request):
 class CustomPlanFoodListView(generics.ListCreateAPIView):
     serializer_class = CustomPlanFoodSerializer
     permission_classes = [permissions.IsAuthenticated]
+    cursor_ordering = ('order', 'id')
     def get_queryset(self):
         plan_id = self.kwargs.get('plan_id')
-        return CustomPlanFood.objects.filter(custom_plan__id=plan_id, custom_plan__user=self.request.user.profile)
+        return CustomPlanFood.objects.filter(custom_plan__id=plan_id, custom_plan__user=self.request.user.profile).select_related('food')
     def perform_create(self, serializer):
         plan = CustomPlan.objects.get(id=self.kwargs.get('plan_id'), user=self.request.user.profile)
         serializer.save(custom_plan=plan)
@@ -558,7 +1048,7 @@ class CustomPlanFoodDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
         plan_id = self.kwargs.get('plan_id')
-        return CustomPlanFood.objects.filter(custom_plan__id=plan_id, custom_plan__user=self.request.user.profile)
+        return CustomPlanFood.objects.filter(custom_plan__id=plan_id, custom_plan__user=self.request.user.profile).select_related('food')
 
 # --- AI MEAL CREATION (CRITICAL FIX) ---
 from django.db.models import Sum, F
@@ -569,6 +1059,72 @@ from datetime import date, datetime
 from .models import DailyIntake, Food, Meal  # Modellerinin yeri farklıysa burayı düzelt
 # clean_number fonksiyonunun import edildiğini veya tanımlı olduğunu varsayıyorum
 
+def food_name_key(name):
+    """
+    resolve_ai_foods sözlüğünün anahtarı. Veritabanının iexact karşılaştırması ile
+    Python'un lower()'ı Türkçe İ/I/ı/i harflerinde ayrışabilir (ör. 'İ'.lower() iki
+    karakterdir); burada hepsi 'i' sayılır, böylece sorgunun döndürdüğü satır kalemin
+    anahtarıyla eşleşir.
+    """
+    for harf in ('İ', 'I', 'ı'):
+        name = name.replace(harf, 'i')
+    return name.casefold().replace('\u0307', '')
+
+
+def resolve_ai_foods(kalemler):
+    """
+    AI'dan gelen kalemlerin yemeklerini tek sorguda bulur, olmayanları toplu oluşturur.
+    Dönüş: {food_name_key(isim): Food}
+    """
+    foods = {}
+    if not kalemler:
+        return foods
+
+    isim_filtresi = Q()
+    for kalem in kalemler:
+        isim_filtresi |= Q(name__iexact=kalem['name'])
+    for food in Food.objects.filter(isim_filtresi):
+        foods.setdefault(food_name_key(food.name), food)
+
+    eksikler, guncellenecekler = {}, {}
+    for kalem in kalemler:
+        key = food_name_key(kalem['name'])
+        food = foods.get(key)
+        if food is None:
+            # Aynı isim listede birden fazla geçerse kalorisi dolu ilk kalemin değerleri kullanılır
+            yeni = eksikler.get(key)
+            if yeni is not None and (yeni.calories > 0 or kalem['calories'] <= 0):
+                continue
+            eksikler[key] = Food(
+                name=kalem['name'],
+                calories=kalem['calories'],
+                protein=kalem['protein'],
+                carbs=kalem['carbs'],
+                fat=kalem['fat'],
+                category='snack'
+            )
+        elif food.calories == 0 and kalem['calories'] > 0:
+            # Kalorisi boş kaydedilmiş yemeği AI'ın verdiği değerlerle tamamla
+            food.calories = kalem['calories']
+            food.protein = kalem['protein']
+            food.carbs = kalem['carbs']
+            food.fat = kalem['fat']
+            food.updated_at = timezone.now()  # bulk_update auto_now alanını doldurmaz
+            guncellenecekler[key] = food
+
+    if guncellenecekler:
+        Food.objects.bulk_update(guncellenecekler.values(), ['calories', 'protein', 'carbs', 'fat', 'updated_at'])
+    if eksikler:
+        # Eşzamanlı bir istek aynı yemeği oluşturmuş olabilir: çakışanlar atlanır, sonra okunur
+        Food.objects.bulk_create(eksikler.values(), ignore_conflicts=True)
+        eksik_filtresi = Q()
+        for food in eksikler.values():
+            eksik_filtresi |= Q(name__iexact=food.name)
+        for food in Food.objects.filter(eksik_filtresi):
+            foods.setdefault(food_name_key(food.name), food)
+    return foods
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def create_meal_from_ai(request):
@@ -590,13 +1146,6 @@ def create_meal_from_ai(request):
         except ValueError:
             date_obj = date.today()
 
-        # 2. Günlük Raporu (DailyIntake) Hazırla
-        daily_intake, _ = DailyIntake.objects.get_or_create(
-            user=user_profile,
-            date=date_obj,
-            defaults={'total_calories': 0}
-        )
-
         # --- KRİTİK DÜZELTME BAŞLANGICI ---
         # Önce 'foods' listesi var mı diye bakıyoruz
         yemek_listesi = request.data.get('foods', [])
@@ -606,60 +1155,44 @@ def create_meal_from_ai(request):
             yemek_listesi = [request.data]
         # --- KRİTİK DÜZELTME BİTİŞİ ---
 
-        # 3. Döngü (Artık her türlü çalışır)
+        # 2. Listeyi temizle (isimsiz kalemler atlanır)
+        kalemler = []
         for yemek in yemek_listesi:
             isim = yemek.get('food_name', '').strip().title()[:99]
             if not isim: continue 
 
-            calories = clean_number(yemek.get('calories'))
-            protein = clean_number(yemek.get('protein'))
-            carbs = clean_number(yemek.get('carbs'))
-            fat = clean_number(yemek.get('fat'))
             quantity = clean_number(yemek.get('quantity'))
-            
             if quantity <= 0: quantity = 1.0
 
-            food, created_food = Food.objects.get_or_create(
-                name__iexact=isim,
-                defaults={
-                    'name': isim,
-                    'calories': calories,
-                    'protein': protein,
-                    'carbs': carbs,
-                    'fat': fat,
-                    'category': 'snack' 
-                }
-            )
-            
-            if not created_food and food.calories == 0 and calories > 0:
-                food.calories = calories
-                food.protein = protein
-                food.carbs = carbs
-                food.fat = fat
-                food.save()
-
-            Meal.objects.create(
-                daily_intake=daily_intake, 
-                food=food,
-                quantity=quantity,
-                meal_time=meal_time, 
-                notes='AI Chat Önerisi'
-            )
-
-        # 4. Toplamları Hesapla
-        meals_qs = Meal.objects.filter(daily_intake=daily_intake)
-
-        def calc_total(field):
-            total = meals_qs.annotate(
-                val=F(f'food__{field}') * F('quantity')
-            ).aggregate(Sum('val'))['val__sum']
-            return float(total) if total else 0.0
+            kalemler.append({
+                'name': isim,
+                'calories': clean_number(yemek.get('calories')),
+                'protein': clean_number(yemek.get('protein')),
+                'carbs': clean_number(yemek.get('carbs')),
+                'fat': clean_number(yemek.get('fat')),
+                'quantity': quantity,
+            })
 
-        daily_intake.total_calories = calc_total('calories')
-        daily_intake.total_protein = calc_total('protein')
-        daily_intake.total_carbs = calc_total('carbs')
-        daily_intake.total_fat = calc_total('fat')
-        daily_intake.save()
+        # 3. Tek transaction: yemekler tek sorguda, öğünler tek INSERT'te, toplamlar tek UPDATE'te
+        with transaction.atomic():
+            daily_intake, _ = DailyIntake.objects.get_or_create(
+                user=user_profile,
+                date=date_obj,
+                defaults={'total_calories': 0}
+            )
+            foods = resolve_ai_foods(kalemler)
+            intake_totals.add_meals(daily_intake, [
+                Meal(
+                    food=foods[food_name_key(kalem['name'])],
+                    quantity=kalem['quantity'],
+                    meal_time=meal_time, 
+                    notes='AI Chat Önerisi'
+                )
+                for kalem in kalemler
+            ])
+
+        # 4. Güncel toplamları oku
+        daily_intake.refresh_from_db(fields=['total_calories', 'total_protein', 'total_carbs', 'total_fat'])
 
         return Response({
             'message': 'Yemekler başarıyla eklendi.',
@@ -718,7 +1251,7 @@ def add_meal_to_daily_intake(request):
         )
 
         # 4. Öğünü Kaydet
-        meal = Meal.objects.create(
+        Meal.objects.create(
             daily_intake=daily_intake,
             food=food,
             quantity=quantity,
@@ -726,20 +1259,7 @@ def add_meal_to_daily_intake(request):
             notes='Manuel Ekleme'
         )
 
-        # 5. Toplamları Güncelle (Aggregation)
-        meals_qs = Meal.objects.filter(daily_intake=daily_intake)
-
-        def calc_total(field):
-            total = meals_qs.annotate(
-                val=F(f'food__{field}') * F('quantity')
-            ).aggregate(Sum('val'))['val__sum']
-            return float(total) if total else 0.0
-
-        daily_intake.total_calories = calc_total('calories')
-        daily_intake.total_protein = calc_total('protein')
-        daily_intake.total_carbs = calc_total('carbs')
-        daily_intake.total_fat = calc_total('fat')
-        daily_intake.save()
+        # 5. Toplamlar Meal sinyalinde bu öğünün katkısı kadar güncellendi (bkz. intake_totals)
 
         return Response({'message': 'Öğün başarıyla eklendi.'}, status=status.HTTP_201_CREATED)
 
@@ -750,6 +1270,12 @@ def add_meal_to_daily_intake(request):
     
 
 
+# --- BESİN ETİKETİ ANALİZİ ---
+# Toplu taramada aynı anda modele gönderilen en fazla görsel / istek başına görsel sayısı
+LABEL_BATCH_CONCURRENCY = int(os.getenv("LABEL_BATCH_CONCURRENCY", "4"))
+LABEL_BATCH_MAX_IMAGES = int(os.getenv("LABEL_BATCH_MAX_IMAGES", "10"))
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def analyze_food_image(request):
@@ -760,124 +1286,155 @@ def analyze_food_image(request):
     if 'image' not in request.FILES:
         return Response({'error': 'Resim yüklenmedi.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    image_file = request.FILES['image']
-    
-    # 1. Resmi Base64 formatına çevir
+    # 1. Resmi küçült ve yeniden sıkıştır; aynı etiket daha önce tarandıysa
+    # model çağrılmadan önceki sonuç döner
     try:
-        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+        digest, image_bytes, mime_type, phash = vision.prepare_label_image(request.FILES['image'])
     except Exception as e:
         return Response({'error': f'Resim işlenemedi: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # 2. OpenRouter İsteği Hazırla
+    user_profile = UserProfile.objects.filter(user=request.user).first()
+    if user_profile is not None:
+        cached = label_cache.find(digest, phash, user_profile)
+        if cached is not None:
+            scanned = label_cache.record_hit(cached, user_profile, digest, phash)
+            return Response({'status': 'success', 'data': cached.nutrition_data, 'cached': True,
+                             'scanned_food_id': scanned.id}, status=status.HTTP_200_OK)
+
+    # 2. OpenRouter isteği
     if not OPENROUTER_KEY:
         return Response({'error': 'API anahtarı eksik.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://diyetuygulamasi.com", 
-    }
+    try:
+        result = vision.extract_label(image_bytes, mime_type)
+    except llm_gateway.LLMGatewayError as e:
+        return Response({'error': f'AI Hatası: {e.body}'}, status=status.HTTP_502_BAD_GATEWAY)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return Response({'error': f'Sunucu hatası: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    # Model alternatifleri: google/gemini-flash-1.5, openai/gpt-4o-mini, google/gemini-pro-vision
-    model_name = OPENROUTER_MODEL if OPENROUTER_MODEL else "google/gemini-flash-1.5"
-    
-    payload = {
-        "model": model_name,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text", 
-                        "text": (
-                            "Bu resimde bir besin etiketi var. Etiket üzerindeki besin değerlerini oku ve çıkar. "
-                            "Etiket üzerinde genellikle şunlar yazar: "
-                            "- Besin adı (ör: 'Süt', 'Ekmek', 'Yoğurt') "
-                            "- 100 gram veya 100ml için besin değerleri: "
-                            "  * Enerji/Kalori (kcal veya kJ) "
-                            "  * Protein (g) "
-                            "  * Karbonhidrat (g) "
-                            "  * Yağ (g) "
-                            "- Porsiyon bilgisi (ör: 1 porsiyon = 200g) "
-                            "\n"
-                            "Etiket üzerindeki TÜM metinleri oku ve aşağıdaki JSON formatında yanıt ver: "
-                            "{\"food_name\": \"etiket üzerindeki besin adı\", "
-                            "\"calories\": 100 gram için kalori değeri (sadece sayı), "
-                            "\"protein\": 100 gram için protein değeri (sadece sayı, gram cinsinden), "
-                            "\"carbs\": 100 gram için karbonhidrat değeri (sadece sayı, gram cinsinden), "
-                            "\"fat\": 100 gram için yağ değeri (sadece sayı, gram cinsinden), "
-                            "\"serving_size\": \"porsiyon bilgisi varsa (ör: 200g veya 250ml), yoksa null\"} "
-                            "\n"
-                            "ÖNEMLİ: "
-                            "- Sadece etiket üzerinde yazan değerleri kullan, tahmin yapma. "
-                            "- Eğer bir değer etikette yoksa 0 yaz. "
-                            "- Kalori değeri kJ cinsindeyse, kcal'e çevir (1 kcal = 4.184 kJ). "
-                            "- Sadece JSON döndür, başka açıklama yapma. "
-                            "- JSON formatında döndür, markdown kullanma."
-                        )
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "max_tokens": 500,
-        "temperature": 0.1  # Düşük temperature = daha tutarlı sonuçlar
-    }
+    response_data = {'status': 'success', 'data': result, 'cached': False}
+    if user_profile is not None:
+        response_data['scanned_food_id'] = label_cache.store(user_profile, digest, phash, result).id
+    return Response(response_data, status=status.HTTP_200_OK)
 
+
+def label_batch_events(user_profile, files):
+    """
+    Görselleri sınırlı bir havuzda paralel işler ve her sonucu tamamlandığı anda
+    'result' olayı olarak gönderir. Önbellekte olanlar modele gitmez; partide aynı
+    görsel (içerik özeti) birden fazla varsa modele bir kez gider. Her sonuç geldiği
+    anda ScannedFood olarak kaydedilir; istemci akış sırasında koparsa modele gönderilmiş
+    görsellerin sonuçları yine kaydedilir. 'done' olayı her görselin kayıt id'sini
+    (hatalılar için null) içerir.
+    """
+    rows = {}       # index -> kaydedilmiş ScannedFood
+    hashes = {}     # index -> (digest, phash)
+    waiting = {}    # digest -> modeldeki görselin sonucunu bekleyen index'ler
+    hit_ids = []
+    ok_count = cached_count = 0
+
+    def result_event(index, **data):
+        return sse_event(dict(index=index, filename=files[index].name, **data), event='result')
+
+    def save(index, result):
+        digest, phash = hashes[index]
+        rows[index] = label_cache.store(user_profile, digest, phash, result)
+
+    pool = ThreadPoolExecutor(max_workers=LABEL_BATCH_CONCURRENCY)
+    # Önce görseller hazırlanır (küçültme, özetler), ardından önbellekte olmayanlar modele gider
+    pending = {pool.submit(vision.prepare_label_image, f): ('prepare', i) for i, f in enumerate(files)}
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            ai_content = response.json()['choices'][0]['message']['content']
-            
-            # Markdown temizliği (```json ... ``` kısımlarını siler)
-            cleaned_json = ai_content.replace("```json", "").replace("```", "").strip()
-            
-            # Eğer başında/tırında tırnak işareti varsa temizle
-            if cleaned_json.startswith('"'):
-                cleaned_json = cleaned_json[1:]
-            if cleaned_json.endswith('"'):
-                cleaned_json = cleaned_json[:-1]
-            cleaned_json = cleaned_json.strip()
-            
-            import json
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index = pending.pop(future)
+                if stage == 'prepare':
+                    try:
+                        digest, image_bytes, mime_type, phash = future.result()
+                    except Exception as e:
+                        yield result_event(index, status='error', error=f'Resim işlenemedi: {str(e)}')
+                        continue
+                    hashes[index] = (digest, phash)
+                    if digest in waiting:
+                        # Aynı görsel zaten modelde: onun sonucu kullanılır
+                        waiting[digest].append(index)
+                        continue
+                    cached = label_cache.find(digest, phash, user_profile)
+                    if cached is None:
+                        waiting[digest] = [index]
+                        pending[pool.submit(vision.extract_label, image_bytes, mime_type)] = ('vision', index)
+                        continue
+                    hit_ids.append(cached.id)
+                    if cached.user_id == user_profile.id:
+                        rows[index] = cached
+                    else:
+                        save(index, cached.nutrition_data)
+                    ok_count += 1
+                    cached_count += 1
+                    yield result_event(index, status='success', cached=True, data=cached.nutrition_data)
+                    continue
+
+                indexes = waiting.pop(hashes[index][0])
+                try:
+                    value = future.result()
+                except llm_gateway.LLMGatewayError as e:
+                    for i in indexes:
+                        yield result_event(i, status='error', error=f'AI Hatası: {e.body}')
+                    continue
+                except Exception as e:
+                    for i in indexes:
+                        yield result_event(i, status='error', error=str(e))
+                    continue
+                save(index, value)
+                for i in indexes:
+                    rows[i] = rows[index]
+                    ok_count += 1
+                    cached_count += i != index
+                    yield result_event(i, status='success', cached=i != index, data=value)
+    finally:
+        # İstemci koptuysa: hazırlık adımındakiler iptal, modele gitmiş olanların sonucu kaydedilir
+        for future, (stage, index) in pending.items():
+            if stage == 'prepare':
+                future.cancel()
+                continue
             try:
-                data = json.loads(cleaned_json)
-                
-                # Veri doğrulama ve temizleme
-                if not isinstance(data, dict):
-                    return Response({'error': 'Geçersiz veri formatı.'}, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Sayısal değerleri kontrol et ve temizle
-                result = {
-                    'food_name': data.get('food_name', 'Bilinmeyen Besin'),
-                    'calories': float(data.get('calories', 0)) if data.get('calories') else 0,
-                    'protein': float(data.get('protein', 0)) if data.get('protein') else 0,
-                    'carbs': float(data.get('carbs', 0)) if data.get('carbs') else 0,
-                    'fat': float(data.get('fat', 0)) if data.get('fat') else 0,
-                }
-                
-                return Response({'status': 'success', 'data': result}, status=status.HTTP_200_OK)
-            except json.JSONDecodeError as e:
-                return Response({
-                    'error': f'JSON parse hatası: {str(e)}. AI yanıtı: {cleaned_json[:200]}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            error_text = response.text
-            try:
-                error_json = response.json()
-                error_text = str(error_json)
-            except:
+                save(index, future.result())
+            except Exception:
                 pass
-            return Response({'error': f'AI Hatası: {error_text}'}, status=status.HTTP_502_BAD_GATEWAY)
+        pool.shutdown(wait=True)
+        label_cache.count_hits(hit_ids)
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return Response({'error': f'Sunucu hatası: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+    yield sse_event({
+        'total': len(files),
+        'succeeded': ok_count,
+        'cached': cached_count,
+        'failed': len(files) - ok_count,
+        'scanned_food_ids': [rows[i].pk if i in rows else None for i in range(len(files))],
+    }, event='done')
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def analyze_food_images(request):
+    """
+    Birden fazla besin etiketini tek istekte analiz eder (multipart, alan: images).
+    Sonuçlar tamamlandıkça SSE olarak akar.
+    """
+    files = request.FILES.getlist('images')
+    if not files:
+        return Response({'error': 'Resim yüklenmedi.'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(files) > LABEL_BATCH_MAX_IMAGES:
+        return Response({'error': f'En fazla {LABEL_BATCH_MAX_IMAGES} resim gönderilebilir.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not OPENROUTER_KEY:
+        return Response({'error': 'API anahtarı eksik.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    try:
+        user_profile = request.user.profile
+    except UserProfile.DoesNotExist:
+        return Response({'error': 'Kullanıcının profili yok.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return sse_response(label_batch_events(user_profile, files))
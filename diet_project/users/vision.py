@@ -0,0 +1,107 @@
+"""Besin etiketi analizi: görseli hazırlar, vision modeline gönderir ve yanıtı ayrıştırır.
+
+analyze_food_image, toplu tarama ve arka plan kuyruğu (bkz. scan_queue) ortak kullanır.
+"""
+import base64
+import json
+import os
+
+from dotenv import load_dotenv
+
+from . import image_prep, label_cache, llm_gateway
+
+load_dotenv()
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL")
+
+LABEL_EXTRA_HEADERS = {"HTTP-Referer": "https://diyetuygulamasi.com"}
+LABEL_PROMPT = (
+    "Bu resimde bir besin etiketi var. Etiket üzerindeki besin değerlerini oku ve çıkar. "
+    "Etiket üzerinde genellikle şunlar yazar: "
+    "- Besin adı (ör: 'Süt', 'Ekmek', 'Yoğurt') "
+    "- 100 gram veya 100ml için besin değerleri: "
+    "  * Enerji/Kalori (kcal veya kJ) "
+    "  * Protein (g) "
+    "  * Karbonhidrat (g) "
+    "  * Yağ (g) "
+    "- Porsiyon bilgisi (ör: 1 porsiyon = 200g) "
+    "\n"
+    "Etiket üzerindeki TÜM metinleri oku ve aşağıdaki JSON formatında yanıt ver: "
+    "{\"food_name\": \"etiket üzerindeki besin adı\", "
+    "\"calories\": 100 gram için kalori değeri (sadece sayı), "
+    "\"protein\": 100 gram için protein değeri (sadece sayı, gram cinsinden), "
+    "\"carbs\": 100 gram için karbonhidrat değeri (sadece sayı, gram cinsinden), "
+    "\"fat\": 100 gram için yağ değeri (sadece sayı, gram cinsinden), "
+    "\"serving_size\": \"porsiyon bilgisi varsa (ör: 200g veya 250ml), yoksa null\"} "
+    "\n"
+    "ÖNEMLİ: "
+    "- Sadece etiket üzerinde yazan değerleri kullan, tahmin yapma. "
+    "- Eğer bir değer etikette yoksa 0 yaz. "
+    "- Kalori değeri kJ cinsindeyse, kcal'e çevir (1 kcal = 4.184 kJ). "
+    "- Sadece JSON döndür, başka açıklama yapma. "
+    "- JSON formatında döndür, markdown kullanma."
+)
+def label_payload(image_bytes, mime_type):
+    # Model alternatifleri: google/gemini-flash-1.5, openai/gpt-4o-mini, google/gemini-pro-vision
+    model_name = OPENROUTER_MODEL if OPENROUTER_MODEL else "google/gemini-flash-1.5"
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    return {
+        "model": model_name,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": LABEL_PROMPT},
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}},
+                ]
+            }
+        ],
+        "max_tokens": 500,
+        "temperature": 0.1  # Düşük temperature = daha tutarlı sonuçlar
+    }
+
+
+def parse_label_reply(ai_content):
+    """Model yanıtındaki JSON'u besin değerlerine çevirir; geçersizse ValueError fırlatır."""
+    # Markdown temizliği (```json ... ``` kısımlarını siler)
+    cleaned_json = ai_content.replace("```json", "").replace("```", "").strip()
+
+    # Eğer başında/sonunda tırnak işareti varsa temizle
+    if cleaned_json.startswith('"'):
+        cleaned_json = cleaned_json[1:]
+    if cleaned_json.endswith('"'):
+        cleaned_json = cleaned_json[:-1]
+    cleaned_json = cleaned_json.strip()
+
+    try:
+        data = json.loads(cleaned_json)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'JSON parse hatası: {str(e)}. AI yanıtı: {cleaned_json[:200]}')
+
+    # Veri doğrulama ve temizleme
+    if not isinstance(data, dict):
+        raise ValueError('Geçersiz veri formatı.')
+
+    # Sayısal değerleri kontrol et ve temizle
+    return {
+        'food_name': data.get('food_name', 'Bilinmeyen Besin'),
+        'calories': float(data.get('calories', 0)) if data.get('calories') else 0,
+        'protein': float(data.get('protein', 0)) if data.get('protein') else 0,
+        'carbs': float(data.get('carbs', 0)) if data.get('carbs') else 0,
+        'fat': float(data.get('fat', 0)) if data.get('fat') else 0,
+    }
+
+
+def extract_label(image_bytes, mime_type):
+    """Görseli vision modeline gönderir ve etiketteki besin değerlerini döndürür."""
+    response_json = llm_gateway.chat_completion(
+        label_payload(image_bytes, mime_type), timeout=30, extra_headers=LABEL_EXTRA_HEADERS
+    )
+    return parse_label_reply(response_json['choices'][0]['message']['content'])
+
+
+def prepare_label_image(image_file):
+    """(content_hash, küçültülmüş görsel, mime türü, algısal özet) döndürür (bkz. image_prep, label_cache)."""
+    digest = label_cache.content_hash_file(image_file)
+    image_bytes, mime_type, prepared = image_prep.prepare_image(image_file)
+    phash = label_cache.perceptual_hash_image(prepared) if prepared is not None else None
+    return digest, image_bytes, mime_type, phash